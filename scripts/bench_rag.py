@@ -0,0 +1,346 @@
+"""RAG 性能基准 - 合成中文语料上的 build_index / ChromaStore.query / QABot.retrieve（离线模型替身，不需要 Ollama 和网络）"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import main as index_main
+import qa_bot as qa_bot_module
+from chroma_store import ChromaStore
+from fake_backend import FakeAsyncClient, FakeOllamaClient, fake_embedding
+
+# ---------- 合成语料 ----------
+TERMS = [
+    "子宫肌瘤", "宫颈癌", "卵巢囊肿", "细菌性阴道病", "外阴阴道假丝酵母菌病", "滴虫阴道炎",
+    "盆腔炎性疾病", "子宫内膜异位症", "子宫腺肌病", "多囊卵巢综合征", "异常子宫出血",
+    "妊娠期高血压疾病", "妊娠期糖尿病", "前置胎盘", "胎盘早剥", "早产", "异位妊娠",
+    "绝经综合征", "葡萄胎", "子宫脱垂", "宫颈上皮内瘤变", "子宫内膜癌", "卵巢早衰", "痛经",
+]
+ASPECTS = ["病因", "临床表现", "诊断", "鉴别诊断", "治疗", "预防", "并发症", "随访"]
+SYMPTOMS = [
+    "下腹痛", "阴道分泌物增多", "经量增多", "经期延长", "外阴瘙痒", "不规则阴道流血",
+    "腰骶部酸痛", "尿频", "性交痛", "潮热出汗", "乏力", "贫血",
+]
+EXAMS = ["妇科检查", "盆腔超声", "宫颈细胞学检查", "HPV检测", "血常规", "激素水平测定", "阴道镜检查", "宫腔镜检查"]
+TREATMENTS = ["药物治疗", "手术治疗", "期待疗法", "激素治疗", "抗感染治疗", "对症支持治疗"]
+SENTENCES = [
+    "{term}的{aspect}与多种因素有关，常见于{age}岁左右的女性。",
+    "患者可出现{symptom}，部分患者无明显症状，常在体检时发现。",
+    "检查时应注意{exam}，必要时行{exam2}以明确诊断。",
+    "治疗以{treat}为主，疗程一般为{n}周，应根据病情个体化选择。",
+    "若出现{symptom}或{symptom2}，应及时就医，避免延误诊治。",
+    "{term}需与其他原因引起的{symptom}相鉴别，{exam}有助于鉴别。",
+    "研究表明，规范{treat}后约{pct}%的患者症状明显缓解。",
+]
+QUESTIONS = [
+    "{term}的{aspect}是什么？",
+    "{term}有哪些{aspect}？",
+    "出现{symptom}是不是{term}？",
+    "{term}应该做什么检查？",
+    "{term}怎么治疗？",
+]
+
+
+def make_page(rng: random.Random, chars: int) -> str:
+    """生成一页围绕单个疾病的合成教材文本"""
+    term = rng.choice(TERMS)
+    lines = [f"第{rng.randint(1, 30)}节 {term}"]
+    total = 0
+    while total < chars:
+        aspect = rng.choice(ASPECTS)
+        lines.append(f"{rng.choice('一二三四五六七八')}、{aspect}")
+        for _ in range(rng.randint(2, 5)):
+            s = rng.choice(SENTENCES).format(
+                term=term, aspect=aspect, age=rng.randint(20, 55),
+                symptom=rng.choice(SYMPTOMS), symptom2=rng.choice(SYMPTOMS),
+                exam=rng.choice(EXAMS), exam2=rng.choice(EXAMS),
+                treat=rng.choice(TREATMENTS), n=rng.randint(1, 12), pct=rng.randint(40, 95),
+            )
+            lines.append(s)
+            total += len(s)
+    return "\n".join(lines)
+
+
+def make_questions(rng: random.Random, n: int) -> List[str]:
+    return [
+        rng.choice(QUESTIONS).format(term=rng.choice(TERMS), aspect=rng.choice(ASPECTS), symptom=rng.choice(SYMPTOMS))
+        for _ in range(n)
+    ]
+
+
+def write_pdf(path: Path, pages: List[str], fontsize: float = 9) -> None:
+    """用 PyMuPDF 内置简体中文字体写出 PDF（文本可被 get_text 提取）"""
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        rect = page.rect + (50, 50, -50, -50)
+        page.insert_textbox(rect, text, fontsize=fontsize, fontname="china-s")
+    doc.save(str(path))
+    doc.close()
+
+
+def build_corpus(out_dir: Path, books: int, pages: int, chars: int, seed: int) -> List[Path]:
+    """生成 books 本、每本 pages 页的合成 PDF"""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for b in range(books):
+        path = out_dir / f"synthetic_{b:02d}.pdf"
+        write_pdf(path, [make_page(rng, chars) for _ in range(pages)])
+        paths.append(path)
+    return paths
+
+
+# ---------- 计量 ----------
+def peak_rss_mb() -> Dict[str, float]:
+    """进程生命周期内的峰值 RSS（本进程 / 已结束的子进程，如多进程切分）"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOS 单位为字节，Linux 为 KB
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1000
+    total = float(np.sum(seconds))
+    return {
+        "n": len(seconds),
+        "qps": round(len(seconds) / total, 1) if total > 0 else 0.0,
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def use_data_dir(data_dir: Path, splitter: str, hybrid: bool, embed_concurrency: int) -> None:
+    """把 build_index / QABot 读取的路径配置指向临时目录（不碰 data/ 下的真实索引）"""
+    for module in (index_main, qa_bot_module):
+        module.MANIFEST_PATH = data_dir / "index_manifest.json"
+        module.LEXICAL_INDEX_PATH = data_dir / "lexical_index.pkl"
+    index_main.CHROMA_DIR = data_dir / "chroma"
+    index_main.CHECKPOINT_PATH = data_dir / "index_checkpoint.jsonl"
+    index_main.EMBED_CACHE_PATH = None  # 每次都走 embedding，测的是完整构建
+    index_main.SPLITTER_BACKEND = splitter
+    index_main.HYBRID_SEARCH = hybrid
+    index_main.EMBED_CONCURRENCY = embed_concurrency
+
+
+# ---------- 各阶段 ----------
+def bench_build(pdfs: List[Path], args, client, async_client) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    index_main.build_index(pdfs, workers=args.workers, client=client, async_client=async_client)
+    elapsed = time.perf_counter() - t0
+
+    store = ChromaStore(str(index_main.CHROMA_DIR), index_main.COLLECTION_NAME)
+    n_chunks = store.get_collection_info()["count"]
+    n_pages = args.books * args.pages
+
+    # 再跑一次：全部未变化，测清单/哈希检查的开销
+    t1 = time.perf_counter()
+    index_main.build_index(pdfs, workers=args.workers, client=client, async_client=async_client)
+    noop = time.perf_counter() - t1
+
+    return {
+        "seconds": round(elapsed, 3),
+        "pages": n_pages,
+        "chunks": n_chunks,
+        "pages_per_s": round(n_pages / elapsed, 1),
+        "chunks_per_s": round(n_chunks / elapsed, 1),
+        "noop_rebuild_seconds": round(noop, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_query(questions: List[str], args) -> Dict[str, Any]:
+    store = ChromaStore(str(index_main.CHROMA_DIR), index_main.COLLECTION_NAME)
+    vectors = [fake_embedding(q, args.dim) for q in questions]
+    for v in vectors[:args.warmup]:
+        store.query(v, n_results=args.top_k * 2)
+
+    seconds = []
+    for v in vectors:
+        t0 = time.perf_counter()
+        store.query(v, n_results=args.top_k * 2)
+        seconds.append(time.perf_counter() - t0)
+    return {**latency_summary(seconds), "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_retrieve(questions: List[str], args, client) -> Dict[str, Any]:
+    bot = qa_bot_module.QABot(
+        persist_dir=str(index_main.CHROMA_DIR),
+        collection_name=index_main.COLLECTION_NAME,
+        query_cache_size=0,  # 每个问题都走 embedding，测完整检索路径
+        hybrid=args.hybrid,
+        client=client,
+        mmr=args.mmr,
+    )
+    seconds, stages = [], {}
+    # retrieve 每次调用都会打印进度，计时期间丢弃
+    with contextlib.redirect_stdout(io.StringIO()):
+        for q in questions[:args.warmup]:
+            bot.retrieve(q, top_k=args.top_k)
+        for q in questions:
+            timings: Dict[str, float] = {}
+            t0 = time.perf_counter()
+            bot.retrieve(q, top_k=args.top_k, timings=timings)
+            seconds.append(time.perf_counter() - t0)
+            for k, v in timings.items():
+                stages[k] = stages.get(k, 0.0) + v
+    return {
+        **latency_summary(seconds),
+        "stage_mean_ms": {k: round(v / len(questions), 3) for k, v in stages.items() if k.endswith("_ms")},
+        "fetch_rounds_mean": round(stages.get("fetch_rounds", 0) / len(questions), 2),
+        "candidates_mean": round(stages.get("candidates", 0) / len(questions), 1),
+        "context_tokens_mean": round(stages.get("context_tokens", 0) / len(questions), 1),
+        "context_tokens_saved_mean": round(stages.get("context_tokens_saved", 0) / len(questions), 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ---------- 与基线比较 ----------
+# 指标 -> 方向（+1 越大越好，-1 越小越好）
+KEY_METRICS = {
+    "build.pages_per_s": 1,
+    "build.chunks_per_s": 1,
+    "build.noop_rebuild_seconds": -1,
+    "query.qps": 1,
+    "query.p50_ms": -1,
+    "query.p99_ms": -1,
+    "retrieve.qps": 1,
+    "retrieve.p50_ms": -1,
+    "retrieve.p99_ms": -1,
+    "peak_rss_mb": -1,
+}
+
+
+def metric(results: Dict[str, Any], key: str) -> float:
+    if key == "peak_rss_mb":
+        return results["retrieve"]["peak_rss_mb"]["self"]
+    stage, name = key.split(".")
+    return results[stage][name]
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    与基线结果比较
+
+    Returns:
+        超出容差的退化指标说明，空列表表示没有退化
+    """
+    if baseline.get("config") != results["config"]:
+        print("⚠️  Baseline was recorded with different parameters, comparison may be meaningless")
+    regressions = []
+    print(f"\n{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key, direction in KEY_METRICS.items():
+        try:
+            old, new = metric(baseline, key), metric(results, key)
+        except KeyError:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change * direction > tolerance
+        flag = "  ❌" if worse else ""
+        print(f"{key:<28}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{flag}")
+        if worse:
+            regressions.append(f"{key}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def report(results: Dict[str, Any]) -> None:
+    b, q, r = results["build"], results["query"], results["retrieve"]
+    print(f"\n{'='*60}")
+    print("Benchmark results")
+    print(f"{'='*60}")
+    print(f"build_index     {b['seconds']:8.2f}s  {b['pages_per_s']:8.1f} pages/s  "
+          f"{b['chunks_per_s']:8.1f} chunks/s  ({b['chunks']} chunks)")
+    print(f"no-op rebuild   {b['noop_rebuild_seconds']:8.2f}s")
+    for name, s in (("ChromaStore.query", q), ("QABot.retrieve", r)):
+        print(f"{name:<18}{s['qps']:8.1f} qps  p50 {s['p50_ms']:7.2f}ms  p90 {s['p90_ms']:7.2f}ms  "
+              f"p99 {s['p99_ms']:7.2f}ms  max {s['max_ms']:7.2f}ms")
+    print(f"retrieve stages (mean ms): {r['stage_mean_ms']}")
+    print(f"fetch rounds (mean): {r['fetch_rounds_mean']}, candidates (mean): {r['candidates_mean']}")
+    print(f"context tokens (mean): {r['context_tokens_mean']}, saved by packing: {r['context_tokens_saved_mean']}")
+    rss = r["peak_rss_mb"]
+    print(f"peak RSS: {rss['self']} MB (children {rss['children']} MB), "
+          f"after build {b['peak_rss_mb']['self']} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline RAG benchmark with a fake model backend")
+    parser.add_argument("--books", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=100, help="pages per book")
+    parser.add_argument("--chars-per-page", type=int, default=800)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="ingestion processes")
+    parser.add_argument("--splitter", default="rule", help="sentence splitter backend")
+    parser.add_argument("--embed-concurrency", type=int, default=index_main.EMBED_CONCURRENCY)
+    parser.add_argument("--no-hybrid", dest="hybrid", action="store_false", help="vector search only")
+    parser.add_argument("--mmr", action="store_true", help="diversify retrieved chunks with MMR")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency per embed call")
+    parser.add_argument("--embed-item-latency-ms", type=float, default=0.0, help="simulated latency per text")
+    parser.add_argument("--data-dir", help="keep the corpus and index here instead of a temp dir")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare with a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("data_dir", "json", "baseline", "tolerance")}
+    client_kwargs = dict(
+        dim=args.dim,
+        embed_latency=args.embed_latency_ms / 1000,
+        embed_item_latency=args.embed_item_latency_ms / 1000,
+    )
+    client, async_client = FakeOllamaClient(**client_kwargs), FakeAsyncClient(**client_kwargs)
+
+    print("Benchmarking RAG (offline, fake model backend)")
+    print("="*60)
+
+    with contextlib.ExitStack() as stack:
+        if args.data_dir:
+            data_dir = Path(args.data_dir)
+            if data_dir.exists() and any(data_dir.iterdir()):
+                sys.exit(f"❌ {data_dir} is not empty")
+        else:
+            data_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="bench_rag_")))
+        use_data_dir(data_dir, args.splitter, args.hybrid, args.embed_concurrency)
+
+        t0 = time.perf_counter()
+        pdfs = build_corpus(data_dir / "pdfs", args.books, args.pages, args.chars_per_page, args.seed)
+        print(f"Corpus: {args.books} books x {args.pages} pages in {time.perf_counter() - t0:.1f}s")
+        questions = make_questions(random.Random(args.seed + 1), args.questions)
+
+        results = {"config": config}
+        results["build"] = bench_build(pdfs, args, client, async_client)
+        results["query"] = bench_query(questions, args)
+        results["retrieve"] = bench_retrieve(questions, args, client)
+        results["fake_backend"] = {"calls": dict(client.calls), "async_calls": dict(async_client.calls)}
+
+    report(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nResults written to {args.json}")
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n✅ No regression beyond {args.tolerance:.0%}")
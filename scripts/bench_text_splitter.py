@@ -0,0 +1,120 @@
+"""分句性能对比 - 逐页 vs 批量分句，以及 rule 后端与 HanLP 的一致性/吞吐"""
+
+import argparse
+import re
+import time
+from pathlib import Path
+from typing import List, Set
+
+from pdf_parser import extract_pages, clean_text
+from text_splitter import get_splitter, split_sentences, split_sentences_batch
+
+# 没有 PDF 时使用的示例语料
+SAMPLE_CORPUS = [
+    """第二节 子宫肌瘤
+子宫肌瘤是女性生殖器最常见的良性肿瘤，由平滑肌及结缔组织组成。常见于30～50岁妇
+女，20岁以下少见。因肌瘤多无或很少有症状，临床报道发病率远低于肌瘤真实发病率。
+一、病因
+确切病因尚未明了。因肌瘤好发于生育年龄，青春期前少见，绝经后萎缩或消退，提示其
+发生可能与女性性激素相关。
+二、临床表现
+1．月经改变 为最常见症状，表现为经量增多及经期延长。
+2．下腹包块 肌瘤较小时在腹部摸不到肿块；当肌瘤逐渐增大使子宫超过3个月妊娠大小时
+可从腹部触及。""",
+    """细菌性阴道病是阴道内正常菌群失调所致的一种混合感染。主要表现为：①阴道分泌物增多，
+有鱼腥臭味；②可伴有轻度外阴瘙痒或烧灼感。患者常问：“这个病会反复吗？”答案是会
+的（尤其是未规范治疗者）。
+治疗原则为选用抗厌氧菌药物，主要有甲硝唑、克林霉素。
+（1）口服药物：首选甲硝唑。
+（2）局部药物：甲硝唑制剂，每晚1次，连用7日。""",
+    # 没有闭合的括号（图注、跨页截断）不应让之后的句子都连成一句
+    """治疗（见第3章。然后第一句。第二句。第三句。""",
+    """图1-2 子宫（前面观
+子宫位于盆腔中央。呈倒置梨形。长7～8cm。""",
+]
+
+
+def load_corpus(pdf: str, max_pages: int) -> List[str]:
+    """从 PDF 读取样本页，找不到文件时使用内置示例语料"""
+    if pdf and Path(pdf).exists():
+        pages = extract_pages(pdf, 0, max_pages)
+        texts = [clean_text(p["text"]) for p in pages]
+        return [t for t in texts if t]
+    print(f"PDF not found ({pdf}), using built-in sample corpus")
+    return SAMPLE_CORPUS
+
+
+def boundaries(sentences: List[str]) -> Set[int]:
+    """句子边界位置（按去除空白后的字符偏移计算，最后一个边界不计）"""
+    positions, offset = set(), 0
+    for s in sentences:
+        offset += len(re.sub(r"\s+", "", s))
+        positions.add(offset)
+    positions.discard(offset)
+    return positions
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_batching(texts: List[str], batch_sizes: List[int], backend: str) -> None:
+    print(f"\n--- per-page vs batched ({backend}) ---")
+    split_sentences(texts[0], backend=backend)  # 预热
+
+    baseline, elapsed = timed(lambda: [split_sentences(t, backend=backend) for t in texts])
+    print(f"per-page      {elapsed:8.2f}s  {len(texts) / elapsed:8.1f} pages/s")
+
+    for bs in batch_sizes:
+        batched, elapsed = timed(split_sentences_batch, texts, batch_size=bs, backend=backend)
+        same = "same" if batched == [list(s) for s in baseline] else "DIFFERENT"
+        print(f"batch={bs:<6}  {elapsed:8.2f}s  {len(texts) / elapsed:8.1f} pages/s  ({same})")
+
+
+def bench_backends(texts: List[str], batch_size: int) -> None:
+    print("\n--- rule vs hanlp ---")
+    results = {}
+    for backend in ("hanlp", "rule"):
+        _, load_sec = timed(get_splitter, backend)
+        sents, split_sec = timed(split_sentences_batch, texts, batch_size=batch_size, backend=backend)
+        results[backend] = sents
+        n_sents = sum(len(s) for s in sents)
+        print(f"{backend:<6} load {load_sec:7.2f}s  split {split_sec:7.2f}s  "
+              f"{len(texts) / split_sec:9.1f} pages/s  {n_sents} sentences")
+
+    # 以 HanLP 为参照，计算 rule 后端的边界一致性
+    tp = fp = fn = exact = 0
+    for ref, hyp in zip(results["hanlp"], results["rule"]):
+        ref_b, hyp_b = boundaries(ref), boundaries(hyp)
+        tp += len(ref_b & hyp_b)
+        fp += len(hyp_b - ref_b)
+        fn += len(ref_b - hyp_b)
+        exact += ref_b == hyp_b
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    print(f"\nBoundary agreement (rule vs hanlp): "
+          f"P={precision:.3f} R={recall:.3f} F1={f1:.3f}, "
+          f"identical pages {exact}/{len(texts)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sentence splitters")
+    parser.add_argument("--pdf", default="../data/pdfs/妇产科学.pdf")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64, 128])
+    parser.add_argument("--backend", default="hanlp", help="backend for the batching benchmark")
+    parser.add_argument("--skip-compare", action="store_true", help="skip rule vs hanlp report")
+    args = parser.parse_args()
+
+    print("Benchmarking Sentence Splitter")
+    print("="*60)
+
+    texts = load_corpus(args.pdf, args.pages)
+    print(f"Pages: {len(texts)}, chars: {sum(len(t) for t in texts)}")
+
+    if not args.skip_compare:
+        bench_backends(texts, batch_size=max(args.batch_sizes))
+    bench_batching(texts, args.batch_sizes, args.backend)
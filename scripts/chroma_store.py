@@ -1,7 +1,12 @@
 """ChromaDB 向量数据库模块"""
 
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Callable, Iterator, Optional
 import chromadb
 
 
@@ -11,7 +16,11 @@ class ChromaStore:
     def __init__(
         self,
         persist_dir: str = "../data/chroma",
-        collection_name: str = "gyn_kb"
+        collection_name: str = "gyn_kb",
+        max_batch_items: int = 1000,
+        max_batch_bytes: int = 32 * 1024 * 1024,
+        background: bool = False,
+        max_pending: int = 2
     ):
         """
         初始化 ChromaDB 客户端
@@ -19,6 +28,10 @@ class ChromaStore:
         Args:
             persist_dir: 数据持久化目录
             collection_name: 集合名称
+            max_batch_items: 每次 upsert 的最大条数（不超过 Chroma 自身的上限）
+            max_batch_bytes: 每次 upsert 的最大估算数据量（字节）
+            background: 是否在后台线程中执行 upsert（add_documents 立即返回）
+            max_pending: 后台模式下最多排队的 add_documents 调用数，超过时阻塞调用方
         """
         self.client = chromadb.PersistentClient(path=persist_dir)
         self.collection_name = collection_name
@@ -27,29 +40,157 @@ class ChromaStore:
             metadata={"hnsw:space": "cosine"},  # cosine/l2/ip
         )
 
+        try:
+            max_batch_items = min(max_batch_items, self.client.get_max_batch_size())
+        except Exception:
+            pass
+        self.max_batch_items = max(1, max_batch_items)
+        self.max_batch_bytes = max_batch_bytes
+
+        self.background = background
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: "deque[Future]" = deque()
+
+        # upsert 吞吐统计
+        self._stats_lock = threading.Lock()
+        self.upsert_stats = {"items": 0, "bytes": 0, "batches": 0, "seconds": 0.0}
+
+    @staticmethod
+    def _item_bytes(doc_id: str, document: str, embedding: List[float], metadata: Dict[str, Any]) -> int:
+        """估算单条数据的大小（向量按 float32 计）"""
+        return (
+            len(doc_id.encode("utf-8"))
+            + len((document or "").encode("utf-8"))
+            + 4 * len(embedding)
+            + len(json.dumps(metadata or {}, ensure_ascii=False).encode("utf-8"))
+        )
+
+    def _iter_batches(self, n_items: int, sizes: List[int]) -> Iterator[Tuple[int, int, int]]:
+        """按条数和数据量切分，产出 (start, end, bytes)"""
+        start, batch_bytes = 0, 0
+        for i in range(n_items):
+            if i > start and (
+                i - start >= self.max_batch_items
+                or batch_bytes + sizes[i] > self.max_batch_bytes
+            ):
+                yield start, i, batch_bytes
+                start, batch_bytes = i, 0
+            batch_bytes += sizes[i]
+        if start < n_items:
+            yield start, n_items, batch_bytes
+
+    def _upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+        on_commit: Optional[Callable[[List[str], List[Dict[str, Any]]], None]]
+    ) -> None:
+        sizes = [
+            self._item_bytes(i, d, e, m)
+            for i, d, e, m in zip(ids, documents, embeddings, metadatas)
+        ]
+        t0 = time.perf_counter()
+        n_batches = 0
+        for start, end, _ in self._iter_batches(len(ids), sizes):
+            self.collection.upsert(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end],
+            )
+            n_batches += 1
+        elapsed = time.perf_counter() - t0
+
+        total_bytes = sum(sizes)
+        with self._stats_lock:
+            self.upsert_stats["items"] += len(ids)
+            self.upsert_stats["bytes"] += total_bytes
+            self.upsert_stats["batches"] += n_batches
+            self.upsert_stats["seconds"] += elapsed
+
+        if on_commit is not None:
+            on_commit(ids, metadatas)
+        print(
+            f"Added {len(documents)} documents to collection '{self.collection_name}' "
+            f"in {n_batches} batches ({len(ids) / max(elapsed, 1e-6):.0f} docs/s, "
+            f"{total_bytes / max(elapsed, 1e-6) / 1e6:.1f} MB/s)"
+        )
+
     def add_documents(
         self,
         ids: List[str],
         documents: List[str],
         embeddings: List[List[float]],
-        metadatas: List[Dict[str, Any]]
+        metadatas: List[Dict[str, Any]],
+        on_commit: Optional[Callable[[List[str], List[Dict[str, Any]]], None]] = None
     ) -> None:
         """
         批量添加文档到向量数据库
 
+        数据会按 max_batch_items / max_batch_bytes 切分成多次 upsert；
+        后台模式下在单独线程中按调用顺序提交，本方法立即返回（排队过多时阻塞），
+        需要确认写入完成时调用 flush()。
+
         Args:
             ids: 文档 ID 列表
             documents: 文档内容列表
             embeddings: 向量列表
             metadatas: 元数据列表
+            on_commit: 全部写入成功后的回调 (ids, metadatas)
         """
-        self.collection.upsert(
-            ids=ids,
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas,
+        if not ids:
+            return
+        if not self.background:
+            self._upsert(ids, documents, embeddings, metadatas, on_commit)
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chroma-upsert")
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        self._pending.append(
+            self._executor.submit(self._upsert, ids, documents, embeddings, metadatas, on_commit)
         )
-        print(f"Added {len(documents)} documents to collection '{self.collection_name}'")
+
+    def flush(self) -> None:
+        """等待后台 upsert 全部完成（出错时抛出异常）"""
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self) -> None:
+        """等待后台任务完成并关闭后台线程"""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def upsert_throughput(self) -> Dict[str, float]:
+        """累计 upsert 吞吐"""
+        with self._stats_lock:
+            stats = dict(self.upsert_stats)
+        sec = max(stats["seconds"], 1e-6)
+        stats["docs_per_sec"] = round(stats["items"] / sec, 1)
+        stats["mb_per_sec"] = round(stats["bytes"] / sec / 1e6, 2)
+        return stats
+
+    def delete_documents(self, ids: List[str]) -> None:
+        """
+        按 ID 删除文档（不存在的 ID 会被忽略）
+
+        Args:
+            ids: 文档 ID 列表
+        """
+        if not ids:
+            return
+        self.flush()
+        for start in range(0, len(ids), self.max_batch_items):
+            self.collection.delete(ids=ids[start:start + self.max_batch_items])
+        print(f"Deleted {len(ids)} documents from collection '{self.collection_name}'")
 
     def query(
         self,
@@ -73,6 +214,69 @@ class ChromaStore:
         )
         return results
 
+    def query_batch(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 5,
+        with_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        """
+        多向量检索（一次调用检索多个查询）
+
+        Args:
+            query_embeddings: 查询向量列表
+            n_results: 每个查询返回的结果数量
+            with_embeddings: 同时返回结果的向量（MMR 用）
+
+        Returns:
+            检索结果，ids / documents / metadatas / distances（/ embeddings）均为每个查询一个列表
+        """
+        include = ["documents", "metadatas", "distances"]
+        if with_embeddings:
+            include.append("embeddings")
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=include,
+        )
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """
+        按 ID 读取文档
+
+        Returns:
+            {id: (document, metadata)}，不存在的 ID 不出现在结果中
+        """
+        if not ids:
+            return {}
+        res = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return {
+            doc_id: (doc, meta)
+            for doc_id, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])
+        }
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        """
+        按 ID 读取向量
+
+        Returns:
+            {id: 向量}，不存在的 ID 不出现在结果中
+        """
+        if not ids:
+            return {}
+        res = self.collection.get(ids=list(ids), include=["embeddings"])
+        return dict(zip(res["ids"], res["embeddings"]))
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        """分页遍历集合中的全部文档，每次产出 (ids, documents)"""
+        offset = 0
+        while True:
+            res = self.collection.get(include=["documents"], limit=batch_size, offset=offset)
+            if not res["ids"]:
+                return
+            yield res["ids"], res["documents"]
+            offset += len(res["ids"])
+
     def get_collection_info(self) -> Dict[str, Any]:
         """获取集合信息"""
         count = self.collection.count()
@@ -83,6 +287,7 @@ class ChromaStore:
 
     def clear_collection(self) -> None:
         """清空集合"""
+        self.flush()
         self.client.delete_collection(name=self.collection_name)
         self.collection = self.client.get_or_create_collection(
             name=self.collection_name,
@@ -6,21 +6,147 @@ from pathlib import Path
 EMBED_MODEL = "dengcao/Qwen3-Embedding-0.6B:Q8_0"
 LLM_MODEL = "Qwen3:0.6B"
 
+# Ollama 后端：embedding 与生成各自的节点列表（如 ["http://10.0.0.2:11434", "http://10.0.0.3:11434"]），
+# 为空时使用 OLLAMA_HOST 环境变量或本机默认地址；多个节点时按在途请求数最少路由
+OLLAMA_EMBED_HOSTS = []
+OLLAMA_CHAT_HOSTS = []
+# 请求读写超时 / 建立连接超时（秒），每个节点保持的 keep-alive 连接数
+OLLAMA_TIMEOUT = 300.0
+OLLAMA_CONNECT_TIMEOUT = 5.0
+OLLAMA_MAX_CONNECTIONS = 32
+# 连续故障多少次后摘除节点、摘除时长（秒）、主动健康检查间隔（秒，<= 0 关闭；只有多个节点时才检查）
+OLLAMA_MAX_FAILURES = 3
+OLLAMA_EJECT_SECONDS = 30.0
+OLLAMA_HEALTH_INTERVAL = 10.0
+
 # 路径配置
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 PDF_DIR = DATA_DIR / "pdfs"
 CHROMA_DIR = DATA_DIR / "chroma"
+# 增量索引清单（每页内容哈希 + chunk ID）
+MANIFEST_PATH = DATA_DIR / "index_manifest.json"
+# 构建检查点（已写入的批次，失败后 --resume 续跑）
+CHECKPOINT_PATH = DATA_DIR / "index_checkpoint.jsonl"
 
 # ChromaDB 配置
 COLLECTION_NAME = "gyn_kb"
+# 每次 upsert 的最大条数 / 估算数据量（超过时自动拆分）
+CHROMA_MAX_BATCH_ITEMS = 1000
+CHROMA_MAX_BATCH_BYTES = 32 * 1024 * 1024
+# 索引构建时在后台线程写入 ChromaDB，与 embedding 重叠
+CHROMA_BACKGROUND_UPSERT = True
 
 # 文本切分配置
 MAX_CHARS_PER_CHUNK = 900
 OVERLAP_SENTENCES = 2
 
+# 分句后端："hanlp"（神经网络模型，准确但加载慢）或 "rule"（纯规则，零加载时间）
+SPLITTER_BACKEND = "hanlp"
+
+# 分句批处理配置（一次送入 HanLP 的页数，<= 1 时逐页分句）
+# 批次在单个页区间任务内组成，实际批大小为 min(SPLIT_BATCH_SIZE, INGEST_PAGES_PER_TASK)，
+# 增大批次时需同时增大 INGEST_PAGES_PER_TASK
+SPLIT_BATCH_SIZE = 32
+
+# 索引构建并行配置（INGEST_WORKERS <= 1 时单进程串行处理）
+INGEST_WORKERS = 1
+# 每个任务处理的页数（同时是分句批大小的上限）
+INGEST_PAGES_PER_TASK = 32
+
+# 流式索引流水线：每次 embed + 写入的 chunk 数，以及段间队列长度（决定峰值内存）
+PIPELINE_BATCH_SIZE = 256
+PIPELINE_QUEUE_SIZE = 4
+
 # Embedding 批处理配置
 EMBED_BATCH_SIZE = 32
 
+# 并发 embedding（asyncio）：同时在途的批次数，<= 1 时使用串行的 batch_embed
+EMBED_CONCURRENCY = 4
+# 自适应批大小：批大小上限与每批目标延迟（秒）
+EMBED_MAX_BATCH_SIZE = 256
+EMBED_TARGET_LATENCY = 2.0
+# 单个批次失败后的最大重试次数
+EMBED_MAX_RETRIES = 3
+
+# Embedding 持久化缓存（SQLite，键为 模型名 + 文本哈希；设为 None 关闭）
+EMBED_CACHE_PATH = DATA_DIR / "embed_cache.sqlite3"
+# 最多缓存的向量条数（1024 维 float32 约 4KB/条）
+EMBED_CACHE_MAX_ENTRIES = 200_000
+
 # RAG 检索配置
 DEFAULT_TOP_K = 6
+
+# 自适应检索：首轮向 Chroma 取 top_k * RETRIEVE_FETCH_FACTOR 个候选，按 (source, page) 去重后
+# 不足 top_k 个不同页时候选数翻倍重查，直到够数、取完全部文档或达到 RETRIEVE_MAX_FETCH
+RETRIEVE_FETCH_FACTOR = 1.5
+RETRIEVE_MAX_FETCH = 96
+
+# MMR 多样化：去重后按 λ·与问题的相似度 − (1−λ)·与已选 chunk 的最大相似度 依次选出 top_k，
+# 减少内容重复的上下文（需要 Chroma 额外返回候选向量）
+MMR_ENABLED = False
+MMR_LAMBDA = 0.7
+
+# 混合检索：BM25 词法索引（汉字二元组）与向量检索结果按 RRF 融合
+HYBRID_SEARCH = True
+LEXICAL_INDEX_PATH = DATA_DIR / "lexical_index.pkl"
+# RRF 融合常数：score = Σ 1 / (RRF_K + 排名)
+RRF_K = 60
+
+# 上下文打包：按 token 预算组装 context，每个 chunk 只保留与问题最相关的句子
+# （token 数为估计值，汉字约 1 个；设为 0 时保持原行为：top_k 个完整 chunk）
+CONTEXT_TOKEN_BUDGET = 1500
+# 单个 chunk 在 context 中最多占用的 token 数
+CONTEXT_CHUNK_TOKENS = 400
+# 向量距离（cosine）大于该值的 chunk 不放入 context（排名第一的始终保留）；None 表示不过滤
+CONTEXT_MAX_DISTANCE = 0.8
+
+# API 异步路径中执行 Chroma 查询的专用线程数
+SEARCH_WORKERS = 8
+
+# 请求合并：相同（归一化问题, top_k）的并发请求共享一次检索与生成
+COALESCE_REQUESTS = True
+
+# 流式问答的所有客户端都断开后取消 LLM 生成（关闭 Ollama 流，不再为无人接收的回答消耗算力）
+CANCEL_ON_DISCONNECT = True
+
+# 准入控制：每个接口的并发上限、等待队列长度、排队截止时间（秒）；
+# 队列已满或排队超时立即返回 429 + Retry-After。并发上限 <= 0 表示不限制
+QA_MAX_CONCURRENCY = 8
+QA_QUEUE_SIZE = 32
+QA_QUEUE_TIMEOUT = 10.0
+QA_STREAM_MAX_CONCURRENCY = 8
+QA_STREAM_QUEUE_SIZE = 32
+QA_STREAM_QUEUE_TIMEOUT = 5.0  # 流式客户端更在意首 token，排队过久不如尽快重试
+TRANSCRIBE_MAX_CONCURRENCY = 2
+TRANSCRIBE_QUEUE_SIZE = 8
+TRANSCRIBE_QUEUE_TIMEOUT = 30.0
+
+# 批量问答（/v1/qa/batch）：单次请求的最大问题数与同时进行的 LLM 生成数
+QA_BATCH_MAX_QUESTIONS = 100
+QA_BATCH_CONCURRENCY = 4
+
+# 问题向量缓存（QABot 进程内 LRU，容量为 0 时关闭；TTL 单位秒，None 表示不过期）
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = 3600
+
+# 语义答案缓存（API）：问题向量余弦相似度 >= 阈值且索引未变化时直接返回缓存答案
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_TTL = 24 * 3600
+# 流式接口回放缓存答案时每个 chunk 事件的字符数
+ANSWER_CACHE_REPLAY_CHARS = 16
+
+# 语音转写（API）：是否启用、Whisper 模型大小（tiny / base / small / medium ...）
+SPEECH_ENABLED = True
+WHISPER_MODEL_SIZE = "small"
+# 启动后在后台预热模型；False 时由第一个转写请求触发加载
+WHISPER_PRELOAD = True
+# 并发转写数（每个占一份 Whisper 模型内存）与等待队列长度，
+# 进行中 + 排队超过二者之和时立即返回 429
+WHISPER_WORKERS = 1
+WHISPER_QUEUE_SIZE = 4
+# 模型加载失败后的重试间隔（秒）：期间转写请求返回 503，之后的请求重新尝试加载
+WHISPER_RETRY_SECONDS = 30
+# 上传音频大小上限（字节），超过返回 413
+WHISPER_MAX_AUDIO_BYTES = 25 * 1024 * 1024
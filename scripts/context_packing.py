@@ -0,0 +1,162 @@
+"""上下文打包模块 - 按 token 预算组装 LLM 上下文（句子级裁剪 + 距离截断）"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from scripts.lexical_index import tokenize
+from scripts.text_splitter import split_sentences
+
+_CJK = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_SPACE = re.compile(r"\s")
+
+# 被裁掉的句子处的省略标记
+GAP = "……"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计 token 数（不加载分词器）：汉字和标点各记 1 个，英文/数字串每 4 个字符记 1 个
+
+    Qwen 系列分词器中常用汉字通常不到 1 个 token，估计值偏大，用作预算上限是安全的。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    words = _WORD.findall(text)
+    spaces = len(_SPACE.findall(text))
+    other = len(text) - cjk - spaces - sum(len(w) for w in words)
+    return cjk + other + sum(math.ceil(len(w) / 4) for w in words)
+
+
+def trim_chunk(
+    question_tokens: Set[str],
+    text: str,
+    max_tokens: int
+) -> Tuple[str, int]:
+    """
+    把 chunk 裁剪到 max_tokens 以内（保持原文顺序），放得下时原样返回
+
+    放不下时先按与问题的字面重合度（共有的二元组/词占问题的比例）从高到低选句子，
+    剩余的份额再按原文顺序用其余句子填满；没有任何重合时保留开头连续的句子
+    （向量检索命中说明整体语义相关）。
+
+    Args:
+        question_tokens: 问题的分词结果（lexical_index.tokenize）
+        text: chunk 原文
+        max_tokens: token 上限
+
+    Returns:
+        (裁剪后的文本, 估计 token 数)，一句都放不下时为 ("", 0)
+    """
+    if max_tokens <= 0 or not text.strip():
+        return "", 0
+    full = estimate_tokens(text)
+    if full <= max_tokens:
+        return text, full
+
+    sentences = [s for s in split_sentences(text, backend="rule") if s.strip()]
+    if not sentences:
+        return "", 0
+    costs = [estimate_tokens(s) for s in sentences]
+    scores = [
+        len(question_tokens.intersection(tokenize(s))) / len(question_tokens) if question_tokens else 0.0
+        for s in sentences
+    ]
+
+    matched = sorted((i for i in range(len(sentences)) if scores[i] > 0), key=lambda i: (-scores[i], i))
+    leading = not matched
+    order = matched + [i for i in range(len(sentences)) if scores[i] <= 0]
+
+    keep, used = [], 0
+    gap_cost = estimate_tokens(GAP)
+    for i in order:
+        # 预留省略标记的开销
+        if used + costs[i] + gap_cost > max_tokens:
+            if leading:
+                break  # 保留开头连续的句子
+            continue
+        keep.append(i)
+        used += costs[i] + gap_cost
+    if not keep:
+        return "", 0
+
+    keep.sort()
+    parts = [GAP] if keep[0] > 0 else []
+    for prev, i in zip([None] + keep, keep):
+        if prev is not None and i != prev + 1:
+            parts.append(GAP)
+        parts.append(sentences[i])
+    if keep[-1] < len(sentences) - 1:
+        parts.append(GAP)
+    trimmed = "".join(parts)
+    return trimmed, estimate_tokens(trimmed)
+
+
+def format_block(rank: int, meta: Dict[str, Any], text: str) -> str:
+    """context 中单个来源的格式"""
+    return f"[{rank}] 来源：{meta.get('source')} 第{meta.get('page')}页\n{text}"
+
+
+def pack_context(
+    question: str,
+    items: List[Dict[str, Any]],
+    budget: Optional[int],
+    chunk_tokens: Optional[int] = None,
+    max_distance: Optional[float] = None
+) -> Tuple[List[Tuple[Dict[str, Any], str]], Dict[str, int]]:
+    """
+    按 token 预算组装上下文
+
+    - 按排名依次加入 chunk，超出份额的 chunk 优先保留与问题最相关的句子；单个 chunk 至多占用
+      chunk_tokens，且不超过剩余预算在剩余 chunk 间的平均份额（排名靠前的 chunk 不会挤掉后面的来源，
+      用不完的份额留给后面的 chunk）
+    - 向量距离大于 max_distance 的 chunk 跳过（排名第一的始终保留；只被词法检索命中、
+      没有距离的不受影响）
+
+    Args:
+        question: 用户问题
+        items: 已去重、按相关度排序的候选 [{"doc", "meta", "distance", ...}]
+        budget: 上下文总 token 预算；None / <= 0 时不裁剪，全部原样保留
+        chunk_tokens: 单个 chunk 的 token 上限，None 表示只受总预算限制
+        max_distance: 距离截断，None 表示不过滤
+
+    Returns:
+        ([(候选, 放入 context 的文本), ...],
+         {"tokens", "tokens_full", "tokens_saved", "chunks_dropped"})
+    """
+    full_tokens = sum(
+        estimate_tokens(format_block(i, it["meta"] or {}, it["doc"] or ""))
+        for i, it in enumerate(items, start=1)
+    )
+    if not budget or budget <= 0:
+        packed = [(it, it["doc"] or "") for it in items]
+        return packed, {"tokens": full_tokens, "tokens_full": full_tokens, "tokens_saved": 0, "chunks_dropped": 0}
+
+    eligible = [
+        it for i, it in enumerate(items)
+        if i == 0 or max_distance is None or it.get("distance") is None or it["distance"] <= max_distance
+    ]
+    q_tokens = set(tokenize(question))
+    packed: List[Tuple[Dict[str, Any], str]] = []
+    used = 0
+    for n, it in enumerate(eligible):
+        meta = it["meta"] or {}
+        header = estimate_tokens(format_block(len(packed) + 1, meta, ""))
+        left = len(eligible) - n
+        # 为后面的 chunk 预留标题和平均份额
+        share = (budget - used - header * left) // left
+        limit = share if chunk_tokens is None else min(chunk_tokens, share)
+        text, cost = trim_chunk(q_tokens, it["doc"] or "", limit)
+        if not text:
+            continue
+        packed.append((it, text))
+        used += header + cost
+
+    return packed, {
+        "tokens": used,
+        "tokens_full": full_tokens,
+        "tokens_saved": max(0, full_tokens - used),
+        "chunks_dropped": len(items) - len(packed),
+    }
@@ -1,15 +1,164 @@
-"""Embedding 生成模块 - 调用 Ollama 生成文本向量"""
+"""Embedding 生成模块 - 调用 Ollama 生成文本向量（可选 SQLite 持久化缓存）"""
 
-from typing import List
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import List, Dict, Any, Optional
 from tqdm import tqdm
-from ollama import embed
+from ollama import AsyncClient
+try:
+    from scripts.ollama_pool import default_client, new_async_client
+except ImportError:  # 在 scripts/ 目录下直接运行（如 python test_embeddings.py）
+    from ollama_pool import default_client, new_async_client
+
+
+class EmbeddingCache:
+    """
+    Embedding 持久化缓存（SQLite）
+
+    - 键为 (模型名, 文本 SHA-256)，向量以 float32 二进制存储
+    - 记录最近使用时间，超过 max_entries 时淘汰最久未使用的条目
+    - 统计命中率
+    """
+
+    # SQLite 单条语句的参数个数有上限，查询时分批
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        """
+        Args:
+            path: SQLite 文件路径
+            max_entries: 最多保留的条目数，None 表示不限制
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量查询缓存
+
+        Returns:
+            与 texts 一一对应的向量，未命中为 None
+        """
+        keys = [self._key(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for i in range(0, len(unique), self._QUERY_CHUNK):
+                part = unique[i:i + self._QUERY_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, k) for k in found],
+                )
+                self._conn.commit()
+
+            result = [found.get(k) for k in keys]
+            n_hits = sum(v is not None for v in result)
+            self.hits += n_hits
+            self.misses += len(result) - n_hits
+        return result
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """批量写入缓存，必要时淘汰旧条目"""
+        now = time.time()
+        rows = [
+            (model, self._key(t), array("f", v).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._count += self._conn.total_changes - before
+            if self.max_entries is not None and self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        self.put_many(model, [text], [vector])
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的条目，降到上限的 90%（避免每次写入都触发淘汰）"""
+        target = int(self.max_entries * 0.9)
+        n_evict = self._count - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN ("
+            " SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (n_evict,),
+        )
+        self._count = target
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
 
 
 def batch_embed(
     texts: List[str],
     model: str = "dengcao/Qwen3-Embedding-0.6B:Q8_0",
     batch_size: int = 32,
-    show_progress: bool = True
+    show_progress: bool = True,
+    cache: Optional[EmbeddingCache] = None,
+    client=None
 ) -> List[List[float]]:
     """
     批量生成文本 embeddings
@@ -19,32 +168,285 @@ def batch_embed(
         model: Ollama embedding 模型名称
         batch_size: 每批处理的文本数量
         show_progress: 是否显示进度条
+        cache: 可选的持久化缓存，只有未命中的文本会发给 Ollama
+        client: 带 embed() 方法的客户端（如 ollama.Client），默认使用共享的 Ollama 客户端池
 
     Returns:
-        向量列表，每个向量是一个 float 数组
+        向量列表，每个向量是一个 float 数组，顺序与 texts 一致
     """
-    vectors: List[List[float]] = []
+    vectors: List[Optional[List[float]]] = (
+        cache.get_many(model, texts) if cache is not None else [None] * len(texts)
+    )
+
+    # 未命中的文本（相同文本只请求一次）
+    misses: Dict[str, List[int]] = {}
+    for i, (t, v) in enumerate(zip(texts, vectors)):
+        if v is None:
+            misses.setdefault(t, []).append(i)
+    todo = list(misses)
 
     # 创建批次数组
-    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
 
     iterator = tqdm(batches, desc="Generating embeddings", disable=not show_progress)
 
+    embed_fn = (client if client is not None else default_client()).embed
+    embedded = len(texts) - sum(len(idx) for idx in misses.values())
     for batch in iterator:
         try:
-            resp = embed(model=model, input=batch)
-            vectors.extend(resp["embeddings"])
-            iterator.set_postfix({"embedded": len(vectors), "total": len(texts)})
+            resp = embed_fn(model=model, input=batch)
         except Exception as e:
             print(f"\nError embedding batch: {e}")
             raise
 
+        for t, v in zip(batch, resp["embeddings"]):
+            for i in misses[t]:
+                vectors[i] = v
+            embedded += len(misses[t])
+        if cache is not None:
+            cache.put_many(model, batch, resp["embeddings"])
+        iterator.set_postfix({"embedded": embedded, "total": len(texts)})
+
+    return vectors
+
+
+class AdaptiveBatchSizer:
+    """
+    自适应批大小：根据观测到的延迟和文本长度决定下一批取多少条
+
+    - 用 EWMA 估计服务端吞吐（字符/秒），每批的字符预算 = 吞吐 × 目标延迟
+    - 长文本自动少取、短文本自动多取，条数限制在 [min_size, max_size]
+    - 请求失败时预算减半
+    """
+
+    def __init__(
+        self,
+        initial_size: int = 32,
+        min_size: int = 1,
+        max_size: int = 256,
+        target_latency: float = 2.0,
+        smoothing: float = 0.3
+    ):
+        self.initial_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.smoothing = smoothing
+        self.chars_per_sec: Optional[float] = None
+
+    def next_end(self, texts: List[str], start: int) -> int:
+        """返回下一批的结束下标（不包含）"""
+        limit = min(len(texts), start + self.max_size)
+        if self.chars_per_sec is None:
+            return min(limit, start + self.initial_size)
+
+        budget = self.chars_per_sec * self.target_latency
+        end, chars = start, 0
+        while end < limit:
+            chars += len(texts[end])
+            if end - start >= self.min_size and chars > budget:
+                break
+            end += 1
+        return end
+
+    def record(self, chars: int, latency: float) -> None:
+        """记录一批成功请求的字符数和耗时"""
+        rate = chars / max(latency, 1e-3)
+        if self.chars_per_sec is None:
+            self.chars_per_sec = rate
+        else:
+            self.chars_per_sec += self.smoothing * (rate - self.chars_per_sec)
+
+    def record_failure(self) -> None:
+        """请求失败（超时/过载）时缩小批次"""
+        if self.chars_per_sec is not None:
+            self.chars_per_sec /= 2
+        else:
+            self.initial_size = max(self.min_size, self.initial_size // 2)
+
+
+async def async_batch_embed(
+    texts: List[str],
+    model: str = "dengcao/Qwen3-Embedding-0.6B:Q8_0",
+    batch_size: int = 32,
+    concurrency: int = 4,
+    max_batch_size: int = 256,
+    target_latency: float = 2.0,
+    max_retries: int = 3,
+    show_progress: bool = True,
+    cache: Optional[EmbeddingCache] = None,
+    client: Optional[AsyncClient] = None,
+    sizer: Optional[AdaptiveBatchSizer] = None
+) -> List[List[float]]:
+    """
+    并发批量生成文本 embeddings（asyncio）
+
+    同时保持 concurrency 个批次在途，批大小由 AdaptiveBatchSizer 按延迟和文本长度调整；
+    失败的批次单独重试，结果按 texts 原顺序返回，与 batch_embed 一致。
+
+    Args:
+        texts: 文本列表
+        model: Ollama embedding 模型名称
+        batch_size: 初始批大小
+        concurrency: 同时在途的批次数
+        max_batch_size: 批大小上限
+        target_latency: 每批的目标延迟（秒）
+        max_retries: 每个批次最多重试次数
+        show_progress: 是否显示进度条
+        cache: 可选的持久化缓存
+        client: Ollama 异步客户端，默认新建（共享 Ollama 客户端池的后端与健康状态），
+            新建的客户端在返回前关闭
+        sizer: 可选，跨调用复用的批大小估计（传入时忽略 batch_size / max_batch_size / target_latency）
+
+    Returns:
+        向量列表，顺序与 texts 一致
+    """
+    vectors: List[Optional[List[float]]] = (
+        cache.get_many(model, texts) if cache is not None else [None] * len(texts)
+    )
+    misses: Dict[str, List[int]] = {}
+    for i, (t, v) in enumerate(zip(texts, vectors)):
+        if v is None:
+            misses.setdefault(t, []).append(i)
+    todo = list(misses)
+    if not todo:
+        return vectors
+
+    own_client = client is None
+    client = client or new_async_client()
+    sizer = sizer or AdaptiveBatchSizer(
+        initial_size=batch_size,
+        max_size=max(batch_size, max_batch_size),
+        target_latency=target_latency,
+    )
+    slots = asyncio.Semaphore(max(1, concurrency))
+    progress = tqdm(
+        total=len(texts),
+        initial=len(texts) - sum(len(idx) for idx in misses.values()),
+        desc="Generating embeddings",
+        disable=not show_progress,
+    )
+
+    async def run_batch(batch: List[str]) -> None:
+        try:
+            for attempt in range(max_retries + 1):
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.embed(model=model, input=batch)
+                except Exception as e:
+                    sizer.record_failure()
+                    if attempt == max_retries:
+                        print(f"\nError embedding batch: {e}")
+                        raise
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+
+                sizer.record(sum(len(t) for t in batch), time.perf_counter() - t0)
+                for t, v in zip(batch, resp["embeddings"]):
+                    for i in misses[t]:
+                        vectors[i] = v
+                    progress.update(len(misses[t]))
+                if cache is not None:
+                    cache.put_many(model, batch, resp["embeddings"])
+                progress.set_postfix({"batch": len(batch)})
+                return
+        finally:
+            slots.release()
+
+    tasks: List[asyncio.Task] = []
+    try:
+        cursor = 0
+        while cursor < len(todo):
+            await slots.acquire()
+            failed = [t for t in tasks if t.done() and t.exception() is not None]
+            if failed:
+                slots.release()
+                raise failed[0].exception()
+            end = sizer.next_end(todo, cursor)
+            tasks.append(asyncio.create_task(run_batch(todo[cursor:end])))
+            cursor = end
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        progress.close()
+        if own_client:
+            await client.close()
+
     return vectors
 
 
+def concurrent_batch_embed(texts: List[str], **kwargs) -> List[List[float]]:
+    """async_batch_embed 的同步包装（参数相同），单次调用；多次调用请用 ConcurrentEmbedder"""
+    return asyncio.run(async_batch_embed(texts, **kwargs))
+
+
+class ConcurrentEmbedder:
+    """
+    供同步代码多次调用的并发 embedding（如 build_index 流水线的每个批次）
+
+    所有调用共用一个事件循环、一个异步客户端（keep-alive 连接跨批次复用）和一个
+    AdaptiveBatchSizer（批大小估计不会每批重置）；用完调用 close()。
+    同一时刻只能有一个线程调用 embed()。
+    """
+
+    def __init__(
+        self,
+        model: str = "dengcao/Qwen3-Embedding-0.6B:Q8_0",
+        batch_size: int = 32,
+        concurrency: int = 4,
+        max_batch_size: int = 256,
+        target_latency: float = 2.0,
+        max_retries: int = 3,
+        cache: Optional[EmbeddingCache] = None,
+        client: Optional[AsyncClient] = None
+    ):
+        """
+        Args:
+            参数含义同 async_batch_embed；client 为空时新建，close() 时关闭
+        """
+        self.model = model
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.cache = cache
+        self.sizer = AdaptiveBatchSizer(
+            initial_size=batch_size,
+            max_size=max(batch_size, max_batch_size),
+            target_latency=target_latency,
+        )
+        self._own_client = client is None
+        self._client = client
+        self._loop = asyncio.new_event_loop()
+
+    def embed(self, texts: List[str], show_progress: bool = False) -> List[List[float]]:
+        """生成 texts 的向量，顺序与 texts 一致"""
+        if self._client is None:
+            self._client = new_async_client()
+        return self._loop.run_until_complete(async_batch_embed(
+            texts,
+            model=self.model,
+            concurrency=self.concurrency,
+            max_retries=self.max_retries,
+            show_progress=show_progress,
+            cache=self.cache,
+            client=self._client,
+            sizer=self.sizer,
+        ))
+
+    def close(self) -> None:
+        """关闭自建的客户端和事件循环"""
+        try:
+            if self._own_client and self._client is not None:
+                self._loop.run_until_complete(self._client.close())
+        finally:
+            self._loop.close()
+
+
 def embed_single(
     text: str,
-    model: str = "dengcao/Qwen3-Embedding-0.6B:Q8_0"
+    model: str = "dengcao/Qwen3-Embedding-0.6B:Q8_0",
+    cache: Optional[EmbeddingCache] = None,
+    client=None
 ) -> List[float]:
     """
     生成单个文本的 embedding
@@ -52,12 +454,22 @@ def embed_single(
     Args:
         text: 单个文本
         model: Ollama embedding 模型名称
+        cache: 可选的持久化缓存
+        client: 带 embed() 方法的客户端，默认使用共享的 Ollama 客户端池
 
     Returns:
         向量（float 数组）
     """
-    resp = embed(model=model, input=text)
-    return resp["embeddings"][0]
+    if cache is not None:
+        vector = cache.get(model, text)
+        if vector is not None:
+            return vector
+
+    resp = (client if client is not None else default_client()).embed(model=model, input=text)
+    vector = resp["embeddings"][0]
+    if cache is not None:
+        cache.put(model, text, vector)
+    return vector
 
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+"""离线模型替身 - 确定性的 embedding / LLM，接口与 ollama 客户端一致（基准测试用，不需要 Ollama 和网络）"""
+
+import asyncio
+import re
+import time
+import zlib
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+FAKE_EMBED_DIM = 256
+
+_SPACE = re.compile(r"\s+")
+
+
+def fake_embedding(text: str, dim: int = FAKE_EMBED_DIM) -> List[float]:
+    """
+    确定性的文本向量：字符二元组做特征哈希后 L2 归一化
+
+    字面重叠越多的文本余弦相似度越高，检索结果有意义；相同文本在任何进程中向量都相同。
+
+    Args:
+        text: 文本
+        dim: 向量维度
+
+    Returns:
+        向量（float 列表）
+    """
+    text = _SPACE.sub("", text or "")
+    grams = [text[i:i + 2] for i in range(len(text) - 1)] or [text]
+    slots = np.fromiter(
+        (zlib.crc32(g.encode("utf-8")) % dim for g in grams), dtype=np.int64, count=len(grams)
+    )
+    vec = np.bincount(slots, minlength=dim).astype(np.float32)
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec.tolist()
+
+
+def fake_answer(messages: List[Dict[str, str]], n_chars: int = 200) -> str:
+    """
+    确定性的回答：取最后一条用户消息中的“资料”开头部分
+
+    Args:
+        messages: 对话消息
+        n_chars: 回答长度（字符数）
+    """
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    context = user.split("资料：", 1)[-1]
+    body = _SPACE.sub("", context) or "资料不足以回答"
+    return ("根据资料，" + body)[:n_chars]
+
+
+class FakeOllamaClient:
+    """
+    同步客户端替身（embed / chat），可注入 batch_embed、build_index、QABot 的 client 参数
+
+    延迟参数模拟真实模型的耗时，默认为 0（只测本地代码的开销）。
+    """
+
+    def __init__(
+        self,
+        dim: int = FAKE_EMBED_DIM,
+        embed_latency: float = 0.0,
+        embed_item_latency: float = 0.0,
+        ttft: float = 0.0,
+        token_latency: float = 0.0,
+        answer_chars: int = 200,
+        chunk_chars: int = 4
+    ):
+        """
+        Args:
+            dim: 向量维度
+            embed_latency: 每次 embed 调用的固定延迟（秒）
+            embed_item_latency: embed 每条文本的额外延迟（秒）
+            ttft: chat 首 token 延迟（秒）
+            token_latency: chat 每个流式 chunk 的间隔（秒）
+            answer_chars: 回答长度（字符数）
+            chunk_chars: 流式输出时每个 chunk 的字符数（约等于一个 token）
+        """
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.ttft = ttft
+        self.token_latency = token_latency
+        self.answer_chars = answer_chars
+        self.chunk_chars = max(1, chunk_chars)
+        self.calls: Counter = Counter()
+        self.embedded_texts = 0
+
+    # ---------- 共用 ----------
+    def _embed(self, model: str, input: Union[str, List[str]]) -> Dict[str, Any]:
+        texts = [input] if isinstance(input, str) else list(input)
+        self.calls["embed"] += 1
+        self.embedded_texts += len(texts)
+        return {"model": model, "embeddings": [fake_embedding(t, self.dim) for t in texts]}
+
+    def _embed_delay(self, input: Union[str, List[str]]) -> float:
+        n = 1 if isinstance(input, str) else len(input)
+        return self.embed_latency + self.embed_item_latency * n
+
+    def _chunks(self, messages: List[Dict[str, str]]) -> List[str]:
+        answer = fake_answer(messages, self.answer_chars)
+        return [answer[i:i + self.chunk_chars] for i in range(0, len(answer), self.chunk_chars)]
+
+    def _message(self, model: str, content: str, done: bool, n_chunks: int = 0) -> Dict[str, Any]:
+        resp: Dict[str, Any] = {"model": model, "message": {"role": "assistant", "content": content}, "done": done}
+        if done:
+            resp["eval_count"] = n_chunks
+            resp["eval_duration"] = int(n_chunks * self.token_latency * 1e9)
+        return resp
+
+    # ---------- 同步接口 ----------
+    def embed(self, model: str = "", input: Union[str, List[str]] = "", **kwargs) -> Dict[str, Any]:
+        delay = self._embed_delay(input)
+        if delay:
+            time.sleep(delay)
+        return self._embed(model, input)
+
+    def chat(
+        self,
+        model: str = "",
+        messages: Optional[List[Dict[str, str]]] = None,
+        stream: bool = False,
+        **kwargs
+    ) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        self.calls["chat"] += 1
+        chunks = self._chunks(messages or [])
+        if stream:
+            return self._stream(model, chunks)
+        time.sleep(self.ttft + self.token_latency * len(chunks))
+        return self._message(model, "".join(chunks), True, len(chunks))
+
+    def _stream(self, model: str, chunks: List[str]) -> Iterator[Dict[str, Any]]:
+        time.sleep(self.ttft)
+        for c in chunks:
+            yield self._message(model, c, False)
+            time.sleep(self.token_latency)
+        yield self._message(model, "", True, len(chunks))
+
+
+class FakeAsyncClient(FakeOllamaClient):
+    """异步客户端替身，与 ollama.AsyncClient 接口一致（async_batch_embed、QABot 异步路径用）"""
+
+    async def embed(self, model: str = "", input: Union[str, List[str]] = "", **kwargs) -> Dict[str, Any]:
+        delay = self._embed_delay(input)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._embed(model, input)
+
+    async def chat(
+        self,
+        model: str = "",
+        messages: Optional[List[Dict[str, str]]] = None,
+        stream: bool = False,
+        **kwargs
+    ) -> Union[Dict[str, Any], AsyncIterator[Dict[str, Any]]]:
+        self.calls["chat"] += 1
+        chunks = self._chunks(messages or [])
+        if stream:
+            return self._astream(model, chunks)
+        await asyncio.sleep(self.ttft + self.token_latency * len(chunks))
+        return self._message(model, "".join(chunks), True, len(chunks))
+
+    async def _astream(self, model: str, chunks: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        await asyncio.sleep(self.ttft)
+        for c in chunks:
+            yield self._message(model, c, False)
+            await asyncio.sleep(self.token_latency)
+        yield self._message(model, "", True, len(chunks))
@@ -0,0 +1,314 @@
+"""Ollama 协议替身服务 - /api/embed、/api/chat（含流式）、/api/tags，可配置延迟、生成速度和故障注入
+
+用于压测 API 服务本身的开销（结果可复现，不受模型速度影响）：
+
+    python fake_ollama_server.py --port 11435 --ttft-ms 200 --tokens-per-s 30
+    OLLAMA_HOST=127.0.0.1:11435 uvicorn services.rag_api.app.main:app --port 8000
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from config import EMBED_MODEL, LLM_MODEL
+from fake_backend import FAKE_EMBED_DIM, fake_answer, fake_embedding
+
+
+class FakeOllamaConfig:
+    """替身服务的行为参数"""
+
+    def __init__(
+        self,
+        dim: int = FAKE_EMBED_DIM,
+        embed_latency: float = 0.0,
+        embed_item_latency: float = 0.0,
+        ttft: float = 0.0,
+        prefill_chars_per_s: float = 0.0,
+        tokens_per_s: float = 0.0,
+        answer_chars: int = 200,
+        chunk_chars: int = 4,
+        failure_rate: float = 0.0,
+        stream_failure_rate: float = 0.0,
+        parallel: int = 0,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            dim: 向量维度
+            embed_latency: 每次 embed 请求的固定延迟（秒）
+            embed_item_latency: embed 每条文本的额外延迟（秒）
+            ttft: chat 首 token 的固定延迟（秒）
+            prefill_chars_per_s: 预填充速度（提示词字符/秒），> 0 时首 token 延迟随提示词长度增加
+            tokens_per_s: 生成速度（流式 chunk/秒），0 表示不限速
+            answer_chars: 回答长度（字符数）
+            chunk_chars: 每个流式 chunk 的字符数（约等于一个 token）
+            failure_rate: 请求直接返回 500 的概率
+            stream_failure_rate: 流式响应中途断开连接的概率
+            parallel: 同时处理的 chat 请求数（模拟 OLLAMA_NUM_PARALLEL），0 表示不限制，超出的请求排队
+            seed: 故障注入的随机种子
+        """
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.ttft = ttft
+        self.prefill_chars_per_s = prefill_chars_per_s
+        self.tokens_per_s = tokens_per_s
+        self.answer_chars = answer_chars
+        self.chunk_chars = max(1, chunk_chars)
+        self.failure_rate = failure_rate
+        self.stream_failure_rate = stream_failure_rate
+        self.parallel = parallel
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def roll(self, p: float) -> bool:
+        if p <= 0:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < p
+
+    def randrange(self, n: int) -> int:
+        with self.rng_lock:
+            return self.rng.randrange(n)
+
+
+class FakeOllamaStats:
+    """请求计数（/_stats 查看）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def inc(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Ollama HTTP 协议的最小实现（流式响应为分块传输的 NDJSON）"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOllama/0.1"
+
+    # 由 make_server 设置
+    config: FakeOllamaConfig
+    stats: FakeOllamaStats
+    chat_slots: Optional[threading.Semaphore]
+    models: List[str]
+
+    def log_message(self, format, *args):
+        pass  # 压测时逐条打印请求会拖慢服务
+
+    # ---------- 响应工具 ----------
+    def _send_json(self, data: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _write_chunk(self, data: Dict[str, Any]) -> None:
+        line = json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    # ---------- 路由 ----------
+    def do_GET(self):
+        if self.path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": m, "model": m} for m in self.models]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/_stats":
+            self._send_json(self.stats.snapshot())
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        try:
+            req = self._read_json()
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, status=400)
+            return
+        route = {"/api/embed": self._embed, "/api/embeddings": self._embeddings, "/api/chat": self._chat}.get(self.path)
+        if route is None:
+            self._send_json({"error": "not found"}, status=404)
+            return
+        self.stats.inc(f"requests{self.path.replace('/', '_')}")
+        if self.config.roll(self.config.failure_rate):
+            self.stats.inc("injected_failures")
+            self._send_json({"error": "injected failure"}, status=500)
+            return
+        route(req)
+
+    # ---------- /api/embed ----------
+    def _embed(self, req: Dict[str, Any]) -> None:
+        texts = req.get("input") or ""
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        t0 = time.perf_counter()
+        delay = self.config.embed_latency + self.config.embed_item_latency * len(texts)
+        if delay:
+            time.sleep(delay)
+        vectors = [fake_embedding(t, self.config.dim) for t in texts]
+        self.stats.inc("embedded_texts", len(texts))
+        self._send_json({
+            "model": req.get("model", ""),
+            "embeddings": vectors,
+            "total_duration": int((time.perf_counter() - t0) * 1e9),
+            "prompt_eval_count": sum(len(t) for t in texts),
+        })
+
+    def _embeddings(self, req: Dict[str, Any]) -> None:
+        """旧版接口：单条 prompt"""
+        if self.config.embed_latency:
+            time.sleep(self.config.embed_latency)
+        self._send_json({"embedding": fake_embedding(req.get("prompt", ""), self.config.dim)})
+
+    # ---------- /api/chat ----------
+    def _chat(self, req: Dict[str, Any]) -> None:
+        cfg = self.config
+        model = req.get("model", "")
+        messages = req.get("messages") or []
+        answer = fake_answer(messages, cfg.answer_chars)
+        chunks = [answer[i:i + cfg.chunk_chars] for i in range(0, len(answer), cfg.chunk_chars)]
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        prefill = cfg.ttft + (prompt_chars / cfg.prefill_chars_per_s if cfg.prefill_chars_per_s > 0 else 0.0)
+        interval = 1.0 / cfg.tokens_per_s if cfg.tokens_per_s > 0 else 0.0
+
+        if self.chat_slots is not None:
+            self.chat_slots.acquire()
+        try:
+            t0 = time.perf_counter()
+            time.sleep(prefill)
+            t_eval = time.perf_counter()
+            if not req.get("stream", True):
+                time.sleep(interval * len(chunks))
+                self.stats.inc("tokens_generated", len(chunks))
+                self._send_json(self._final(model, answer, t0, t_eval, len(chunks), prompt_chars))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            fail_at = cfg.randrange(len(chunks) + 1) if cfg.roll(cfg.stream_failure_rate) else None
+            sent = 0
+            try:
+                for i, c in enumerate(chunks):
+                    if i == fail_at:
+                        # 模拟模型进程崩溃：不发结束块直接断开
+                        self.stats.inc("injected_stream_failures")
+                        self.close_connection = True
+                        return
+                    self._write_chunk({
+                        "model": model, "created_at": _now(),
+                        "message": {"role": "assistant", "content": c}, "done": False,
+                    })
+                    sent += 1
+                    if interval:
+                        time.sleep(interval)
+                self._write_chunk(self._final(model, "", t0, t_eval, len(chunks), prompt_chars))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前断开（如 API 服务取消了生成）
+                self.stats.inc("cancelled_streams")
+                self.close_connection = True
+            finally:
+                self.stats.inc("tokens_generated", sent)
+        finally:
+            if self.chat_slots is not None:
+                self.chat_slots.release()
+
+    @staticmethod
+    def _final(model: str, content: str, t0: float, t_eval: float, n_tokens: int, prompt_chars: int) -> Dict[str, Any]:
+        now = time.perf_counter()
+        return {
+            "model": model, "created_at": _now(),
+            "message": {"role": "assistant", "content": content},
+            "done": True, "done_reason": "stop",
+            "total_duration": int((now - t0) * 1e9),
+            "prompt_eval_count": prompt_chars,
+            "prompt_eval_duration": int((t_eval - t0) * 1e9),
+            "eval_count": n_tokens,
+            "eval_duration": int((now - t_eval) * 1e9),
+        }
+
+
+def make_server(host: str, port: int, config: FakeOllamaConfig, models: List[str]) -> ThreadingHTTPServer:
+    """创建替身服务（每个连接一个线程）"""
+    handler = type("Handler", (FakeOllamaHandler,), {
+        "config": config,
+        "stats": FakeOllamaStats(),
+        "chat_slots": threading.Semaphore(config.parallel) if config.parallel > 0 else None,
+        "models": models,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama-compatible stand-in server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=FAKE_EMBED_DIM, help="embedding dimension")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embed-item-latency-ms", type=float, default=0.0)
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="fixed time to first token")
+    parser.add_argument("--prefill-chars-per-s", type=float, default=0.0,
+                        help="add prompt_chars / rate to the time to first token (0 = off)")
+    parser.add_argument("--tokens-per-s", type=float, default=30.0, help="generation speed (0 = unlimited)")
+    parser.add_argument("--answer-chars", type=int, default=200)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability of an HTTP 500")
+    parser.add_argument("--stream-failure-rate", type=float, default=0.0,
+                        help="probability of dropping a chat stream midway")
+    parser.add_argument("--parallel", type=int, default=0, help="concurrent chat requests (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--models", nargs="+", default=[EMBED_MODEL, LLM_MODEL], help="names reported by /api/tags")
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        dim=args.dim,
+        embed_latency=args.embed_latency_ms / 1000,
+        embed_item_latency=args.embed_item_latency_ms / 1000,
+        ttft=args.ttft_ms / 1000,
+        prefill_chars_per_s=args.prefill_chars_per_s,
+        tokens_per_s=args.tokens_per_s,
+        answer_chars=args.answer_chars,
+        failure_rate=args.failure_rate,
+        stream_failure_rate=args.stream_failure_rate,
+        parallel=args.parallel,
+        seed=args.seed,
+    )
+    server = make_server(args.host, args.port, config, args.models)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port} (set OLLAMA_HOST={args.host}:{args.port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
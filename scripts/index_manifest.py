@@ -0,0 +1,224 @@
+"""索引清单模块 - 记录每页内容哈希与 chunk ID（增量重建），以及构建检查点（断点续跑）"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+
+def content_hash(text: str) -> str:
+    """计算文本内容哈希"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """计算文件内容哈希（按块读取，避免一次性读入大文件）"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IndexManifest:
+    """
+    索引清单（JSON 文件，默认存放在 CHROMA_DIR 旁边）
+
+    结构：
+        {
+          "params": {...},               # 影响切分/向量的参数，变化后所有页都视为已修改
+          "sources": {
+            "妇产科学.pdf": {
+              "file_hash": "...",
+              "pages": {"12": {"hash": "...", "ids": ["妇产科学_p12_c0", ...]}}
+            }
+          }
+        }
+    """
+
+    def __init__(self, path: str, params: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            path: 清单文件路径
+            params: 当前构建参数（chunk 大小、分句后端、embedding 模型等）
+        """
+        self.path = Path(path)
+        self.params = params or {}
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"Failed to read manifest {self.path}: {e}, starting fresh")
+            return
+
+        self.sources = data.get("sources", {})
+        if data.get("params") != self.params:
+            print("Index parameters changed, all pages will be re-indexed")
+            self.invalidate()
+
+    def save(self) -> None:
+        """原子写入清单文件"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(
+            json.dumps(
+                {"params": self.params, "sources": self.sources},
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+
+    def invalidate(self) -> None:
+        """
+        让所有页都视为已修改（全量重建时使用）
+
+        保留旧 chunk ID，用于删除重建后不再生成的过期 chunk。
+        """
+        for entry in self.sources.values():
+            entry["file_hash"] = None
+            for page in entry.get("pages", {}).values():
+                page["hash"] = None
+
+    def file_unchanged(self, source: str, fhash: str) -> bool:
+        """整本书文件内容是否与上次索引时一致"""
+        entry = self.sources.get(source)
+        return bool(entry) and entry.get("file_hash") == fhash
+
+    def page_hashes(self, source: str) -> Dict[int, str]:
+        """上次索引时每页的内容哈希"""
+        pages = self.sources.get(source, {}).get("pages", {})
+        return {int(p): v["hash"] for p, v in pages.items() if v.get("hash")}
+
+    def page_ids(self, source: str) -> Dict[int, List[str]]:
+        """上次索引时每页生成的 chunk ID"""
+        pages = self.sources.get(source, {}).get("pages", {})
+        return {int(p): v.get("ids", []) for p, v in pages.items()}
+
+    def update_source(
+        self,
+        source: str,
+        fhash: str,
+        pages: Dict[int, Dict[str, Any]]
+    ) -> None:
+        """
+        记录一本书的最新索引状态
+
+        Args:
+            source: 书名
+            fhash: 文件哈希
+            pages: {页码: {"hash": 内容哈希, "ids": [chunk ID, ...]}}，包含全部页
+        """
+        self.sources[source] = {
+            "file_hash": fhash,
+            "pages": {str(p): v for p, v in sorted(pages.items())},
+        }
+
+
+class BuildCheckpoint:
+    """
+    构建检查点（JSONL 追加写入）：记录每批已写入向量库的 chunk ID
+
+    构建中途失败（例如 Ollama 在第 900 批出错）后，带 --resume 重新运行时，
+    已写入的 chunk 会被跳过，不再重新生成 embedding。
+
+    文件格式：
+        {"params": {...}}                                     # 第一行
+        {"source": "妇产科学.pdf", "file_hash": "...", "ids": [...]}  # 每批一行
+    """
+
+    def __init__(self, path: str, params: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            path: 检查点文件路径
+            params: 当前构建参数，与检查点中记录的不一致时，旧检查点作废
+        """
+        self.path = Path(path)
+        self.params = params or {}
+        self.file_hashes: Dict[str, str] = {}
+        self._committed: Dict[Tuple[str, str], Set[str]] = {}
+        self._fh = None
+
+    def load(self) -> None:
+        """读取已有检查点（--resume 时调用）"""
+        self._committed = {}
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if not lines:
+            return
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            print(f"Corrupted checkpoint {self.path}, ignoring")
+            return
+        if header.get("params") != self.params:
+            print("Index parameters changed since the checkpoint was written, ignoring it")
+            return
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 进程被杀死时最后一行可能不完整
+                continue
+            key = (entry["source"], entry["file_hash"])
+            self._committed.setdefault(key, set()).update(entry["ids"])
+
+    def committed_ids(self, source: str, fhash: str) -> Set[str]:
+        """某本书（同一文件内容）已写入的 chunk ID"""
+        return self._committed.get((source, fhash), set())
+
+    def start(self, keep: bool = False) -> None:
+        """
+        打开检查点文件准备追加
+
+        Args:
+            keep: True 时保留已有记录（续跑），否则清空重写
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if keep and self._committed:
+            self._fh = open(self.path, "a", encoding="utf-8")
+            # 上次中断时最后一行可能不完整，先补换行
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._fh.write("\n")
+            return
+        self._fh = open(self.path, "w", encoding="utf-8")
+        self._write({"params": self.params})
+
+    def record(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """记录一批已写入的 chunk（按 source 分组）"""
+        by_source: Dict[str, List[str]] = {}
+        for cid, meta in zip(ids, metadatas):
+            by_source.setdefault(meta["source"], []).append(cid)
+        for source, source_ids in by_source.items():
+            self._write({
+                "source": source,
+                "file_hash": self.file_hashes.get(source),
+                "ids": source_ids,
+            })
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        self._fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def finish(self) -> None:
+        """构建成功完成：删除检查点"""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
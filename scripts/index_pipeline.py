@@ -0,0 +1,163 @@
+"""流式索引流水线 - extract/clean/split/chunk → embed → upsert 三段并发，段间为有界队列"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# 流水线结束标记
+_END = object()
+
+
+class PipelineStopped(Exception):
+    """流水线因其他阶段出错而停止"""
+
+
+class IndexPipeline:
+    """
+    三段流水线，每段一个线程（upsert 在调用线程中执行）：
+
+        produce（遍历事件：提取/清洗/分句/切分）
+          → [chunk 队列] → embed（攒够 batch_size 个 chunk 生成一次向量）
+          → [向量队列]   → upsert（写入向量库）
+
+    上游事件：
+        ("chunks", ids, docs, metas)   一批新 chunk（通常是一个页区间）
+        (其他类型, ...)                 控制事件（如一本书处理完），
+                                        会在前面的 chunk 全部 upsert 之后按顺序交给 on_event
+
+    队列有界，峰值内存只取决于 batch_size 和 queue_size，与文档大小无关；
+    第一批 chunk 生成向量后立即写入，无需等整本书处理完。
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        upsert_fn: Callable[[List[str], List[str], List[List[float]], List[Dict[str, Any]]], None],
+        on_event: Optional[Callable[[Tuple], None]] = None,
+        batch_size: int = 256,
+        queue_size: int = 4
+    ):
+        """
+        Args:
+            embed_fn: 文本列表 -> 向量列表
+            upsert_fn: (ids, docs, vectors, metas) -> None
+            on_event: 控制事件回调（在 upsert 线程中按顺序调用）
+            batch_size: 每次 embed/upsert 的 chunk 数
+            queue_size: 段间队列的最大长度
+        """
+        self.embed_fn = embed_fn
+        self.upsert_fn = upsert_fn
+        self.on_event = on_event or (lambda event: None)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    # ---------- 队列工具：出错时其他阶段能及时退出 ----------
+    def _put(self, q: queue.Queue, item: Any) -> None:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise PipelineStopped()
+
+    def _fail(self, e: BaseException) -> None:
+        if not isinstance(e, PipelineStopped):
+            self._errors.append(e)
+        self._stop.set()
+
+    # ---------- 各阶段 ----------
+    def _produce(self, events: Iterable[Tuple], out: queue.Queue) -> None:
+        try:
+            for event in events:
+                self._put(out, event)
+            self._put(out, _END)
+        except BaseException as e:
+            self._fail(e)
+
+    def _embed(self, inp: queue.Queue, out: queue.Queue) -> None:
+        ids: List[str] = []
+        docs: List[str] = []
+        metas: List[Dict[str, Any]] = []
+
+        def flush(n: int) -> None:
+            batch = (ids[:n], docs[:n], metas[:n])
+            del ids[:n], docs[:n], metas[:n]
+            vectors = self.embed_fn(batch[1])
+            self._put(out, ("upsert", batch[0], batch[1], vectors, batch[2]))
+
+        try:
+            while True:
+                event = self._get(inp)
+                if event is _END:
+                    if docs:
+                        flush(len(docs))
+                    self._put(out, _END)
+                    return
+
+                if event[0] == "chunks":
+                    _, e_ids, e_docs, e_metas = event
+                    ids.extend(e_ids)
+                    docs.extend(e_docs)
+                    metas.extend(e_metas)
+                    while len(docs) >= self.batch_size:
+                        flush(self.batch_size)
+                else:
+                    # 控制事件之前的 chunk 必须先写完
+                    if docs:
+                        flush(len(docs))
+                    self._put(out, event)
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self, events: Iterable[Tuple]) -> None:
+        """
+        运行流水线，直到所有事件处理完毕
+
+        Args:
+            events: 上游事件迭代器（在独立线程中遍历）
+
+        Raises:
+            任一阶段抛出的第一个异常
+        """
+        chunk_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        vector_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._produce, args=(events, chunk_q), name="index-produce", daemon=True),
+            threading.Thread(target=self._embed, args=(chunk_q, vector_q), name="index-embed", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                item = self._get(vector_q)
+                if item is _END:
+                    break
+                if item[0] == "upsert":
+                    _, ids, docs, vectors, metas = item
+                    self.upsert_fn(ids, docs, vectors, metas)
+                else:
+                    self.on_event(item)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+
+        if self._errors:
+            raise self._errors[0]
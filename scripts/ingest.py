@@ -0,0 +1,237 @@
+"""索引构建辅助模块 - 按页区间提取、清洗、分句和切分（支持多进程并行）"""
+
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Tuple, Optional
+
+from pdf_parser import count_pages, extract_pages, clean_text
+from index_manifest import content_hash
+from text_splitter import split_sentences, split_pages, chunk_by_sentences
+
+
+# 单页处理的各个阶段（用于统计吞吐）
+STAGES = ("extract", "clean", "split", "chunk")
+
+
+class StageStats:
+    """统计各阶段耗时，并换算成 pages/s"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.pages = 0
+
+    def add(self, result: Dict[str, Any]) -> None:
+        """累加 process_page_range 返回的统计信息"""
+        self.pages += result["n_pages"]
+        for stage, sec in result["timings"].items():
+            self.seconds[stage] += sec
+
+    def merge(self, other: "StageStats") -> None:
+        """合并另一份统计"""
+        self.pages += other.pages
+        for stage, sec in other.seconds.items():
+            self.seconds[stage] += sec
+
+    def rates(self) -> Dict[str, float]:
+        """各阶段单进程吞吐（pages/s）"""
+        return {
+            stage: (self.pages / sec if sec > 0 else float("inf"))
+            for stage, sec in self.seconds.items()
+        }
+
+    def report(self, prefix: str = "  ") -> None:
+        """打印各阶段吞吐"""
+        for stage, rate in self.rates().items():
+            print(
+                f"{prefix}{stage:<8} {rate:10.1f} pages/s per worker "
+                f"({self.seconds[stage]:.2f}s total)"
+            )
+
+
+def process_page_range(
+    pdf_path: str,
+    start: int = 0,
+    end: Optional[int] = None,
+    max_chars: int = 900,
+    overlap_sents: int = 2,
+    split_batch_size: int = 64,
+    splitter_backend: str = "hanlp",
+    known_hashes: Optional[Dict[int, str]] = None
+) -> Dict[str, Any]:
+    """
+    处理一个页区间：提取 → 清洗 → 分句 → 切分
+
+    每次调用都会自己打开 PyMuPDF 文档句柄，因此可以直接在子进程中运行。
+
+    Args:
+        pdf_path: PDF 文件路径
+        start: 起始页索引（包含）
+        end: 结束页索引（不包含），None 表示到最后一页
+        max_chars: 每个 chunk 的最大字符数
+        overlap_sents: 相邻 chunk 之间的重叠句子数
+        split_batch_size: 批量分句时每批的页数，<= 1 时逐页调用分句器
+        splitter_backend: 分句后端（"hanlp" / "rule"）
+        known_hashes: {页码: 上次索引时的内容哈希}，哈希一致的页跳过分句和切分
+
+    Returns:
+        {"pages": [{"page": 页码, "hash": 内容哈希, "chunks": [...]}, ...],
+         "timings": 各阶段耗时, "n_pages": 页数}
+        未变化页的 "chunks" 为 None
+    """
+    known_hashes = known_hashes or {}
+    timings = dict.fromkeys(STAGES, 0.0)
+
+    t = time.perf_counter()
+    raw_pages = extract_pages(pdf_path, start, end)
+    timings["extract"] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    cleaned = [{"page": p["page"], "text": clean_text(p["text"])} for p in raw_pages]
+    for p in cleaned:
+        p["hash"] = content_hash(p["text"])
+    timings["clean"] += time.perf_counter() - t
+
+    unchanged = [p for p in cleaned if known_hashes.get(p["page"]) == p["hash"]]
+    changed = [p for p in cleaned if known_hashes.get(p["page"]) != p["hash"]]
+
+    t = time.perf_counter()
+    if split_batch_size > 1:
+        split = split_pages(
+            changed,
+            batch_size=split_batch_size,
+            backend=splitter_backend
+        )
+    else:
+        split = [
+            {
+                "page": p["page"],
+                "sentences": split_sentences(p["text"], backend=splitter_backend)
+                if p["text"] else [],
+            }
+            for p in changed
+        ]
+    timings["split"] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    pages = [
+        {
+            "page": p["page"],
+            "hash": c["hash"],
+            "chunks": chunk_by_sentences(
+                p["sentences"],
+                max_chars=max_chars,
+                overlap_sents=overlap_sents
+            ),
+        }
+        for p, c in zip(split, changed)
+    ]
+    timings["chunk"] += time.perf_counter() - t
+
+    pages.extend({"page": p["page"], "hash": p["hash"], "chunks": None} for p in unchanged)
+    pages.sort(key=lambda p: p["page"])
+
+    return {"pages": pages, "timings": timings, "n_pages": len(raw_pages)}
+
+
+def iter_page_ranges(
+    pdf_paths: List[str],
+    workers: int = 1,
+    pages_per_task: int = 32,
+    max_chars: int = 900,
+    overlap_sents: int = 2,
+    split_batch_size: int = 64,
+    splitter_backend: str = "hanlp",
+    known_hashes: Optional[Dict[str, Dict[int, str]]] = None,
+    max_inflight: Optional[int] = None
+) -> Iterator[Tuple[str, Dict[str, Any], bool]]:
+    """
+    按 (文档顺序, 页码) 逐个页区间产出处理结果
+
+    结果是惰性产生的：每次只处理 pages_per_task 页，内存占用与文档大小无关。
+    workers > 1 时，页区间（跨文档）被提交到进程池，最多同时在途 max_inflight 个，
+    当前区间被下游消费时，后续区间（包括下一本书）已经在其他核上处理。
+    产出顺序与单进程模式完全一致。
+
+    Args:
+        pdf_paths: PDF 文件路径列表
+        workers: 进程数，<= 1 时在当前进程串行处理
+        pages_per_task: 每个任务处理的页数
+        max_chars: 每个 chunk 的最大字符数
+        overlap_sents: 相邻 chunk 之间的重叠句子数
+        split_batch_size: 批量分句时每批的页数，<= 1 时逐页分句（批次不跨任务，最多 pages_per_task 页）
+        splitter_backend: 分句后端（"hanlp" / "rule"）
+        known_hashes: {pdf_path: {页码: 内容哈希}}，用于跳过未变化的页
+        max_inflight: 进程池中最多同时在途的任务数，默认 workers * 2
+
+    Yields:
+        (pdf_path, result, is_last_range)，result 为 process_page_range 的返回值
+    """
+    known_hashes = known_hashes or {}
+
+    def tasks():
+        for pdf_path in pdf_paths:
+            pdf_path = str(pdf_path)
+            n_pages = count_pages(pdf_path)
+            hashes = known_hashes.get(pdf_path, {})
+            starts = list(range(0, n_pages, pages_per_task)) or [0]
+            for start in starts:
+                end = min(start + pages_per_task, n_pages)
+                args = (
+                    pdf_path, start, end, max_chars, overlap_sents,
+                    split_batch_size, splitter_backend,
+                    {page: h for page, h in hashes.items() if start < page <= end},
+                )
+                yield pdf_path, args, start == starts[-1]
+
+    if workers <= 1:
+        for pdf_path, args, is_last in tasks():
+            yield pdf_path, process_page_range(*args), is_last
+        return
+
+    max_inflight = max_inflight or workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for pdf_path, args, is_last in tasks():
+            pending.append((pdf_path, pool.submit(process_page_range, *args), is_last))
+            if len(pending) >= max_inflight:
+                pdf_path, future, is_last = pending.popleft()
+                yield pdf_path, future.result(), is_last
+        while pending:
+            pdf_path, future, is_last = pending.popleft()
+            yield pdf_path, future.result(), is_last
+
+
+def build_records(
+    pdf_path: str,
+    pages: List[Dict[str, Any]]
+) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """
+    把页处理结果转换成 ChromaDB 需要的 ids / documents / metadatas
+
+    Args:
+        pdf_path: PDF 文件路径
+        pages: process_page_range 产出的页列表（按页码排序），未变化的页会被跳过
+
+    Returns:
+        (ids, docs, metas)
+    """
+    book_name = Path(pdf_path).name
+
+    ids, docs, metas = [], [], []
+    for p in pages:
+        for ci, chunk in enumerate(p["chunks"] or []):
+            ids.append(chunk_id(pdf_path, p["page"], ci))
+            docs.append(chunk)
+            metas.append({
+                "source": book_name,
+                "page": p["page"],
+                "chunk": ci,
+            })
+    return ids, docs, metas
+
+
+def chunk_id(pdf_path: str, page: int, chunk: int) -> str:
+    """chunk ID 规则：{文件名}_p{页码}_c{块序号}"""
+    return f"{Path(pdf_path).stem}_p{page}_c{chunk}"
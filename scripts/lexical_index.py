@@ -0,0 +1,257 @@
+"""词法索引模块 - 中文字符二元组倒排索引 + BM25 打分（与向量检索做融合）"""
+
+import math
+import os
+import pickle
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 分词规则变化时递增，旧索引文件会被丢弃重建
+TOKENIZER_VERSION = 1
+
+# 连续的“词单元”：英文/数字串或单个汉字；其他字符（标点、空白）为分隔
+_RUN = re.compile(r"(?:[a-z0-9]+|[\u3400-\u9fff])+")
+_UNIT = re.compile(r"[a-z0-9]+|[\u3400-\u9fff]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：汉字取相邻二元组，英文/数字串整体作为一个词，并与相邻汉字组成二元组
+
+    例如 "HPV 9价疫苗" -> ["hpv", "9", "9价", "价疫", "疫苗"]
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens: List[str] = []
+    for run in _RUN.finditer(text):
+        run = run.group()
+        if not any(c.isascii() for c in run):
+            # 纯汉字：直接切片取二元组
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            continue
+        units = _UNIT.findall(run)
+        if len(units) == 1:
+            tokens.append(units[0])
+            continue
+        tokens.extend(u for u in units if u.isascii())
+        tokens.extend(a + b for a, b in zip(units, units[1:]))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引
+
+    - 正排（增删时使用）：chunk ID -> (词 ID 数组, 词频数组)
+    - 倒排（检索时使用）：按词 ID 排列的 CSR 数组，检索时只需切片 + bincount，
+      增删后在下一次检索/保存时由正排统一重建
+    - 持久化保存倒排数组（pickle），加载时不需要重新分词或逐条构建
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            path: 索引文件路径，存在时自动加载
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+        """
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+
+        self._vocab: Dict[str, int] = {}
+        self._terms: List[str] = []
+        # 正排；从文件加载后为 None，第一次增删时由倒排还原
+        self._docs: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = {}
+        # 倒排（CSR）：词 t 的倒排为 post_doc/post_tf[ptr[t]:ptr[t+1]]
+        self._doc_ids: List[str] = []
+        self._doc_len = np.zeros(0, dtype=np.int32)
+        self._ptr = np.zeros(1, dtype=np.int64)
+        self._post_doc = np.zeros(0, dtype=np.int32)
+        self._post_tf = np.zeros(0, dtype=np.int32)
+        self._post_w = np.zeros(0, dtype=np.float32)
+        self._dirty = False
+
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    # ---------- 持久化 ----------
+    def _load(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            print(f"Failed to read lexical index {self.path}: {e}, starting fresh")
+            return
+        if data.get("version") != TOKENIZER_VERSION:
+            print("Lexical index tokenizer changed, index will be rebuilt")
+            return
+
+        self._terms = data["terms"]
+        self._vocab = {t: i for i, t in enumerate(self._terms)}
+        self._doc_ids = data["doc_ids"]
+        self._doc_len = data["doc_len"]
+        self._ptr = data["ptr"]
+        self._post_doc = data["post_doc"]
+        self._post_tf = data["post_tf"]
+        self._docs = None
+        self._compute_weights()
+
+    def save(self) -> None:
+        """原子写入索引文件"""
+        if self.path is None:
+            return
+        if self._dirty:
+            self._freeze()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                {
+                    "version": TOKENIZER_VERSION,
+                    "terms": self._terms,
+                    "doc_ids": self._doc_ids,
+                    "doc_len": self._doc_len,
+                    "ptr": self._ptr,
+                    "post_doc": self._post_doc,
+                    "post_tf": self._post_tf,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, self.path)
+
+    # ---------- 正排 <-> 倒排 ----------
+    def _thaw(self) -> None:
+        """由倒排还原正排（加载后第一次增删时调用）"""
+        if self._docs is not None:
+            return
+        n_terms = len(self._ptr) - 1
+        post_term = np.repeat(np.arange(n_terms, dtype=np.int32), np.diff(self._ptr))
+        order = np.argsort(self._post_doc, kind="stable")
+        splits = np.cumsum(np.bincount(self._post_doc, minlength=len(self._doc_ids)))[:-1]
+        self._docs = dict(zip(
+            self._doc_ids,
+            zip(np.split(post_term[order], splits), np.split(self._post_tf[order], splits)),
+        ))
+
+    def _freeze(self) -> None:
+        """由正排重建倒排"""
+        self._doc_ids = list(self._docs)
+        entries = list(self._docs.values())
+        n_terms = len(self._terms)
+        if entries:
+            tids = np.concatenate([e[0] for e in entries])
+            tfs = np.concatenate([e[1] for e in entries])
+            lens = np.array([len(e[0]) for e in entries])
+        else:
+            tids = tfs = np.zeros(0, dtype=np.int32)
+            lens = np.zeros(0, dtype=np.int64)
+        docs = np.repeat(np.arange(len(entries), dtype=np.int32), lens)
+        order = np.argsort(tids, kind="stable")
+
+        self._doc_len = np.array([int(e[1].sum()) for e in entries], dtype=np.int32)
+        self._ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        self._ptr[1:] = np.cumsum(np.bincount(tids, minlength=n_terms))
+        self._post_doc = docs[order]
+        self._post_tf = tfs[order].astype(np.int32)
+        self._compute_weights()
+        self._dirty = False
+
+    def _compute_weights(self) -> None:
+        """BM25 的词频部分：tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))"""
+        avgdl = float(self._doc_len.mean()) if len(self._doc_len) else 1.0
+        norm = self.k1 * (1 - self.b + self.b * self._doc_len / avgdl)
+        tf = self._post_tf.astype(np.float32)
+        self._post_w = (tf * (self.k1 + 1) / (tf + norm[self._post_doc])).astype(np.float32)
+
+    # ---------- 增量更新 ----------
+    def add_documents(self, ids: List[str], documents: List[str]) -> None:
+        """添加（或替换同 ID 的）文档"""
+        self._thaw()
+        for doc_id, doc in zip(ids, documents):
+            counts = Counter(tokenize(doc))
+            tids = []
+            for term in counts:
+                tid = self._vocab.get(term)
+                if tid is None:
+                    tid = self._vocab[term] = len(self._terms)
+                    self._terms.append(term)
+                tids.append(tid)
+            self._docs[doc_id] = (
+                np.array(tids, dtype=np.int32),
+                np.array(list(counts.values()), dtype=np.int32),
+            )
+        self._dirty = True
+
+    def delete_documents(self, ids: Iterable[str]) -> None:
+        """删除文档（不存在的 ID 忽略）"""
+        self._thaw()
+        for doc_id in ids:
+            if self._docs.pop(doc_id, None) is not None:
+                self._dirty = True
+
+    def clear(self) -> None:
+        self._vocab, self._terms = {}, []
+        self._docs = {}
+        self._dirty = True
+
+    # ---------- 检索 ----------
+    def search(self, query: str, top_n: int = 10) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_n: 返回结果数量
+
+        Returns:
+            [(chunk ID, BM25 分数), ...]，按分数从高到低
+        """
+        if self._dirty:
+            self._freeze()
+        n_docs = len(self._doc_ids)
+        docs, weights = [], []
+        for term in set(tokenize(query)):
+            tid = self._vocab.get(term)
+            if tid is None:
+                continue
+            lo, hi = self._ptr[tid], self._ptr[tid + 1]
+            if lo == hi:
+                continue
+            df = hi - lo
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            docs.append(self._post_doc[lo:hi])
+            weights.append(self._post_w[lo:hi] * idf)
+        if not docs:
+            return []
+
+        scores = np.bincount(np.concatenate(docs), weights=np.concatenate(weights), minlength=n_docs)
+        k = min(top_n, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._doc_ids[i], float(scores[i])) for i in top]
+
+    def __len__(self) -> int:
+        if self._docs is not None:
+            return len(self._docs)
+        return len(self._doc_ids)
+
+    def stats(self) -> Dict[str, int]:
+        """索引统计信息"""
+        if self._dirty:
+            self._freeze()
+        return {
+            "documents": len(self._doc_ids),
+            "terms": int(np.count_nonzero(np.diff(self._ptr))),
+            "postings": len(self._post_doc),
+        }
@@ -0,0 +1,273 @@
+"""API 压测 - 按目标 RPS 向 /v1/qa 或 /v1/qa/stream 发送请求，统计 TTFT、吞吐和错误率（只用标准库）
+
+配合 fake_ollama_server.py 使用时，测到的是 API 服务本身的开销：
+
+    python loadgen.py --url http://127.0.0.1:8000 --endpoint stream --rps 10 --duration 30
+"""
+
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_QUESTIONS = [
+    "什么是细菌性阴道病？有哪些典型表现？",
+    "怀孕期间应该做哪些检查？",
+    "宫颈癌的预防方法有哪些？",
+    "子宫肌瘤需要手术吗？",
+    "多囊卵巢综合征怎么治疗？",
+    "绝经后阴道流血是什么原因？",
+    "妊娠期糖尿病对胎儿有什么影响？",
+    "痛经严重应该怎么办？",
+]
+
+
+class LoadGenerator:
+    """
+    开环压测：按计划时间发出请求，不等待前一个请求完成
+
+    延迟从计划发出时间开始计算，客户端线程不足导致的排队也计入延迟（避免协调遗漏）。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        endpoint: str = "qa",
+        top_k: int = 6,
+        timeout: float = 120.0,
+        max_inflight: int = 256
+    ):
+        """
+        Args:
+            url: API 服务地址，如 http://127.0.0.1:8000
+            endpoint: "qa"（/v1/qa）或 "stream"（/v1/qa/stream）
+            top_k: 请求中的 top_k
+            timeout: 单个请求超时（秒）
+            max_inflight: 最多同时在途的请求数（客户端线程数）
+        """
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.path = "/v1/qa/stream" if endpoint == "stream" else "/v1/qa"
+        self.stream = endpoint == "stream"
+        self.top_k = top_k
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        """每个线程复用一个 keep-alive 连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _reset_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def request(self, question: str, scheduled: float) -> Dict[str, Any]:
+        """
+        发送一个请求
+
+        Returns:
+            {"ok", "status", "error", "latency", "ttft", "chunks", "cached", "coalesced"}，
+            时间从 scheduled（计划发出时间）开始计算
+        """
+        result: Dict[str, Any] = {
+            "ok": False, "status": None, "error": None, "latency": None,
+            "ttft": None, "chunks": 0, "cached": False, "coalesced": False,
+        }
+        body = json.dumps({"question": question, "top_k": self.top_k}, ensure_ascii=False).encode("utf-8")
+        try:
+            conn = self._connection()
+            conn.request("POST", self.path, body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            result["status"] = resp.status
+            if resp.status != 200:
+                resp.read()
+                result["error"] = f"HTTP {resp.status}"
+            elif self.stream:
+                self._read_stream(resp, scheduled, result)
+            else:
+                data = json.loads(resp.read())
+                result["ttft"] = time.perf_counter() - scheduled
+                result["ok"] = True
+                result["cached"] = bool(data.get("cached"))
+                result["coalesced"] = bool(data.get("coalesced"))
+        except Exception as e:
+            result["error"] = type(e).__name__
+            self._reset_connection()
+        result["latency"] = time.perf_counter() - scheduled
+        return result
+
+    @staticmethod
+    def _read_stream(resp: http.client.HTTPResponse, scheduled: float, result: Dict[str, Any]) -> None:
+        """逐行解析 SSE：首个 chunk 事件为 TTFT，done 事件为成功，error 事件为失败"""
+        event = None
+        for raw in resp:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[5:])
+                kind = event or data.get("type")
+                if kind == "chunk":
+                    if result["ttft"] is None:
+                        result["ttft"] = time.perf_counter() - scheduled
+                    result["chunks"] += 1
+                elif kind == "done":
+                    result["ok"] = True
+                    result["cached"] = bool(data.get("cached"))
+                    result["coalesced"] = bool(data.get("coalesced"))
+                elif kind == "error":
+                    result["error"] = "stream error"
+            elif not line:
+                event = None
+        if not result["ok"] and result["error"] is None:
+            result["error"] = "stream ended without done"
+
+    def run(
+        self,
+        questions: List[str],
+        rps: float,
+        duration: float,
+        poisson: bool = False,
+        unique: bool = False,
+        seed: int = 0
+    ) -> Dict[str, Any]:
+        """
+        按目标 RPS 持续发送 duration 秒
+
+        Args:
+            questions: 问题池（轮流使用）
+            rps: 目标每秒请求数
+            duration: 持续时间（秒）
+            poisson: 到达间隔服从指数分布（否则均匀间隔）
+            unique: 给每个问题加上序号，避开语义缓存和请求合并
+            seed: 到达间隔的随机种子
+
+        Returns:
+            汇总结果（见 summarize）
+        """
+        rng = random.Random(seed)
+        results: List[Dict[str, Any]] = []
+        lock = threading.Lock()
+
+        def task(question: str, scheduled: float) -> None:
+            r = self.request(question, scheduled)
+            with lock:
+                results.append(r)
+
+        start = time.perf_counter()
+        n = 0
+        next_at = start
+        with ThreadPoolExecutor(max_workers=self.max_inflight) as pool:
+            while next_at - start < duration:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                q = questions[n % len(questions)]
+                if unique:
+                    q = f"第{n}问：{q}"
+                pool.submit(task, q, next_at)
+                n += 1
+                next_at += rng.expovariate(rps) if poisson else 1.0 / rps
+        wall = time.perf_counter() - start
+        return summarize(results, wall, rps)
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50 / p90 / p99 / max（毫秒）"""
+    if not values:
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    ms = sorted(v * 1000 for v in values)
+    if len(ms) == 1:
+        q = [ms[0]] * 99
+    else:
+        q = statistics.quantiles(ms, n=100, method="inclusive")
+    return {
+        "p50_ms": round(q[49], 1),
+        "p90_ms": round(q[89], 1),
+        "p99_ms": round(q[98], 1),
+        "max_ms": round(ms[-1], 1),
+    }
+
+
+def summarize(results: List[Dict[str, Any]], wall: float, target_rps: float) -> Dict[str, Any]:
+    ok = [r for r in results if r["ok"]]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "target_rps": target_rps,
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 2) if wall > 0 else 0.0,
+        "chunks_per_s": round(sum(r["chunks"] for r in ok) / wall, 1) if wall > 0 else 0.0,
+        "cached": sum(r["cached"] for r in ok),
+        "coalesced": sum(r["coalesced"] for r in ok),
+        "ttft": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency": percentiles([r["latency"] for r in ok]),
+    }
+
+
+def report(summary: Dict[str, Any]) -> None:
+    print(f"\n{'='*60}")
+    print(f"Requests: {summary['requests']}  ok: {summary['ok']}  "
+          f"error rate: {summary['error_rate']:.2%}  {summary['errors'] or ''}")
+    print(f"Throughput: {summary['throughput_rps']} req/s (target {summary['target_rps']}), "
+          f"{summary['chunks_per_s']} chunks/s")
+    print(f"Cached: {summary['cached']}  coalesced: {summary['coalesced']}")
+    for name in ("ttft", "latency"):
+        p = summary[name]
+        if p["p50_ms"] is None:
+            continue
+        print(f"{name:<8} p50 {p['p50_ms']:8.1f}ms  p90 {p['p90_ms']:8.1f}ms  "
+              f"p99 {p['p99_ms']:8.1f}ms  max {p['max_ms']:8.1f}ms")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the QA API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=["qa", "stream"], default="stream")
+    parser.add_argument("--rps", type=float, default=5.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send requests for")
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--questions-file", help="one question per line (default: built-in list)")
+    parser.add_argument("--unique", action="store_true",
+                        help="number each question so the answer cache and coalescing don't kick in")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--max-inflight", type=int, default=256, help="client threads")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions_file:
+        with open(args.questions_file, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    print(f"Load testing {args.url} ({args.endpoint}) at {args.rps} req/s for {args.duration}s")
+    gen = LoadGenerator(args.url, args.endpoint, top_k=args.top_k, timeout=args.timeout, max_inflight=args.max_inflight)
+    summary = gen.run(questions, args.rps, args.duration, poisson=args.poisson, unique=args.unique, seed=args.seed)
+    report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
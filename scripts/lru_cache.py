@@ -0,0 +1,203 @@
+"""内存缓存模块 - 线程安全的 LRU + TTL 缓存，以及按向量相似度命中的语义缓存"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    有界 LRU 缓存（可选 TTL），带命中统计
+
+    - 超过 capacity 时淘汰最久未使用的条目
+    - ttl 不为 None 时，条目写入 ttl 秒后过期
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: Optional[float] = None):
+        """
+        Args:
+            capacity: 最大条目数，<= 0 时不缓存
+            ttl: 过期时间（秒），None 表示不过期
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，未命中或已过期返回 None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """写入缓存"""
+        if self.capacity <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            "size": len(self._data),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+class SemanticCache:
+    """
+    语义缓存：按向量余弦相似度命中（用于问答结果缓存）
+
+    - 查询向量与某个缓存向量的余弦相似度 >= threshold，且 version / 精确匹配字段一致时命中
+    - 有界容量，LRU 淘汰；可选 TTL
+    """
+
+    def __init__(self, capacity: int = 512, threshold: float = 0.95, ttl: Optional[float] = None):
+        """
+        Args:
+            capacity: 最大条目数，<= 0 时不缓存
+            threshold: 命中所需的最小余弦相似度
+            ttl: 过期时间（秒），None 表示不过期
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids: list = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def lookup(self, vector, version: Hashable = None, **exact: Any) -> Optional[Tuple[Any, float]]:
+        """
+        查找语义相近的缓存条目
+
+        Args:
+            vector: 查询向量
+            version: 数据版本（如索引版本），不一致的条目不会命中并被清除
+            **exact: 需要精确匹配的字段（如 top_k）
+
+        Returns:
+            (缓存值, 相似度)，未命中返回 None
+        """
+        q = self._normalize(vector)
+        key = tuple(sorted(exact.items()))
+        now = time.monotonic()
+
+        with self._lock:
+            self._purge(version, now)
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[i][0] for i in self._matrix_ids])
+
+            sims = self._matrix @ q
+            for idx in np.argsort(-sims):
+                if sims[idx] < self.threshold:
+                    break
+                entry_id = self._matrix_ids[idx]
+                _, value, _, entry_key, _ = self._entries[entry_id]
+                if entry_key == key:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return value, float(sims[idx])
+            self.misses += 1
+            return None
+
+    def put(self, vector, value: Any, version: Hashable = None, **exact: Any) -> None:
+        """写入缓存"""
+        if self.capacity <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[self._next_id] = (
+                self._normalize(vector), value, version, tuple(sorted(exact.items())), expires_at
+            )
+            self._next_id += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def _purge(self, version: Hashable, now: float) -> None:
+        """清除版本不一致或已过期的条目"""
+        stale = [
+            i for i, (_, _, v, _, exp) in self._entries.items()
+            if v != version or (exp is not None and exp <= now)
+        ]
+        for i in stale:
+            del self._entries[i]
+        if stale:
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 4),
+        }
@@ -1,88 +1,310 @@
 """主入口 - 建立索引并运行问答测试"""
 
+import argparse
+import time
 from pathlib import Path
-from tqdm import tqdm
 
 from config import *
-from pdf_parser import extract_pages, clean_text
-from text_splitter import split_sentences, chunk_by_sentences
-from embeddings import batch_embed
+from ingest import StageStats, iter_page_ranges, build_records, chunk_id
+from index_pipeline import IndexPipeline
+from index_manifest import IndexManifest, BuildCheckpoint, file_hash
+from embeddings import EmbeddingCache, ConcurrentEmbedder, batch_embed, concurrent_batch_embed
 from chroma_store import ChromaStore
+from lexical_index import LexicalIndex
 from qa_bot import QABot
 
 
-def build_index(pdf_paths: list) -> None:
+def embed_documents(
+    docs: list,
+    cache=None,
+    show_progress: bool = True,
+    client=None,
+    async_client=None,
+    embedder=None
+) -> list:
+    """
+    按配置选择串行或并发 embedding，两者输出一致
+
+    Args:
+        client: 串行模式使用的同步客户端，默认使用共享的 Ollama 客户端池
+        async_client: 并发模式使用的异步客户端，默认从客户端池新建
+        embedder: 可选的 ConcurrentEmbedder（多次调用时复用事件循环、客户端和批大小估计）
+    """
+    if embedder is not None:
+        return embedder.embed(docs, show_progress=show_progress)
+    if EMBED_CONCURRENCY > 1:
+        return concurrent_batch_embed(
+            docs,
+            model=EMBED_MODEL,
+            batch_size=EMBED_BATCH_SIZE,
+            concurrency=EMBED_CONCURRENCY,
+            max_batch_size=EMBED_MAX_BATCH_SIZE,
+            target_latency=EMBED_TARGET_LATENCY,
+            max_retries=EMBED_MAX_RETRIES,
+            show_progress=show_progress,
+            cache=cache,
+            client=async_client
+        )
+    return batch_embed(
+        docs,
+        model=EMBED_MODEL,
+        batch_size=EMBED_BATCH_SIZE,
+        show_progress=show_progress,
+        cache=cache,
+        client=client
+    )
+
+
+def iter_index_events(
+    pdf_paths: list,
+    workers: int,
+    known_hashes: dict,
+    skip_ids: dict = None
+):
+    """
+    流水线上游：逐个页区间提取/清洗/分句/切分，产出 chunk 事件和每本书的结束事件
+
+    Args:
+        pdf_paths: PDF 文件路径列表
+        workers: 进程数
+        known_hashes: {pdf_path: {页码: 内容哈希}}，未变化的页跳过
+        skip_ids: {pdf_path: 已写入的 chunk ID 集合}，续跑时跳过（不重新生成 embedding）
+
+    Yields:
+        ("chunks", ids, docs, metas)
+        ("book_done", pdf_path, pages, stats)，pages 为 [{"page", "hash", "n_chunks"}]，
+        未变化页的 n_chunks 为 None
+    """
+    ranges = iter_page_ranges(
+        pdf_paths,
+        workers=workers,
+        pages_per_task=INGEST_PAGES_PER_TASK,
+        max_chars=MAX_CHARS_PER_CHUNK,
+        overlap_sents=OVERLAP_SENTENCES,
+        split_batch_size=SPLIT_BATCH_SIZE,
+        splitter_backend=SPLITTER_BACKEND,
+        known_hashes=known_hashes
+    )
+
+    skip_ids = skip_ids or {}
+    pages, stats = [], StageStats()
+    for pdf_path, result, is_last in ranges:
+        stats.add(result)
+        changed = [p for p in result["pages"] if p["chunks"] is not None]
+        ids, docs, metas = build_records(pdf_path, changed)
+        skip = skip_ids.get(pdf_path)
+        if skip:
+            keep = [i for i, cid in enumerate(ids) if cid not in skip]
+            ids = [ids[i] for i in keep]
+            docs = [docs[i] for i in keep]
+            metas = [metas[i] for i in keep]
+        if ids:
+            yield ("chunks", ids, docs, metas)
+
+        pages.extend(
+            {
+                "page": p["page"],
+                "hash": p["hash"],
+                "n_chunks": None if p["chunks"] is None else len(p["chunks"]),
+            }
+            for p in result["pages"]
+        )
+        if is_last:
+            yield ("book_done", pdf_path, pages, stats)
+            pages, stats = [], StageStats()
+
+
+def sync_lexical_index(store: ChromaStore, lexical: LexicalIndex) -> None:
+    """
+    词法索引与向量库文档数不一致时（首次启用、上次构建中断、索引文件丢失），
+    从向量库中读取全部文档重建词法索引（无需重新生成 embedding）
+    """
+    count = store.get_collection_info()["count"]
+    if len(lexical) == count:
+        return
+    print(f"Lexical index out of sync ({len(lexical)} vs {count} documents), rebuilding from the vector store")
+    lexical.clear()
+    for ids, docs in store.iter_documents():
+        lexical.add_documents(ids, docs)
+    lexical.save()
+
+
+def build_index(
+    pdf_paths: list,
+    workers: int = INGEST_WORKERS,
+    incremental: bool = True,
+    resume: bool = False,
+    client=None,
+    async_client=None
+) -> None:
     """
     从 PDF 文件构建向量索引
 
+    以流水线方式运行：提取/切分、embedding、写入向量库三段并发，段间为有界队列，
+    内存占用与文档大小无关，第一批 chunk 生成向量后即开始写入。
+
+    增量模式下，根据 MANIFEST_PATH 中记录的每页内容哈希，只对新增/修改的页
+    重新切分和生成 embedding，并删除已过期的 chunk。
+
+    每批写入后都会记录到 CHECKPOINT_PATH；构建中途失败时，带 resume=True 重新运行
+    会跳过已写入的 chunk，从最后提交的批次之后继续。
+
+    同时维护 LEXICAL_INDEX_PATH 中的 BM25 词法索引（与向量库同步增量更新）。
+
     Args:
         pdf_paths: PDF 文件路径列表
+        workers: 提取/分句/切分使用的进程数，<= 1 时单进程串行处理
+        incremental: 是否增量构建；False 时忽略清单，全部重新处理
+        resume: 是否从上次失败的检查点继续
+        client / async_client: 可选的 embedding 客户端（见 embed_documents），
+            基准测试时注入离线替身
     """
     store = ChromaStore(
         persist_dir=str(CHROMA_DIR),
-        collection_name=COLLECTION_NAME
+        collection_name=COLLECTION_NAME,
+        max_batch_items=CHROMA_MAX_BATCH_ITEMS,
+        max_batch_bytes=CHROMA_MAX_BATCH_BYTES,
+        background=CHROMA_BACKGROUND_UPSERT
+    )
+    params = {
+        "embed_model": EMBED_MODEL,
+        "max_chars": MAX_CHARS_PER_CHUNK,
+        "overlap_sents": OVERLAP_SENTENCES,
+        "splitter": SPLITTER_BACKEND,
+    }
+    manifest = IndexManifest(str(MANIFEST_PATH), params=params)
+    checkpoint = BuildCheckpoint(str(CHECKPOINT_PATH), params=params)
+    cache = (
+        EmbeddingCache(str(EMBED_CACHE_PATH), max_entries=EMBED_CACHE_MAX_ENTRIES)
+        if EMBED_CACHE_PATH else None
     )
+    collection_empty = store.get_collection_info()["count"] == 0
+    if resume and not collection_empty:
+        checkpoint.load()
+    if not incremental or collection_empty:
+        # 全量模式，或向量库已被清空：所有页重新处理
+        manifest.invalidate()
+
+    lexical = LexicalIndex(str(LEXICAL_INDEX_PATH)) if HYBRID_SEARCH else None
+    if lexical is not None:
+        sync_lexical_index(store, lexical)
 
+    # 0. 跳过整本未变化的书
+    todo, file_hashes, known_hashes = [], {}, {}
     for pdf_path in pdf_paths:
         pdf_path = str(pdf_path)
         book_name = Path(pdf_path).name
-        stem = Path(pdf_path).stem
+        fhash = file_hash(pdf_path)
+        if manifest.file_unchanged(book_name, fhash):
+            print(f"Unchanged, skipping: {book_name}")
+            continue
+        todo.append(pdf_path)
+        file_hashes[pdf_path] = fhash
+        known_hashes[pdf_path] = manifest.page_hashes(book_name)
+        checkpoint.file_hashes[book_name] = fhash
 
-        print(f"\n{'='*60}")
-        print(f"Processing: {book_name}")
-        print(f"{'='*60}")
+    # 续跑：已写入向量库的 chunk 不再重新生成 embedding
+    skip_ids = {}
+    for pdf_path in todo:
+        committed = checkpoint.committed_ids(Path(pdf_path).name, file_hashes[pdf_path])
+        if committed:
+            print(f"Resuming {Path(pdf_path).name}: {len(committed)} chunks already committed")
+            skip_ids[pdf_path] = committed
+    checkpoint.start(keep=resume)
 
-        # 1. 提取页面
-        print("Step 1: Extracting pages...")
-        pages = extract_pages(pdf_path)
-        print(f"  Found {len(pages)} pages")
+    total_stats = StageStats()
+    t_start = time.perf_counter()
 
-        # 2. 分句和切分
-        print("\nStep 2: Splitting sentences and chunking...")
-        ids, docs, metas = [], [], []
+    def on_book_done(event) -> None:
+        """一本书的 chunk 全部写入后：删除过期 chunk、更新清单"""
+        _, pdf_path, pages, stats = event
+        book_name = Path(pdf_path).name
+        total_stats.merge(stats)
+        # 后台 upsert 全部落盘后才能更新清单
+        store.flush()
 
-        for p in tqdm(pages, desc="  Processing pages"):
-            page_text = clean_text(p["text"])
-            if not page_text:
+        old_ids = manifest.page_ids(book_name)
+        page_state = {}
+        stale = []
+        for p in pages:
+            if p["n_chunks"] is None:
+                page_state[p["page"]] = {"hash": p["hash"], "ids": old_ids.get(p["page"], [])}
                 continue
+            new_ids = [chunk_id(pdf_path, p["page"], ci) for ci in range(p["n_chunks"])]
+            stale.extend(set(old_ids.get(p["page"], [])) - set(new_ids))
+            page_state[p["page"]] = {"hash": p["hash"], "ids": new_ids}
+        # 已不存在的页
+        for page, page_ids in old_ids.items():
+            if page not in page_state:
+                stale.extend(page_ids)
+        store.delete_documents(sorted(stale))
+        if lexical is not None:
+            lexical.delete_documents(stale)
+            lexical.save()
 
-            # HanLP 分句
-            sentences = split_sentences(page_text)
-            # 按 chunk 切分
-            chunks = chunk_by_sentences(
-                sentences,
-                max_chars=MAX_CHARS_PER_CHUNK,
-                overlap_sents=OVERLAP_SENTENCES
-            )
-
-            for ci, chunk in enumerate(chunks):
-                doc_id = f"{stem}_p{p['page']}_c{ci}"
-                ids.append(doc_id)
-                docs.append(chunk)
-                metas.append({
-                    "source": book_name,
-                    "page": p["page"],
-                    "chunk": ci,
-                })
-
-        print(f"  Created {len(docs)} chunks")
-
-        if not docs:
-            print("  No text extracted, skipping...")
-            continue
+        manifest.update_source(book_name, file_hashes[pdf_path], page_state)
+        manifest.save()
 
-        # 3. 生成 embeddings
-        print(f"\nStep 3: Generating embeddings...")
-        vectors = batch_embed(
-            docs,
+        changed = [p for p in pages if p["n_chunks"] is not None]
+        print(f"\n{'='*60}")
+        print(f"Done: {book_name}")
+        print(f"  Pages: {len(pages)}, {len(changed)} new or changed "
+              f"(workers={max(workers, 1)})")
+        print(f"  Chunks written: {sum(p['n_chunks'] for p in changed)}, stale removed: {len(stale)}")
+        stats.report()
+        print(f"{'='*60}")
+
+    def upsert(ids, docs, vectors, metas) -> None:
+        # 写入成功后再记录检查点（后台模式下在 upsert 线程中回调）
+        store.add_documents(ids, docs, vectors, metas, on_commit=checkpoint.record)
+        if lexical is not None:
+            lexical.add_documents(ids, docs)
+
+    # 并发 embedding：整个构建共用一个事件循环、异步客户端和批大小估计
+    embedder = None
+    if EMBED_CONCURRENCY > 1:
+        embedder = ConcurrentEmbedder(
             model=EMBED_MODEL,
             batch_size=EMBED_BATCH_SIZE,
-            show_progress=True
+            concurrency=EMBED_CONCURRENCY,
+            max_batch_size=EMBED_MAX_BATCH_SIZE,
+            target_latency=EMBED_TARGET_LATENCY,
+            max_retries=EMBED_MAX_RETRIES,
+            cache=cache,
+            client=async_client,
         )
 
-        # 4. 存入数据库
-        print(f"\nStep 4: Storing in ChromaDB...")
-        store.add_documents(ids, docs, vectors, metas)
+    # 1-4. 提取/切分 → embedding → 写入，三段并发
+    pipeline = IndexPipeline(
+        embed_fn=lambda docs: embed_documents(
+            docs, cache, show_progress=False, client=client, embedder=embedder
+        ),
+        upsert_fn=upsert,
+        on_event=on_book_done,
+        batch_size=PIPELINE_BATCH_SIZE,
+        queue_size=PIPELINE_QUEUE_SIZE,
+    )
+    try:
+        pipeline.run(iter_index_events(todo, workers, known_hashes, skip_ids))
+        store.close()
+        checkpoint.finish()
+    except BaseException:
+        try:
+            store.close()
+        except Exception as e:
+            print(f"Pending upsert failed: {e}")
+        checkpoint.close()
+        print(f"\n❌ Index build failed; committed batches are recorded in {CHECKPOINT_PATH}, "
+              f"re-run with --resume to continue")
+        raise
+    finally:
+        if embedder is not None:
+            embedder.close()
+        if cache is not None:
+            print(f"Embedding cache: {cache.stats()}")
+            cache.close()
+
+    elapsed = time.perf_counter() - t_start
 
     print(f"\n{'='*60}")
     print("✅ Index built successfully!")
@@ -92,10 +314,30 @@ def build_index(pdf_paths: list) -> None:
     info = store.get_collection_info()
     print(f"Collection: {info['name']}")
     print(f"Total documents: {info['count']}")
+    print(f"Upsert throughput: {store.upsert_throughput()}")
+    if lexical is not None:
+        print(f"Lexical index: {lexical.stats()}")
+    if total_stats.pages:
+        print(f"Pages: {total_stats.pages} in {elapsed:.1f}s "
+              f"({total_stats.pages / elapsed:.1f} pages/s overall)")
+        total_stats.report()
 
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="Build the knowledge base index")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the index manifest and re-process every page",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue a failed build from its last committed batch",
+    )
+    args = parser.parse_args()
+
     pdf_files = [
         PDF_DIR / "妇产科学.pdf",
     ]
@@ -108,7 +350,7 @@ def main():
         return
 
     # 建立索引
-    build_index(pdf_files)
+    build_index(pdf_files, incremental=not args.full, resume=args.resume)
 
     # 测试问答
     print("\n" + "="*60)
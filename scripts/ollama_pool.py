@@ -0,0 +1,371 @@
+"""Ollama 客户端池 - 多后端负载均衡（最少在途请求）、keep-alive 长连接、健康检查与故障摘除
+
+embedding 与生成使用各自的后端池（config 中的 OLLAMA_EMBED_HOSTS / OLLAMA_CHAT_HOSTS），
+PooledClient / AsyncPooledClient 与 ollama.Client / AsyncClient 的 embed、chat 接口一致，
+可直接注入 batch_embed、QABot 等现有的 client 参数。
+"""
+
+import itertools
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+from ollama import AsyncClient, Client
+
+try:
+    import scripts.config as config
+except ImportError:  # 在 scripts/ 目录下直接运行
+    import config
+
+DEFAULT_HOST = "http://127.0.0.1:11434"
+
+
+def normalize_host(host: Optional[str]) -> str:
+    """补全协议和端口；为空时使用 OLLAMA_HOST 环境变量或默认地址"""
+    host = (host or os.environ.get("OLLAMA_HOST") or DEFAULT_HOST).strip().rstrip("/")
+    if "://" not in host:
+        host = "http://" + host
+    parts = urlsplit(host)
+    netloc = parts.netloc if parts.port else f"{parts.netloc}:11434"
+    return f"{parts.scheme}://{netloc}{parts.path}"
+
+
+def is_backend_failure(e: BaseException) -> bool:
+    """连接失败、超时、5xx 视为后端故障（换节点重试并计入摘除）；4xx（如模型不存在）不算"""
+    if isinstance(e, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    status = getattr(e, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+class Backend:
+    """单个 Ollama 节点：共享的同步客户端（httpx 连接池保持 keep-alive）+ 在途请求数与健康状态"""
+
+    def __init__(self, host: str, timeout: httpx.Timeout, limits: httpx.Limits):
+        self.host = host
+        self.timeout = timeout
+        self.limits = limits
+        self.client = Client(host=host, timeout=timeout, limits=limits)
+        self.outstanding = 0
+        self.failures = 0  # 连续失败次数
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def new_async_client(self) -> AsyncClient:
+        # httpx 异步连接池绑定事件循环，每个异步客户端单独创建
+        return AsyncClient(host=self.host, timeout=self.timeout, limits=self.limits)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "healthy": self.available(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+        }
+
+
+class OllamaPool:
+    """
+    一组 Ollama 后端
+
+    - 路由：在未摘除的节点中选在途请求最少的（相同时轮转）；全部摘除时仍选一个（尽力而为）
+    - 被动摘除：连续 max_failures 次故障后摘除 eject_seconds 秒，到期后放回试探，再失败立即重新摘除
+    - 主动检查：多节点时后台线程每 health_interval 秒请求 /api/version，恢复或摘除节点
+    """
+
+    def __init__(
+        self,
+        name: str,
+        hosts: Optional[List[str]] = None,
+        timeout: float = None,
+        connect_timeout: float = None,
+        max_connections: int = None,
+        max_failures: int = None,
+        eject_seconds: float = None,
+        health_interval: float = None
+    ):
+        """
+        Args:
+            name: 池名（embed / chat，用于日志和 /health）
+            hosts: 后端地址列表，为空时使用 OLLAMA_HOST 环境变量或默认地址
+            timeout: 单个请求的读写超时（秒），默认 OLLAMA_TIMEOUT
+            connect_timeout: 建立连接超时（秒），默认 OLLAMA_CONNECT_TIMEOUT
+            max_connections: 每个后端保持的 keep-alive 连接数，默认 OLLAMA_MAX_CONNECTIONS
+            max_failures: 连续故障多少次后摘除，默认 OLLAMA_MAX_FAILURES
+            eject_seconds: 摘除时长（秒），默认 OLLAMA_EJECT_SECONDS
+            health_interval: 主动健康检查间隔（秒），<= 0 关闭，默认 OLLAMA_HEALTH_INTERVAL
+        """
+        self.name = name
+        timeout = config.OLLAMA_TIMEOUT if timeout is None else timeout
+        connect_timeout = config.OLLAMA_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        max_connections = config.OLLAMA_MAX_CONNECTIONS if max_connections is None else max_connections
+        self.max_failures = max(1, config.OLLAMA_MAX_FAILURES if max_failures is None else max_failures)
+        self.eject_seconds = config.OLLAMA_EJECT_SECONDS if eject_seconds is None else eject_seconds
+        self.health_interval = config.OLLAMA_HEALTH_INTERVAL if health_interval is None else health_interval
+
+        http_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=max_connections)
+        hosts = list(dict.fromkeys(normalize_host(h) for h in (hosts or [None])))
+        self.backends = [Backend(h, http_timeout, limits) for h in hosts]
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+
+        self._stop = threading.Event()
+        self._checker: Optional[threading.Thread] = None
+        if len(self.backends) > 1 and self.health_interval > 0:
+            self._checker = threading.Thread(target=self._health_loop, name=f"ollama-{name}-health", daemon=True)
+            self._checker.start()
+
+    # ---------- 路由 ----------
+    def acquire(self, exclude: Optional[Set[Backend]] = None) -> Optional[Backend]:
+        """
+        选一个后端并把在途请求数加一
+
+        Args:
+            exclude: 本次请求已失败过的后端
+
+        Returns:
+            后端；exclude 之外没有后端时返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if not exclude or b not in exclude]
+            if not candidates:
+                return None
+            healthy = [b for b in candidates if b.available(now)] or candidates
+            start = next(self._rr) % len(healthy)
+            rotated = healthy[start:] + healthy[:start]
+            backend = min(rotated, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, failed: bool = False) -> None:
+        """请求结束：在途请求数减一，并记录成功 / 故障"""
+        with self._lock:
+            backend.outstanding -= 1
+            if failed:
+                self._mark_failed(backend)
+            else:
+                backend.failures = 0
+
+    def _mark_failed(self, backend: Backend) -> None:
+        backend.errors += 1
+        backend.failures += 1
+        if backend.failures >= self.max_failures and backend.available(time.monotonic()):
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+            backend.ejections += 1
+            print(f"[Ollama:{self.name}] ejected {backend.host} for {self.eject_seconds}s "
+                  f"after {backend.failures} consecutive failures")
+
+    # ---------- 健康检查 ----------
+    def check(self, backend: Backend) -> bool:
+        """请求 /api/version 检查后端，结果更新健康状态"""
+        try:
+            resp = httpx.get(f"{backend.host}/api/version", timeout=backend.timeout.connect or 5.0)
+            ok = resp.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        with self._lock:
+            if ok:
+                if not backend.available(time.monotonic()):
+                    print(f"[Ollama:{self.name}] {backend.host} is healthy again")
+                backend.failures = 0
+                backend.ejected_until = 0.0
+            else:
+                backend.failures = max(backend.failures, self.max_failures - 1)
+                self._mark_failed(backend)
+        return ok
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            for backend in self.backends:
+                self.check(backend)
+
+    def close(self) -> None:
+        """停止后台健康检查"""
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """各后端状态（/health）"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "backends": [b.stats(now) for b in self.backends],
+                "healthy": sum(b.available(now) for b in self.backends),
+            }
+
+
+class PooledClient:
+    """
+    同步客户端：embed 走 embedding 池，chat 走生成池
+
+    后端故障时换下一个节点重试（流式请求只在收到第一个 chunk 之前重试）
+    """
+
+    def __init__(self, embed_pool: OllamaPool, chat_pool: OllamaPool):
+        self.embed_pool = embed_pool
+        self.chat_pool = chat_pool
+
+    def _call(self, pool: OllamaPool, method: str, kwargs: Dict[str, Any]) -> Any:
+        tried: Set[Backend] = set()
+        while True:
+            backend = pool.acquire(tried)
+            failed = False
+            try:
+                return getattr(backend.client, method)(**kwargs)
+            except Exception as e:
+                failed = is_backend_failure(e)
+                if not failed or len(tried) + 1 >= len(pool.backends):
+                    raise
+                print(f"[Ollama:{pool.name}] {backend.host} failed ({type(e).__name__}), retrying on another backend")
+                tried.add(backend)
+            finally:
+                pool.release(backend, failed)
+
+    def _stream(self, pool: OllamaPool, kwargs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        tried: Set[Backend] = set()
+        while True:
+            backend = pool.acquire(tried)
+            failed = False
+            started = False
+            try:
+                for part in backend.client.chat(**kwargs):
+                    started = True
+                    yield part
+                return
+            except Exception as e:
+                failed = is_backend_failure(e)
+                if not failed or started or len(tried) + 1 >= len(pool.backends):
+                    raise
+                tried.add(backend)
+            finally:
+                pool.release(backend, failed)
+
+    def embed(self, **kwargs) -> Any:
+        return self._call(self.embed_pool, "embed", kwargs)
+
+    def chat(self, **kwargs) -> Any:
+        if kwargs.get("stream"):
+            return self._stream(self.chat_pool, kwargs)
+        return self._call(self.chat_pool, "chat", kwargs)
+
+
+class AsyncPooledClient:
+    """
+    异步客户端，行为同 PooledClient
+
+    每个节点的 AsyncClient 在首次使用时创建；httpx 异步连接池绑定事件循环，
+    不同事件循环（如每次 asyncio.run）应各自新建 AsyncPooledClient。
+    """
+
+    def __init__(self, embed_pool: OllamaPool, chat_pool: OllamaPool):
+        self.embed_pool = embed_pool
+        self.chat_pool = chat_pool
+        self._clients: Dict[str, AsyncClient] = {}
+
+    def _client(self, backend: Backend) -> AsyncClient:
+        client = self._clients.get(backend.host)
+        if client is None:
+            client = self._clients[backend.host] = backend.new_async_client()
+        return client
+
+    async def _call(self, pool: OllamaPool, method: str, kwargs: Dict[str, Any]) -> Any:
+        tried: Set[Backend] = set()
+        while True:
+            backend = pool.acquire(tried)
+            failed = False
+            try:
+                return await getattr(self._client(backend), method)(**kwargs)
+            except Exception as e:
+                failed = is_backend_failure(e)
+                if not failed or len(tried) + 1 >= len(pool.backends):
+                    raise
+                print(f"[Ollama:{pool.name}] {backend.host} failed ({type(e).__name__}), retrying on another backend")
+                tried.add(backend)
+            finally:
+                pool.release(backend, failed)
+
+    async def _stream(self, pool: OllamaPool, kwargs: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        tried: Set[Backend] = set()
+        while True:
+            backend = pool.acquire(tried)
+            failed = False
+            started = False
+            try:
+                async for part in await self._client(backend).chat(**kwargs):
+                    started = True
+                    yield part
+                return
+            except Exception as e:
+                failed = is_backend_failure(e)
+                if not failed or started or len(tried) + 1 >= len(pool.backends):
+                    raise
+                tried.add(backend)
+            finally:
+                pool.release(backend, failed)
+
+    async def embed(self, **kwargs) -> Any:
+        return await self._call(self.embed_pool, "embed", kwargs)
+
+    async def chat(self, **kwargs) -> Any:
+        if kwargs.get("stream"):
+            return self._stream(self.chat_pool, kwargs)
+        return await self._call(self.chat_pool, "chat", kwargs)
+
+    async def close(self) -> None:
+        """关闭各节点的连接池（须在创建连接的事件循环中调用）"""
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.close()
+
+
+# ---------- 进程内共享的池 ----------
+_pools: Dict[str, OllamaPool] = {}
+_pools_lock = threading.Lock()
+_default_client: Optional[PooledClient] = None
+
+
+def get_pool(name: str) -> OllamaPool:
+    """
+    共享的后端池（首次使用时按 config 创建）
+
+    Args:
+        name: "embed"（OLLAMA_EMBED_HOSTS）或 "chat"（OLLAMA_CHAT_HOSTS）
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            hosts = config.OLLAMA_EMBED_HOSTS if name == "embed" else config.OLLAMA_CHAT_HOSTS
+            pool = _pools[name] = OllamaPool(name, hosts)
+        return pool
+
+
+def default_client() -> PooledClient:
+    """进程内共享的同步客户端（embedding 池 + 生成池）"""
+    global _default_client
+    if _default_client is None:
+        _default_client = PooledClient(get_pool("embed"), get_pool("chat"))
+    return _default_client
+
+
+def new_async_client() -> AsyncPooledClient:
+    """新建异步客户端（共享后端池与健康状态，连接属于当前事件循环）"""
+    return AsyncPooledClient(get_pool("embed"), get_pool("chat"))
+
+
+def pool_stats() -> Dict[str, Any]:
+    """已创建的各池状态"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.stats() for name, pool in pools.items()}
@@ -1,27 +1,48 @@
 """PDF 解析和文本清理模块"""
 
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import re
 import fitz  # PyMuPDF
 
 
-def extract_pages(pdf_path: str) -> List[Dict[str, Any]]:
+def count_pages(pdf_path: str) -> int:
+    """
+    获取 PDF 总页数
+
+    Args:
+        pdf_path: PDF 文件路径
+
+    Returns:
+        页数
+    """
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def extract_pages(
+    pdf_path: str,
+    start: int = 0,
+    end: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
     从 PDF 提取每一页的文本
 
     Args:
         pdf_path: PDF 文件路径
+        start: 起始页索引（从 0 开始，包含）
+        end: 结束页索引（不包含），None 表示到最后一页
 
     Returns:
         包含页码和文本的字典列表
     """
-    doc = fitz.open(pdf_path)
-    pages = []
-    for i in range(doc.page_count):
-        page = doc.load_page(i)
-        text = page.get_text("text")
-        pages.append({"page": i + 1, "text": text})
+    with fitz.open(pdf_path) as doc:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        pages = []
+        for i in range(start, end):
+            page = doc.load_page(i)
+            text = page.get_text("text")
+            pages.append({"page": i + 1, "text": text})
     return pages
 
 
@@ -1,10 +1,122 @@
 """问答机器人模块 - RAG 问答实现"""
 
-from typing import List, Generator, Dict, Any, Tuple, Optional
-from ollama import chat
+import asyncio
+import math
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Generator, AsyncGenerator, Dict, Any, Tuple, Optional
+
+import numpy as np
+from ollama import AsyncClient
 from scripts.embeddings import embed_single
+from scripts.ollama_pool import default_client, new_async_client
 from scripts.chroma_store import ChromaStore
-from scripts.config import EMBED_MODEL, LLM_MODEL, CHROMA_DIR, COLLECTION_NAME
+from scripts.lru_cache import LRUCache
+from scripts.lexical_index import LexicalIndex
+from scripts.context_packing import format_block, pack_context
+from scripts.config import (
+    EMBED_MODEL, LLM_MODEL, CHROMA_DIR, COLLECTION_NAME, MANIFEST_PATH,
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL, SEARCH_WORKERS,
+    HYBRID_SEARCH, LEXICAL_INDEX_PATH, RRF_K,
+    RETRIEVE_FETCH_FACTOR, RETRIEVE_MAX_FETCH, MMR_ENABLED, MMR_LAMBDA,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_CHUNK_TOKENS, CONTEXT_MAX_DISTANCE,
+)
+
+
+def normalize_question(question: str) -> str:
+    """
+    问题归一化（用作缓存键）：全角转半角、去首尾空白、合并空白、英文小写、去掉句末标点
+    """
+    q = unicodedata.normalize("NFKC", question or "").strip().lower()
+    q = re.sub(r"\s+", " ", q)
+    return q.rstrip("?？!！。.~～ ")
+
+
+def dedup_pages(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按 (source, page) 去重，候选已按相关度排序，保留每页最靠前的 chunk"""
+    unique_docs: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+    for c in candidates:
+        m = c["meta"] or {}
+        unique_docs.setdefault((m.get("source"), m.get("page")), c)
+    return list(unique_docs.values())
+
+
+def mmr_select(
+    q_vec: List[float],
+    candidates: List[Dict[str, Any]],
+    k: int,
+    lam: float
+) -> List[Dict[str, Any]]:
+    """
+    最大边际相关（MMR）：依次选出 λ·sim(问题, d) − (1−λ)·max sim(d, 已选) 最大的候选（余弦相似度）
+
+    Args:
+        q_vec: 问题向量
+        candidates: 候选 chunk（"embedding" 为其向量），按相关度排序
+        k: 选出的数量
+        lam: λ，1 为只看相关度，越小越偏向多样性
+
+    Returns:
+        选中的候选（按选出顺序）；没有向量的候选保持原顺序排在最后
+    """
+    with_vec = [c for c in candidates if c.get("embedding") is not None]
+    rest = [c for c in candidates if c.get("embedding") is None]
+    if len(with_vec) <= 1:
+        return (with_vec + rest)[:k]
+
+    m = np.asarray([c["embedding"] for c in with_vec], dtype=np.float32)
+    m /= np.linalg.norm(m, axis=1, keepdims=True) + 1e-12
+    q = np.asarray(q_vec, dtype=np.float32)
+    relevance = m @ (q / (np.linalg.norm(q) + 1e-12))
+
+    redundancy = np.zeros(len(with_vec), dtype=np.float32)
+    remaining = np.ones(len(with_vec), dtype=bool)
+    selected: List[int] = []
+    for _ in range(min(k, len(with_vec))):
+        score = lam * relevance - (1 - lam) * redundancy
+        score[~remaining] = -np.inf
+        j = int(np.argmax(score))
+        selected.append(j)
+        remaining[j] = False
+        redundancy = np.maximum(redundancy, m @ m[j])
+    return [with_vec[j] for j in selected] + rest[:k - len(selected)]
+
+
+@contextmanager
+def stage_timer(timings: Optional[Dict[str, float]], stage: str):
+    """把阶段耗时（毫秒）累加到 timings[stage + "_ms"]；timings 为 None 时不记录"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            key = f"{stage}_ms"
+            timings[key] = round(timings.get(key, 0.0) + (time.perf_counter() - t0) * 1000, 2)
+
+
+def record_generation(timings: Optional[Dict[str, float]], resp: Any, llm_seconds: float) -> None:
+    """
+    记录 LLM 生成统计：总耗时、输出 token 数、tokens/s
+
+    Args:
+        timings: 计时字典（None 时不记录）
+        resp: 非流式响应或流式的最后一个 chunk（含 eval_count / eval_duration）
+        llm_seconds: 从发起请求到生成结束的耗时
+    """
+    if timings is None:
+        return
+    timings["llm_ms"] = round(llm_seconds * 1000, 2)
+    eval_count = resp.get("eval_count") if resp is not None else None
+    eval_duration = resp.get("eval_duration") if resp is not None else None  # 纳秒
+    if eval_count:
+        timings["tokens"] = eval_count
+        seconds = eval_duration / 1e9 if eval_duration else llm_seconds
+        if seconds > 0:
+            timings["tokens_per_s"] = round(eval_count / seconds, 2)
 
 
 class QABot:
@@ -15,8 +127,30 @@ class QABot:
         embed_model: str = None,
         llm_model: str = None,
         persist_dir: str = None,
-        collection_name: str = None
+        collection_name: str = None,
+        query_cache_size: int = None,
+        query_cache_ttl: float = None,
+        hybrid: bool = None,
+        client=None,
+        async_client: Optional[AsyncClient] = None,
+        context_budget: int = None,
+        context_chunk_tokens: int = None,
+        context_max_distance: float = None,
+        fetch_factor: float = None,
+        max_fetch: int = None,
+        mmr: bool = None,
+        mmr_lambda: float = None
     ):
+        """
+        Args:
+            context_budget / context_chunk_tokens / context_max_distance:
+                上下文打包参数，默认取 config 中的 CONTEXT_* 配置
+            fetch_factor / max_fetch: 首轮候选数倍数与候选数上限，默认 RETRIEVE_FETCH_FACTOR / RETRIEVE_MAX_FETCH
+            mmr / mmr_lambda: 是否用 MMR 选出 top_k 及其 λ，默认 MMR_ENABLED / MMR_LAMBDA
+            client: 同步 Ollama 客户端（embed / chat），默认使用共享的 Ollama 客户端池
+            async_client: 异步路径使用的客户端，默认首次使用时从客户端池新建
+            （基准测试可注入 fake_backend 中的离线替身）
+        """
         self.embed_model = embed_model or EMBED_MODEL
         self.llm_model = llm_model or LLM_MODEL
         persist_dir = persist_dir or str(CHROMA_DIR)
@@ -24,6 +158,39 @@ class QABot:
 
         self.store = ChromaStore(persist_dir, collection_name)
 
+        # 问题向量缓存：归一化问题 -> embedding，重复问题不再调用 embedding 模型
+        self.query_cache = LRUCache(
+            capacity=QUERY_CACHE_SIZE if query_cache_size is None else query_cache_size,
+            ttl=QUERY_CACHE_TTL if query_cache_ttl is None else query_cache_ttl,
+        )
+        self._index_version: Optional[str] = None
+        self._index_version_at = 0.0
+
+        # BM25 词法索引（与向量检索结果做 RRF 融合），索引文件更新后自动重新加载
+        self.hybrid = HYBRID_SEARCH if hybrid is None else hybrid
+        self._lexical: Optional[LexicalIndex] = None
+        self._lexical_mtime = None
+        self._lexical_checked_at = 0.0
+        self._lexical_lock = threading.Lock()
+
+        # 上下文打包：token 预算、单个 chunk 上限、距离截断
+        self.context_budget = CONTEXT_TOKEN_BUDGET if context_budget is None else context_budget
+        self.context_chunk_tokens = CONTEXT_CHUNK_TOKENS if context_chunk_tokens is None else context_chunk_tokens
+        self.context_max_distance = CONTEXT_MAX_DISTANCE if context_max_distance is None else context_max_distance
+
+        # 自适应检索与 MMR
+        self.fetch_factor = RETRIEVE_FETCH_FACTOR if fetch_factor is None else fetch_factor
+        self.max_fetch = RETRIEVE_MAX_FETCH if max_fetch is None else max_fetch
+        self.mmr = MMR_ENABLED if mmr is None else mmr
+        self.mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+
+        # 异步路径：Ollama 异步客户端 + Chroma 查询专用线程池
+        self.client = client if client is not None else default_client()
+        self._async_client: Optional[AsyncClient] = async_client
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=SEARCH_WORKERS, thread_name_prefix="chroma-search"
+        )
+
         # ✅ 保留你原本的 prompt（CLI 用，仍会让模型输出“参考来源”）
         self.system_prompt_with_refs = (
             "你是面向女性用户的妇科健康科普助手。\n"
@@ -45,52 +212,246 @@ class QABot:
         # 兼容旧属性名（如果你其他地方在用 self.system_prompt）
         self.system_prompt = self.system_prompt_with_refs
 
+    def index_version(self, max_age: float = 5.0) -> str:
+        """
+        当前索引版本（索引清单修改时间 + 文档数），用于让依赖检索结果的缓存失效
+
+        Args:
+            max_age: 版本号的本地缓存时间（秒），避免每次请求都查询向量库
+        """
+        now = time.monotonic()
+        if self._index_version is None or now - self._index_version_at > max_age:
+            mtime = MANIFEST_PATH.stat().st_mtime_ns if MANIFEST_PATH.exists() else 0
+            count = self.store.get_collection_info()["count"]
+            self._index_version = f"{mtime}:{count}"
+            self._index_version_at = now
+        return self._index_version
+
+    def embed_question(self, question: str) -> List[float]:
+        """生成问题向量（优先读取缓存）"""
+        key = (self.embed_model, normalize_question(question))
+        q_vec = self.query_cache.get(key)
+        if q_vec is None:
+            q_vec = embed_single(question, model=self.embed_model, client=self.client)
+            self.query_cache.put(key, q_vec)
+        return q_vec
+
+    def lexical_index(self, max_age: float = 5.0) -> Optional[LexicalIndex]:
+        """
+        当前 BM25 词法索引（索引文件修改后重新加载），未启用或不存在时返回 None
+
+        Args:
+            max_age: 检查索引文件是否更新的间隔（秒）
+        """
+        if not self.hybrid:
+            return None
+        with self._lexical_lock:
+            now = time.monotonic()
+            if now - self._lexical_checked_at > max_age:
+                self._lexical_checked_at = now
+                mtime = LEXICAL_INDEX_PATH.stat().st_mtime_ns if LEXICAL_INDEX_PATH.exists() else None
+                if mtime != self._lexical_mtime:
+                    self._lexical = LexicalIndex(str(LEXICAL_INDEX_PATH)) if mtime else None
+                    self._lexical_mtime = mtime
+            return self._lexical
+
     # ---------- 新增：统一的检索函数，返回 context + sources ----------
-    def retrieve(self, question: str, top_k: int = 6) -> Tuple[str, List[Dict[str, Any]]]:
+    def retrieve(
+        self,
+        question: str,
+        top_k: int = 6,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
         """
         检索：返回拼好的上下文 context（给 LLM）+ 结构化 sources（给前端展示）
-        去重：按 (source, page) 去重，保留距离最近的
+        去重：按 (source, page) 去重，保留排名最靠前的
+        打包：在 token 预算内只放入与问题最相关的句子（见 context_packing.pack_context）
+
+        Args:
+            timings: 可选，记录各阶段耗时（embed / search / lexical / mmr / dedup / context，毫秒）、
+                fetch_rounds / candidates（Chroma 查询轮数与取回的候选数）以及 context_tokens / context_tokens_saved
         """
         print("Embedding question...")
-        q_vec = embed_single(question, model=self.embed_model)
+        with stage_timer(timings, "embed"):
+            q_vec = self.embed_question(question)
 
         print("Searching knowledge base...")
-        # 检索更多结果，以便去重后仍有足够数量
-        res = self.store.query(q_vec, n_results=top_k * 2)
-
-        docs = (res.get("documents") or [[]])[0] or []
-        metas = (res.get("metadatas") or [[]])[0] or []
-        distances = (res.get("distances") or [[]])[0] or []
-
-        # 去重：按 (source, page) 分组，保留距离最近的
-        unique_docs: Dict[Tuple[str, Any], Dict[str, Any]] = {}
-
-        for d, m, dist in zip(docs, metas, distances):
-            source = m.get("source")
-            page = m.get("page")
-            key = (source, page)
-
-            # 如果这个 (source, page) 没出现过，或者当前的距离更近，则保留
-            if key not in unique_docs or dist < unique_docs[key]["distance"]:
-                unique_docs[key] = {
-                    "doc": d,
-                    "meta": m,
-                    "distance": dist,
-                }
-
-        # 按 distance 排序，取前 top_k 个
-        sorted_items = sorted(
-            unique_docs.values(),
-            key=lambda x: x["distance"]
-        )[:top_k]
-
-        # 构建上下文（给 LLM）和 sources（给前端）
+        return self._build_context(question, self._search(question, q_vec, top_k, timings), top_k, timings)
+
+    def _search(
+        self,
+        question: str,
+        q_vec: List[float],
+        top_k: int,
+        timings: Optional[Dict[str, float]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        向量检索 + BM25 检索，按 RRF 融合排序（同步/异步检索共用）
+
+        Returns:
+            候选 chunk 列表 [{"id", "doc", "meta", "distance", "score"}]，按相关度从高到低
+        """
+        return self._search_many([question], [q_vec], top_k, timings)[0]
+
+    def _search_many(
+        self,
+        questions: List[str],
+        q_vecs: List[List[float]],
+        top_k: int,
+        timings: Optional[Dict[str, float]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量检索：多向量 Chroma 查询，词法检索逐个问题执行，缺失正文一次取回
+
+        自适应取数：首轮每个问题取 top_k * fetch_factor 个候选，去重后不足 top_k 个不同页的问题
+        候选数翻倍再查（只查这些问题），直到够数、取完全部文档或达到 max_fetch。
+        开启 MMR 时去重后再用 MMR 选出 top_k 个。
+
+        Returns:
+            每个问题的候选 chunk 列表（格式同 _search）
+        """
+        all_candidates, n_fetched = self._fetch_adaptive(q_vecs, top_k, timings)
+
+        lexical = self.lexical_index()
+        if lexical is not None and len(lexical):
+            with stage_timer(timings, "lexical"):
+                all_hits = [lexical.search(q, top_n=n) for q, n in zip(questions, n_fetched)]
+
+                # 只被词法检索命中的 chunk 从向量库取回正文（MMR 还需要向量）
+                known = {c["id"] for candidates in all_candidates for c in candidates}
+                missing = sorted({doc_id for hits in all_hits for doc_id, _ in hits} - known)
+                fetched = self.store.get_documents(missing)
+                vectors = self.store.get_embeddings(missing) if self.mmr else {}
+
+                all_candidates = [
+                    self._fuse(candidates, hits, fetched, vectors)
+                    for candidates, hits in zip(all_candidates, all_hits)
+                ]
+
+        if not self.mmr:
+            return all_candidates
+        with stage_timer(timings, "mmr"):
+            return [
+                mmr_select(q_vec, dedup_pages(candidates), top_k, self.mmr_lambda)
+                for q_vec, candidates in zip(q_vecs, all_candidates)
+            ]
+
+    def _fetch_adaptive(
+        self,
+        q_vecs: List[List[float]],
+        top_k: int,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[List[List[Dict[str, Any]]], List[int]]:
+        """
+        向量检索，候选去重后不足 top_k 个不同页时加倍重查
+
+        Returns:
+            (每个问题的候选列表, 每个问题最终的请求数量)
+        """
+        n = min(max(top_k, math.ceil(top_k * self.fetch_factor)), max(top_k, self.max_fetch))
+        all_candidates: List[List[Dict[str, Any]]] = [[] for _ in q_vecs]
+        n_fetched = [n] * len(q_vecs)
+        todo = list(range(len(q_vecs)))
+        rounds = 0
+        with stage_timer(timings, "search"):
+            while todo:
+                res = self.store.query_batch([q_vecs[i] for i in todo], n_results=n, with_embeddings=self.mmr)
+                rounds += 1
+                short = []
+                for i, candidates in zip(todo, self._parse_query(res, len(todo))):
+                    all_candidates[i] = candidates
+                    n_fetched[i] = n
+                    # 返回数少于 n 说明已取完全部文档
+                    if len(candidates) == n and n < self.max_fetch and len(dedup_pages(candidates)) < top_k:
+                        short.append(i)
+                todo = short
+                n = min(n * 2, self.max_fetch)
+
+        n_candidates = sum(len(c) for c in all_candidates)
+        if rounds > 1:
+            print(f"Adaptive fetch: {rounds} rounds, {n_candidates} candidates")
+        if timings is not None:
+            timings["fetch_rounds"] = timings.get("fetch_rounds", 0) + rounds
+            timings["candidates"] = timings.get("candidates", 0) + n_candidates
+        return all_candidates, n_fetched
+
+    @staticmethod
+    def _parse_query(res: Dict[str, Any], n_queries: int) -> List[List[Dict[str, Any]]]:
+        """把 Chroma 多向量查询结果转为每个查询的候选列表"""
+        empty = [None] * n_queries
+        return [
+            [
+                {"id": i, "doc": d, "meta": m, "distance": dist, "score": None,
+                 **({"embedding": embs[j]} if embs is not None else {})}
+                for j, (i, d, m, dist) in enumerate(zip(ids, docs or [], metas or [], dists or []))
+            ]
+            for ids, docs, metas, dists, embs in zip(
+                res.get("ids") or [[] for _ in range(n_queries)],
+                res.get("documents") or empty,
+                res.get("metadatas") or empty,
+                res.get("distances") or empty,
+                res.get("embeddings") if res.get("embeddings") is not None else empty,
+            )
+        ]
+
+    @staticmethod
+    def _fuse(
+        candidates: List[Dict[str, Any]],
+        hits: List[Tuple[str, float]],
+        fetched: Dict[str, Tuple[str, Dict[str, Any]]],
+        vectors: Optional[Dict[str, List[float]]] = None
+    ) -> List[Dict[str, Any]]:
+        """RRF 融合：score = Σ 1 / (RRF_K + 排名)；vectors 为只被词法命中的 chunk 的向量（MMR 用）"""
+        if not hits:
+            return candidates
+        by_id = {c["id"]: dict(c) for c in candidates}
+        scores: Dict[str, float] = {}
+        for ranking in ([c["id"] for c in candidates], [doc_id for doc_id, _ in hits]):
+            for rank, doc_id in enumerate(ranking, start=1):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+
+        for doc_id, _ in hits:
+            if doc_id not in by_id and doc_id in fetched:
+                d, m = fetched[doc_id]
+                by_id[doc_id] = {"id": doc_id, "doc": d, "meta": m, "distance": None, "score": None}
+                if vectors and doc_id in vectors:
+                    by_id[doc_id]["embedding"] = vectors[doc_id]
+
+        fused = []
+        for doc_id, score in sorted(scores.items(), key=lambda x: -x[1]):
+            if doc_id in by_id:
+                by_id[doc_id]["score"] = score
+                fused.append(by_id[doc_id])
+        return fused
+
+    def _build_context(
+        self,
+        question: str,
+        candidates: List[Dict[str, Any]],
+        top_k: int,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """对检索结果去重、按 token 预算打包，拼出 context 和 sources（同步/异步检索共用）"""
+        t0 = time.perf_counter()
+        # 去重：按 (source, page) 分组，候选已按相关度排序，保留最靠前的
+        sorted_items = dedup_pages(candidates)[:top_k]
+        t1 = time.perf_counter()
+
+        packed, packing = pack_context(
+            question,
+            sorted_items,
+            budget=self.context_budget,
+            chunk_tokens=self.context_chunk_tokens,
+            max_distance=self.context_max_distance,
+        )
+
+        # 构建上下文（给 LLM）和 sources（给前端，只包含放入 context 的来源）
         context_blocks = []
         sources: List[Dict[str, Any]] = []
 
-        for i, item in enumerate(sorted_items, start=1):
+        for i, (item, text) in enumerate(packed, start=1):
             d = item["doc"]
-            m = item["meta"]
+            m = item["meta"] or {}
             dist = item["distance"]
 
             src = {
@@ -99,19 +460,227 @@ class QABot:
                 "page": m.get("page"),
                 "chunk": m.get("chunk"),
                 "distance": dist,
+                "score": item["score"],
                 # ⚠️ 注意版权/产品策略：excerpt 建议截断，不要整段展示
                 "excerpt": (d[:220].replace("\n", " ").strip() if isinstance(d, str) else None),
             }
             sources.append(src)
 
-            context_blocks.append(
-                f"[{i}] 来源：{m.get('source')} 第{m.get('page')}页\n{d}"
-            )
+            context_blocks.append(format_block(i, m, text))
 
         context = "\n\n".join(context_blocks)
-        print(f"After deduplication: {len(sources)} unique sources from {len(docs)} retrieved chunks")
+        if timings is not None:
+            timings["dedup_ms"] = round(timings.get("dedup_ms", 0.0) + (t1 - t0) * 1000, 2)
+            timings["context_ms"] = round(timings.get("context_ms", 0.0) + (time.perf_counter() - t1) * 1000, 2)
+            timings["context_tokens"] = timings.get("context_tokens", 0) + packing["tokens"]
+            timings["context_tokens_saved"] = timings.get("context_tokens_saved", 0) + packing["tokens_saved"]
+        print(f"After deduplication: {len(sorted_items)} unique sources from {len(candidates)} retrieved chunks")
+        if packing["tokens_saved"]:
+            print(f"Context packing: ~{packing['tokens']} tokens (saved ~{packing['tokens_saved']} "
+                  f"of {packing['tokens_full']}), {packing['chunks_dropped']} chunks dropped")
         return context, sources
 
+    # ---------- 异步接口（给 FastAPI 用，不阻塞事件循环） ----------
+    def build_messages(self, question: str, context: str, with_refs: bool = False) -> List[Dict[str, str]]:
+        """拼出 LLM 对话消息"""
+        user_prompt = (
+            f"问题：{question}\n\n"
+            f"资料：\n{context}\n\n"
+            "请用中文回答，并尽量引用资料中的表述（但不要大段照抄）。"
+        )
+        system_prompt = self.system_prompt_with_refs if with_refs else self.system_prompt_no_refs
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    @property
+    def async_client(self) -> AsyncClient:
+        """Ollama 异步客户端（首次使用时创建）"""
+        if self._async_client is None:
+            self._async_client = new_async_client()
+        return self._async_client
+
+    async def run_in_search_executor(self, fn, *args):
+        """在专用线程池中执行阻塞的向量库操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._search_executor, fn, *args)
+
+    async def aindex_version(self) -> str:
+        """index_version 的异步版本（可能查询向量库）"""
+        return await self.run_in_search_executor(self.index_version)
+
+    async def aembed_question(
+        self,
+        question: str,
+        timings: Optional[Dict[str, float]] = None
+    ) -> List[float]:
+        """embed_question 的异步版本"""
+        with stage_timer(timings, "embed"):
+            key = (self.embed_model, normalize_question(question))
+            q_vec = self.query_cache.get(key)
+            if q_vec is None:
+                resp = await self.async_client.embed(model=self.embed_model, input=question)
+                q_vec = resp["embeddings"][0]
+                self.query_cache.put(key, q_vec)
+            return q_vec
+
+    async def aretrieve(
+        self,
+        question: str,
+        top_k: int = 6,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """retrieve 的异步版本：异步 embedding + 专用线程池中的 Chroma 查询"""
+        q_vec = await self.aembed_question(question, timings)
+        candidates = await self.run_in_search_executor(self._search, question, q_vec, top_k, timings)
+        return self._build_context(question, candidates, top_k, timings)
+
+    async def astream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        timings: Optional[Dict[str, float]] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        异步流式生成，逐段产出文本
+
+        Args:
+            timings: 可选，记录 ttft_ms（首 token 延迟）、llm_ms、tokens、tokens_per_s
+        """
+        t0 = time.perf_counter()
+        last = None
+        stream = await self.async_client.chat(model=self.llm_model, messages=messages, stream=True)
+        async for chunk in stream:
+            last = chunk
+            content = chunk.get("message", {}).get("content")
+            if content:
+                if timings is not None and "ttft_ms" not in timings:
+                    timings["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+                yield content
+        record_generation(timings, last, time.perf_counter() - t0)
+
+    async def aanswer_with_sources(
+        self,
+        question: str,
+        top_k: int = 6,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Any]:
+        """answer_with_sources 的异步版本"""
+        context, sources = await self.aretrieve(question, top_k=top_k, timings=timings)
+        t0 = time.perf_counter()
+        resp = await self.async_client.chat(
+            model=self.llm_model,
+            messages=self.build_messages(question, context),
+        )
+        record_generation(timings, resp, time.perf_counter() - t0)
+        return {
+            "answer": resp["message"]["content"],
+            "sources": sources,
+        }
+
+    # ---------- 批量问答（离线任务：FAQ 预生成、评测） ----------
+    async def aembed_questions(
+        self,
+        questions: List[str],
+        timings: Optional[Dict[str, float]] = None
+    ) -> List[List[float]]:
+        """批量生成问题向量：未命中缓存的问题合并为一次 Ollama 调用"""
+        with stage_timer(timings, "embed"):
+            return await self._aembed_questions(questions)
+
+    async def _aembed_questions(self, questions: List[str]) -> List[List[float]]:
+        keys = [(self.embed_model, normalize_question(q)) for q in questions]
+        vectors = [self.query_cache.get(k) for k in keys]
+        # 同一批次内重复的问题只生成一次
+        todo: Dict[Tuple[str, str], str] = {}
+        for k, q, v in zip(keys, questions, vectors):
+            if v is None:
+                todo.setdefault(k, q)
+        if todo:
+            resp = await self.async_client.embed(model=self.embed_model, input=list(todo.values()))
+            new = dict(zip(todo, resp["embeddings"]))
+            for k, v in new.items():
+                self.query_cache.put(k, v)
+            vectors = [v if v is not None else new[k] for k, v in zip(keys, vectors)]
+        return vectors
+
+    async def aretrieve_many(
+        self,
+        questions: List[str],
+        top_k: int = 6,
+        timings: Optional[Dict[str, float]] = None,
+        q_vecs: Optional[List[List[float]]] = None
+    ) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        批量检索：一次 embedding 调用 + 一次多向量 Chroma 查询（timings 为整批的耗时）
+
+        q_vecs 为调用方已生成的问题向量（与 questions 一一对应），传入时不再调用 embedding
+        """
+        if q_vecs is None:
+            q_vecs = await self.aembed_questions(questions, timings)
+        all_candidates = await self.run_in_search_executor(
+            self._search_many, questions, q_vecs, top_k, timings
+        )
+        return [self._build_context(q, c, top_k, timings) for q, c in zip(questions, all_candidates)]
+
+    async def aanswer_batch(
+        self,
+        questions: List[str],
+        top_k: int = 6,
+        concurrency: int = 4,
+        q_vecs: Optional[List[List[float]]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        批量问答：共享检索，LLM 生成并发执行，按完成顺序产出结果
+
+        Args:
+            questions: 问题列表
+            top_k: 每个问题的检索数量
+            concurrency: 同时进行的 LLM 生成数
+            q_vecs: 可选，已生成的问题向量（传入时跳过 embedding）
+
+        Yields:
+            {"index", "question", "answer", "sources", "timings"}，出错时为 {"index", "question", "error"}；
+            timings 包含整批共享的检索耗时和该问题的生成耗时
+        """
+        shared: Dict[str, float] = {}
+        retrieved = await self.aretrieve_many(questions, top_k=top_k, timings=shared, q_vecs=q_vecs)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def generate(i: int) -> Dict[str, Any]:
+            context, sources = retrieved[i]
+            timings = dict(shared)
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    resp = await self.async_client.chat(
+                        model=self.llm_model,
+                        messages=self.build_messages(questions[i], context),
+                    )
+                except Exception as e:
+                    return {"index": i, "question": questions[i], "error": str(e)}
+                record_generation(timings, resp, time.perf_counter() - t0)
+            return {
+                "index": i,
+                "question": questions[i],
+                "answer": resp["message"]["content"],
+                "sources": sources,
+                "timings": timings,
+            }
+
+        tasks = [asyncio.ensure_future(generate(i)) for i in range(len(questions))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 调用方提前退出（如客户端断开）时取消剩余生成
+            for t in tasks:
+                t.cancel()
+
+    def _chat(self, **kwargs):
+        """同步 chat 调用（走 self.client，默认为客户端池）"""
+        return self.client.chat(**kwargs)
+
     # ---------- 原有：返回纯文本（CLI/测试不变） ----------
     def answer(self, question: str, top_k: int = 6) -> str:
         context, _sources = self.retrieve(question, top_k=top_k)
@@ -123,7 +692,7 @@ class QABot:
         )
 
         print("Generating answer...")
-        resp = chat(
+        resp = self._chat(
             model=self.llm_model,
             messages=[
                 {"role": "system", "content": self.system_prompt_with_refs},
@@ -143,7 +712,7 @@ class QABot:
         )
 
         print("Generating streaming answer...")
-        stream_resp = chat(
+        stream_resp = self._chat(
             model=self.llm_model,
             messages=[
                 {"role": "system", "content": self.system_prompt_with_refs},
@@ -169,7 +738,7 @@ class QABot:
         )
 
         print("Generating answer (no refs in text)...")
-        resp = chat(
+        resp = self._chat(
             model=self.llm_model,
             messages=[
                 {"role": "system", "content": self.system_prompt_no_refs},
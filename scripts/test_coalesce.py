@@ -0,0 +1,76 @@
+"""测试流式请求合并 - 全部订阅者断开后取消生成，之后的相同请求开始新计算且仍能被合并"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from services.rag_api.app.coalesce import StreamCoalescer
+
+
+async def slow_produce(broadcast):
+    broadcast.publish("chunk", {"content": "a"})
+    await asyncio.sleep(10)
+
+
+async def consume(broadcast, n_events: int, stop: asyncio.Event = None):
+    events = broadcast.subscribe(stop)
+    got = 0
+    async for _ in events:
+        got += 1
+        if got >= n_events:
+            break
+    await events.aclose()
+
+
+async def test_abandon_rejoin():
+    print("Testing abandon → re-join → old task exits")
+    flights = StreamCoalescer(cancel_abandoned=True)
+    key = ("问题", 6)
+
+    # 1) 唯一订阅者断开 → 取消第一个计算
+    first, joined = flights.join(key, slow_produce)
+    assert not joined
+    await consume(first, 1)
+    assert flights.stats()["cancelled"] == 1
+
+    # 2) 旧任务还没退出时，相同请求开始新计算
+    second, joined = flights.join(key, slow_produce)
+    assert not joined and second is not first
+
+    # 3) 旧任务退出（finally 中清理）后，新计算仍在进行中列表里
+    await asyncio.sleep(0.05)
+    assert first.closed
+    assert flights.stats()["inflight"] == 1, flights.stats()
+
+    # 4) 第三个相同请求与新计算合并
+    third, joined = flights.join(key, slow_produce)
+    assert joined and third is second
+
+    for task in list(flights._tasks):
+        task.cancel()
+    await asyncio.sleep(0)
+    print("✅ abandon → re-join OK")
+
+
+async def test_keep_running_with_subscribers():
+    print("Testing generation continues while another subscriber remains")
+    flights = StreamCoalescer(cancel_abandoned=True)
+    broadcast, _ = flights.join("k", slow_produce)
+    stays = broadcast.subscribe()
+    await stays.__anext__()
+    await consume(broadcast, 1)
+    assert flights.stats()["cancelled"] == 0
+    await stays.aclose()
+    assert flights.stats()["cancelled"] == 1
+    await asyncio.sleep(0)
+    print("✅ shared stream OK")
+
+
+if __name__ == "__main__":
+    print("Testing StreamCoalescer")
+    print("=" * 60)
+    asyncio.run(test_abandon_rejoin())
+    asyncio.run(test_keep_running_with_subscribers())
+    print("=" * 60)
+    print("All coalescing tests passed")
@@ -1,37 +1,271 @@
-"""文本切分模块 - 使用 HanLP 进行分句和 chunk 切分"""
+"""文本切分模块 - 中文分句（HanLP / 规则两种后端）和 chunk 切分"""
 
-from typing import List
-import hanlp
+import re
+from typing import List, Dict, Any, Callable, Union
 
 
-# 初始化 HanLP 分句器（懒加载）
-_split_sent = None
+# ====== 规则分句器 ======
+# 句末标点（中英文）
+_SENT_END = set("。！？；!?;…")
+# 句末标点之后可以紧跟的右引号/右括号，应归入前一句
+_CLOSERS = set("”’」』）)】》〕]\"'")
+# 括号内不切分（如 “（如甲硝唑；克林霉素）”）
+_BRACKET_PAIRS = {"（": "）", "(": ")", "【": "】", "〔": "〕"}
+# 左括号之后这么多字符内没有对应的右括号时视为普通字符（PDF 中图注、跨页被截断的括号），
+# 否则之后整段都不会断句
+_BRACKET_MAX_CHARS = 100
 
+_CN_NUM = "一二三四五六七八九十百零"
+# 行首的编号/标题标记：第一章、第二节、一、（一）、1．、1)、（1）、①、3.2 等
+_LIST_MARKER = re.compile(
+    rf"^(?:"
+    rf"第[{_CN_NUM}\d]+[章节篇部]"
+    rf"|[{_CN_NUM}]+[、．.]"
+    rf"|[（(][{_CN_NUM}\d]+[)）]"
+    rf"|\d+(?:[.．]\d+)+(?=\s)"
+    rf"|\d+[、．.)）](?!\d)"
+    rf"|[①-⑳㈠-㈩]"
+    rf"|[•·●■◆▪]"
+    rf")"
+)
+# 独立成句的标题：第X章/节、一、、（一）、3.2 开头且较短、没有句末标点的行
+_HEADING = re.compile(
+    rf"^(?:第[{_CN_NUM}\d]+[章节篇部]|[{_CN_NUM}]+[、．.]|[（(][{_CN_NUM}]+[)）]|\d+(?:[.．]\d+)+(?=\s))"
+)
+_HEADING_MAX_CHARS = 30
 
-def get_splitter():
-    """获取 HanLP 分句器单例"""
-    global _split_sent
-    if _split_sent is None:
-        print("Loading HanLP sentence splitter...")
-        _split_sent = hanlp.load(hanlp.pretrained.eos.UD_CTB_EOS_MUL)
-        print("HanLP loaded!")
-    return _split_sent
 
+class RuleSentenceSplitter:
+    """
+    基于规则的中文分句器（纯 Python，无需加载模型）
+
+    - 在 。！？；（及对应半角标点、省略号）处断句，句末的右引号/右括号归入前一句
+    - 括号内的标点不断句（_BRACKET_MAX_CHARS 字符内没有闭合的左括号不算括号）
+    - PDF 的硬换行会被合并；行首出现编号（1．、（1）、①、一、、第X节 等）时另起一句
+    - 空行（段落）与较短的标题行独立成句
+
+    接口与 HanLP 分句器一致：predict(str) -> List[str]，predict(List[str]) -> List[List[str]]
+    """
+
+    def predict(
+        self,
+        data: Union[str, List[str]],
+        batch_size: int = None
+    ) -> Union[List[str], List[List[str]]]:
+        if isinstance(data, str):
+            return self.split(data)
+        return [self.split(t) for t in data]
+
+    def split(self, text: str) -> List[str]:
+        """对单段文本分句"""
+        sentences: List[str] = []
+        for block in self._join_lines(text):
+            sentences.extend(self._split_block(block))
+        return sentences
+
+    @staticmethod
+    def _join_lines(text: str) -> List[str]:
+        """合并 PDF 硬换行，返回需要独立分句的文本块"""
+        blocks: List[str] = []
+        buf = ""
+        for raw in text.split("\n"):
+            line = raw.strip()
+            if not line:
+                # 空行：段落结束
+                if buf:
+                    blocks.append(buf)
+                    buf = ""
+                continue
+
+            if _LIST_MARKER.match(line) and buf:
+                blocks.append(buf)
+                buf = ""
+
+            if buf and buf[-1].isascii() and buf[-1].isalnum() \
+                    and line[0].isascii() and line[0].isalnum():
+                buf += " " + line
+            else:
+                buf += line
+
+            # 短标题行独立成句
+            if (
+                _HEADING.match(line)
+                and buf == line
+                and len(line) <= _HEADING_MAX_CHARS
+                and not any(ch in _SENT_END for ch in line)
+            ):
+                blocks.append(buf)
+                buf = ""
+
+        if buf:
+            blocks.append(buf)
+        return blocks
+
+    @staticmethod
+    def _split_block(block: str) -> List[str]:
+        """在句末标点处切分一个文本块"""
+        sentences: List[str] = []
+        expected_closers: List[str] = []
+        start = 0
+        i, n = 0, len(block)
 
-def split_sentences(text: str) -> List[str]:
+        while i < n:
+            ch = block[i]
+            if ch in _BRACKET_PAIRS:
+                if RuleSentenceSplitter._closes_within(block, i, _BRACKET_MAX_CHARS):
+                    expected_closers.append(_BRACKET_PAIRS[ch])
+            elif expected_closers and ch == expected_closers[-1]:
+                expected_closers.pop()
+            elif ch in _SENT_END and not expected_closers:
+                # 吞掉连续的句末标点和右引号/右括号，如 “？！”、“。”、“……”
+                j = i + 1
+                while j < n and (block[j] in _SENT_END or block[j] in _CLOSERS):
+                    j += 1
+                sent = block[start:j].strip()
+                if sent:
+                    sentences.append(sent)
+                start = i = j
+                continue
+            i += 1
+
+        tail = block[start:].strip()
+        if tail:
+            sentences.append(tail)
+        return sentences
+
+    @staticmethod
+    def _closes_within(block: str, i: int, limit: int) -> bool:
+        """block[i] 处的左括号是否在之后 limit 个字符内闭合（考虑同类括号嵌套）"""
+        opener, closer = block[i], _BRACKET_PAIRS[block[i]]
+        depth = 0
+        for ch in block[i + 1:i + 1 + limit]:
+            if ch == opener:
+                depth += 1
+            elif ch == closer:
+                if depth == 0:
+                    return True
+                depth -= 1
+        return False
+
+
+# ====== 分句后端注册 ======
+def _load_hanlp():
+    """加载 HanLP 神经网络分句模型（UD_CTB_EOS_MUL）"""
+    import hanlp
+
+    print("Loading HanLP sentence splitter...")
+    splitter = hanlp.load(hanlp.pretrained.eos.UD_CTB_EOS_MUL)
+    print("HanLP loaded!")
+    return splitter
+
+
+_SPLITTER_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "hanlp": _load_hanlp,
+    "rule": RuleSentenceSplitter,
+}
+
+# 已初始化的分句器（懒加载，每种后端一个单例）
+_splitters: Dict[str, Any] = {}
+
+
+def register_splitter(name: str, factory: Callable[[], Any]) -> None:
     """
-    使用 HanLP 进行中文分句
+    注册自定义分句后端
+
+    Args:
+        name: 后端名称（对应 config.SPLITTER_BACKEND）
+        factory: 无参工厂函数，返回带 predict(str | List[str]) 方法的分句器
+    """
+    _SPLITTER_FACTORIES[name] = factory
+    _splitters.pop(name, None)
+
+
+def get_splitter(backend: str = "hanlp"):
+    """获取分句器单例"""
+    if backend not in _splitters:
+        if backend not in _SPLITTER_FACTORIES:
+            raise ValueError(
+                f"Unknown splitter backend: {backend!r} "
+                f"(available: {', '.join(_SPLITTER_FACTORIES)})"
+            )
+        _splitters[backend] = _SPLITTER_FACTORIES[backend]()
+    return _splitters[backend]
+
+
+def split_sentences(text: str, backend: str = "hanlp") -> List[str]:
+    """
+    中文分句
 
     Args:
         text: 输入文本
+        backend: 分句后端（"hanlp" / "rule"）
 
     Returns:
         句子列表
     """
-    splitter = get_splitter()
+    splitter = get_splitter(backend)
     return splitter.predict(text)
 
 
+def split_sentences_batch(
+    texts: List[str],
+    batch_size: int = 64,
+    backend: str = "hanlp"
+) -> List[List[str]]:
+    """
+    批量分句：把多段文本（通常是多页）合并成批次送入分句器，减少逐次调用开销
+
+    Args:
+        texts: 文本列表
+        batch_size: 每次送入模型的文本数量
+        backend: 分句后端（"hanlp" / "rule"）
+
+    Returns:
+        与 texts 一一对应的句子列表（空文本对应空列表）
+    """
+    results: List[List[str]] = [[] for _ in texts]
+    # 空文本不送入模型
+    todo = [i for i, t in enumerate(texts) if t and t.strip()]
+    if not todo:
+        return results
+
+    splitter = get_splitter(backend)
+    batch_size = max(1, batch_size)
+    for start in range(0, len(todo), batch_size):
+        idx = todo[start:start + batch_size]
+        batch_sents = splitter.predict([texts[i] for i in idx], batch_size=batch_size)
+        for i, sents in zip(idx, batch_sents):
+            results[i] = list(sents)
+    return results
+
+
+def split_pages(
+    pages: List[Dict[str, Any]],
+    batch_size: int = 64,
+    backend: str = "hanlp"
+) -> List[Dict[str, Any]]:
+    """
+    对多页文本批量分句，并把句子映射回对应页码
+
+    Args:
+        pages: [{"page": 页码, "text": 文本}, ...]
+        batch_size: 每次送入模型的页数
+        backend: 分句后端（"hanlp" / "rule"）
+
+    Returns:
+        [{"page": 页码, "sentences": [...]}, ...]，顺序与输入一致
+    """
+    sentences = split_sentences_batch(
+        [p["text"] for p in pages],
+        batch_size=batch_size,
+        backend=backend
+    )
+    return [
+        {"page": p["page"], "sentences": sents}
+        for p, sents in zip(pages, sentences)
+    ]
+
+
 def chunk_by_sentences(
     sentences: List[str],
     max_chars: int = 900,
@@ -0,0 +1,147 @@
+# services/rag_api/app/admission.py
+"""准入控制 - 每个接口的并发上限 + 有界等待队列 + 排队截止时间，超限立即拒绝（429 + Retry-After）"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+
+class Overloaded(Exception):
+    """并发已满且等待队列已满，或排队超过截止时间"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"server is overloaded ({reason})")
+        self.reason = reason  # queue_full / queue_timeout
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    单个接口的准入控制（只在事件循环中使用，无需加锁）
+
+    - 同时最多 max_concurrency 个请求在处理，其余按到达顺序排队
+    - 排队数达到 queue_size 时新请求立即拒绝，不再无限堆积
+    - 排队超过 queue_timeout 秒的请求放弃等待（此时即使轮到也已接近客户端超时）
+    - max_concurrency <= 0 表示不限制
+    """
+
+    def __init__(self, name: str, max_concurrency: int, queue_size: int, queue_timeout: float):
+        """
+        Args:
+            name: 接口名（/health 与指标中的标签）
+            max_concurrency: 并发上限
+            queue_size: 等待队列长度
+            queue_timeout: 排队截止时间（秒）
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_hold = 1.0  # 单个请求占用名额时长的滑动平均（估算 Retry-After）
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """估算排在队尾的请求轮到处理所需的秒数"""
+        if not self.enabled:
+            return 1
+        return max(1, math.ceil(self._avg_hold * (self.queued + 1) / self.max_concurrency))
+
+    async def acquire(self) -> float:
+        """
+        获取一个处理名额
+
+        Returns:
+            排队等待的秒数
+
+        Raises:
+            Overloaded: 等待队列已满（queue_full）或排队超时（queue_timeout）
+        """
+        if not self.enabled:
+            self.admitted += 1
+            return 0.0
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return 0.0
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise Overloaded("queue_full", self.retry_after())
+
+        t0 = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 超时 / 客户端断开的同时刚好轮到：名额已转交给本请求
+                if isinstance(e, asyncio.CancelledError):
+                    self.release()
+                    raise
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.timed_out += 1
+                raise Overloaded("queue_timeout", self.retry_after())
+        self.admitted += 1
+        return time.perf_counter() - t0
+
+    def release(self, hold_seconds: Optional[float] = None) -> None:
+        """
+        归还名额：直接转交给队首的等待者，没有等待者时并发数减一
+
+        Args:
+            hold_seconds: 可选，本次占用名额的时长（更新 Retry-After 估算）
+        """
+        if not self.enabled:
+            return
+        if hold_seconds is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * hold_seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """async with limiter.slot() as wait_seconds: ... 结束时自动归还名额"""
+        wait = await self.acquire()
+        t0 = time.perf_counter()
+        try:
+            yield wait
+        finally:
+            self.release(time.perf_counter() - t0)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前状态（/health）"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_size": self.queue_size,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "retry_after": self.retry_after(),
+        }
@@ -0,0 +1,174 @@
+# services/rag_api/app/coalesce.py
+"""请求合并（single-flight） - 相同问题的并发请求只计算一次，其余请求共享结果"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    非流式请求合并：相同 key 的并发调用共享同一个计算任务
+
+    计算在独立任务中执行，某个调用方被取消不会影响其他调用方。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行 fn，或加入正在进行的相同 key 的计算
+
+        Returns:
+            (结果, 是否加入了已有计算)
+        """
+        task = self._inflight.get(key)
+        joined = task is not None
+        if joined:
+            self.joined += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), joined
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), "leaders": self.leaders, "joined": self.joined}
+
+
+class StreamBroadcast:
+    """
+    一次流式计算的事件广播：记录已产生的全部事件，
+    后加入的订阅者先收到已有事件（已生成的前缀），再接收实时事件
+
+    记录当前订阅者数；广播结束前最后一个订阅者退出时调用 on_abandoned（用于取消生成）
+    """
+
+    def __init__(self, on_abandoned: Optional[Callable[[], None]] = None):
+        self.events: List[Tuple[str, Dict[str, Any]]] = []
+        self.closed = False
+        self.subscribers = 0
+        self.on_abandoned = on_abandoned
+        self._changed = asyncio.Event()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        self.events.append((event, data))
+        self._notify()
+
+    def close(self) -> None:
+        self.closed = True
+        self._notify()
+
+    def wake(self) -> None:
+        """唤醒所有等待中的订阅者（让设置了 stop 的订阅者退出）"""
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(
+        self,
+        stop: Optional[asyncio.Event] = None
+    ) -> AsyncGenerator[Tuple[str, Dict[str, Any]], None]:
+        """
+        从头订阅全部事件，直到广播关闭
+
+        Args:
+            stop: 可选，设置后（并调用 wake()）订阅提前结束，如客户端已断开
+        """
+        self.subscribers += 1
+        i = 0
+        try:
+            while True:
+                changed = self._changed
+                while i < len(self.events):
+                    if stop is not None and stop.is_set():
+                        return
+                    yield self.events[i]
+                    i += 1
+                if self.closed or (stop is not None and stop.is_set()):
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.closed and self.on_abandoned is not None:
+                self.on_abandoned()
+
+
+class StreamCoalescer:
+    """
+    流式请求合并：相同 key 的并发请求订阅同一个 StreamBroadcast
+
+    cancel_abandoned 为 True 时，所有订阅者都断开后立即取消生成任务
+    （任务中的 Ollama 流随之关闭，释放模型算力）
+    """
+
+    def __init__(self, cancel_abandoned: bool = True):
+        self._inflight: Dict[Hashable, StreamBroadcast] = {}
+        self._tasks: set = set()  # 持有任务引用，避免被垃圾回收
+        self.cancel_abandoned = cancel_abandoned
+        self.leaders = 0
+        self.joined = 0
+        self.cancelled = 0
+
+    def join(
+        self,
+        key: Hashable,
+        produce: Callable[[StreamBroadcast], Awaitable[None]]
+    ) -> Tuple[StreamBroadcast, bool]:
+        """
+        加入相同 key 的进行中计算，没有时启动 produce(broadcast)
+
+        produce 负责 publish 事件；结束后广播自动关闭并从进行中列表移除。
+        生成被取消时 produce 中会抛出 asyncio.CancelledError
+
+        Returns:
+            (广播, 是否加入了已有计算)
+        """
+        broadcast = self._inflight.get(key)
+        if broadcast is not None:
+            self.joined += 1
+            return broadcast, True
+
+        self.leaders += 1
+        broadcast = self._inflight[key] = StreamBroadcast()
+
+        async def run() -> None:
+            try:
+                await produce(broadcast)
+            except Exception as e:
+                broadcast.publish("error", {"message": str(e)})
+            finally:
+                # 被取消的计算可能已被移出，键下是之后到达的新计算，不能误删
+                if self._inflight.get(key) is broadcast:
+                    del self._inflight[key]
+                broadcast.close()
+
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if self.cancel_abandoned:
+            def abandon() -> None:
+                # 立即移出进行中列表：之后到达的相同请求重新开始，而不是加入正在取消的计算
+                if self._inflight.get(key) is broadcast:
+                    del self._inflight[key]
+                if not task.done():
+                    self.cancelled += 1
+                    task.cancel()
+
+            broadcast.on_abandoned = abandon
+        return broadcast, False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "joined": self.joined,
+            "cancelled": self.cancelled,
+        }
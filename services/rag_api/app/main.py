@@ -2,20 +2,18 @@
 from __future__ import annotations
 from fastapi.datastructures import UploadFile
 
+import asyncio
 import json
 import sys
 import time
-import os
-import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Dict, Generator, List, Optional
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
 
-import whisper
-
-from fastapi import FastAPI, HTTPException, File
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, File, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from ollama import chat  # 用于流式时直接 chat（避免重复检索时也可用）
 
 
 CORRECTION_SYSTEM_PROMPT = """
@@ -52,26 +50,346 @@ def _load_qa_bot():
         raise RuntimeError(f"Failed to import scripts.qa_bot: {e}")
 
 
-# ====== 1) 适配你现有的 QA 函数（返回 answer + sources） ======
-def run_qa(question: str, top_k: int = 6) -> Dict[str, Any]:
+from scripts.config import (
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_REPLAY_CHARS,
+    QA_BATCH_MAX_QUESTIONS, QA_BATCH_CONCURRENCY, COALESCE_REQUESTS, CANCEL_ON_DISCONNECT,
+    QA_MAX_CONCURRENCY, QA_QUEUE_SIZE, QA_QUEUE_TIMEOUT,
+    QA_STREAM_MAX_CONCURRENCY, QA_STREAM_QUEUE_SIZE, QA_STREAM_QUEUE_TIMEOUT,
+    TRANSCRIBE_MAX_CONCURRENCY, TRANSCRIBE_QUEUE_SIZE, TRANSCRIBE_QUEUE_TIMEOUT,
+    SPEECH_ENABLED, WHISPER_MODEL_SIZE, WHISPER_PRELOAD,
+    WHISPER_WORKERS, WHISPER_QUEUE_SIZE, WHISPER_MAX_AUDIO_BYTES, WHISPER_RETRY_SECONDS,
+)
+from scripts.lru_cache import SemanticCache
+from scripts.ollama_pool import new_async_client, pool_stats
+
+# 语音纠错等直接调用 LLM 的场景：Ollama 异步客户端（走生成池，不阻塞事件循环）
+async_ollama = new_async_client()
+from .admission import AdmissionLimiter, Overloaded
+from .coalesce import SingleFlight, StreamBroadcast, StreamCoalescer
+from .metrics import MetricsRegistry
+from .speech import AudioDecodeError, TranscriberBusy, TranscriberUnavailable, WhisperPool
+
+# --- 语义答案缓存：相近问题 + 索引未变化 → 直接返回缓存的 answer + sources ---
+answer_cache = SemanticCache(
+    capacity=ANSWER_CACHE_SIZE,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl=ANSWER_CACHE_TTL,
+)
+
+
+# --- 指标：各阶段耗时直方图（/metrics，Prometheus 文本格式） ---
+metrics = MetricsRegistry()
+REQUESTS_TOTAL = metrics.counter("rag_requests_total", "Requests by endpoint and status")
+REQUEST_SECONDS = metrics.histogram("rag_request_seconds", "End-to-end request latency in seconds")
+STAGE_SECONDS = metrics.histogram(
+    "rag_stage_seconds",
+    "Per-stage latency in seconds (queue, embed, search, lexical, mmr, dedup, context, cache_lookup, "
+    "ttft, llm, whisper_decode, whisper_transcribe, correction)",
+)
+TOKENS_PER_SECOND = metrics.histogram(
+    "rag_llm_tokens_per_second", "LLM generation speed",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300),
+)
+FETCH_ROUNDS = metrics.histogram(
+    "rag_retrieve_fetch_rounds", "Vector search rounds per retrieval (adaptive over-fetch)",
+    buckets=(1, 2, 3, 4, 5, 6, 8),
+)
+FETCH_CANDIDATES = metrics.histogram(
+    "rag_retrieve_candidates", "Vector search candidates fetched per retrieval",
+    buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200),
+)
+CONTEXT_TOKENS = metrics.counter("rag_context_tokens_total", "Estimated prompt context tokens sent to the LLM")
+CONTEXT_TOKENS_SAVED = metrics.counter(
+    "rag_context_tokens_saved_total", "Estimated context tokens removed by token-budgeted packing"
+)
+STREAM_CANCELLED = metrics.counter(
+    "rag_stream_cancelled_total", "Stream generations cancelled because every client disconnected"
+)
+WASTED_TOKENS = metrics.counter(
+    "rag_stream_wasted_tokens_total", "Tokens generated for cancelled streams that no client received in full"
+)
+ADMISSION_REJECTED = metrics.counter(
+    "rag_admission_rejected_total", "Requests rejected with 429 by admission control (queue_full / queue_timeout)"
+)
+
+
+def observe_timings(endpoint: str, timings: Dict[str, float]) -> None:
+    """把一次计算的阶段耗时记录到直方图"""
+    for key, value in timings.items():
+        if key.endswith("_ms"):
+            STAGE_SECONDS.observe(value / 1000, endpoint=endpoint, stage=key[:-3])
+        elif key == "tokens_per_s":
+            TOKENS_PER_SECOND.observe(value, endpoint=endpoint)
+        elif key == "fetch_rounds":
+            FETCH_ROUNDS.observe(value, endpoint=endpoint)
+        elif key == "candidates":
+            FETCH_CANDIDATES.observe(value, endpoint=endpoint)
+        elif key == "context_tokens":
+            CONTEXT_TOKENS.inc(value, endpoint=endpoint)
+        elif key == "context_tokens_saved":
+            CONTEXT_TOKENS_SAVED.inc(value, endpoint=endpoint)
+
+
+def observe_request(endpoint: str, status: int, t0: float) -> None:
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(status))
+    REQUEST_SECONDS.observe(time.time() - t0, endpoint=endpoint)
+
+
+# 仪表在抓取时回调取值
+metrics.gauge(
+    "rag_answer_cache_entries", "Semantic answer cache size",
+    lambda: [({}, answer_cache.stats()["size"])],
+)
+metrics.counter_func(
+    "rag_answer_cache_hits_total", "Semantic answer cache hits",
+    lambda: [({}, answer_cache.hits)],
+)
+metrics.counter_func(
+    "rag_answer_cache_misses_total", "Semantic answer cache misses",
+    lambda: [({}, answer_cache.misses)],
+)
+metrics.gauge(
+    "rag_inflight_requests", "Distinct computations in flight",
+    lambda: [({"endpoint": "qa"}, qa_flights.stats()["inflight"]),
+             ({"endpoint": "qa_stream"}, stream_flights.stats()["inflight"])],
+)
+metrics.gauge(
+    "rag_admission_active", "Requests holding an admission slot",
+    lambda: [({"endpoint": l.name}, l.active) for l in limiters],
+)
+metrics.gauge(
+    "rag_admission_queued", "Requests waiting for an admission slot",
+    lambda: [({"endpoint": l.name}, l.queued) for l in limiters],
+)
+metrics.gauge(
+    "rag_ollama_outstanding", "Requests in flight per Ollama backend",
+    lambda: [({"pool": name, "host": b["host"]}, b["outstanding"])
+             for name, pool in pool_stats().items() for b in pool["backends"]],
+)
+metrics.gauge(
+    "rag_ollama_backend_healthy", "1 if the Ollama backend is in rotation, 0 if ejected",
+    lambda: [({"pool": name, "host": b["host"]}, int(b["healthy"]))
+             for name, pool in pool_stats().items() for b in pool["backends"]],
+)
+metrics.gauge(
+    "rag_transcriber_pending", "Transcriptions running or queued",
+    lambda: [({}, transcriber.stats()["pending"])] if transcriber is not None else [],
+)
+
+
+# --- 请求合并：相同（归一化问题, top_k）的并发请求只计算一次 ---
+qa_flights = SingleFlight()
+stream_flights = StreamCoalescer(cancel_abandoned=CANCEL_ON_DISCONNECT)
+
+
+# --- 准入控制：每个接口限制并发，排队有上限和截止时间，超限快速返回 429 ---
+qa_limiter = AdmissionLimiter("qa", QA_MAX_CONCURRENCY, QA_QUEUE_SIZE, QA_QUEUE_TIMEOUT)
+stream_limiter = AdmissionLimiter(
+    "qa_stream", QA_STREAM_MAX_CONCURRENCY, QA_STREAM_QUEUE_SIZE, QA_STREAM_QUEUE_TIMEOUT
+)
+transcribe_limiter = AdmissionLimiter(
+    "transcribe", TRANSCRIBE_MAX_CONCURRENCY, TRANSCRIBE_QUEUE_SIZE, TRANSCRIBE_QUEUE_TIMEOUT
+)
+limiters = (qa_limiter, stream_limiter, transcribe_limiter)
+
+
+def reject_overloaded(endpoint: str, e: Overloaded, t0: float) -> HTTPException:
+    """准入被拒：记录指标并构造 429 响应"""
+    ADMISSION_REJECTED.inc(endpoint=endpoint, reason=e.reason)
+    observe_request(endpoint, 429, t0)
+    return HTTPException(
+        status_code=429,
+        detail=f"Server is busy ({e.reason}), please retry later",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+class GuardedStreamingResponse(StreamingResponse):
+    """
+    响应结束时一定调用 on_close 的流式响应
+
+    客户端在响应体开始迭代前断开、或发送出错时，生成器不会启动，其中的 finally 也不会执行；
+    这里在任何退出路径上关闭生成器并调用 on_close（on_close 需可重复调用）
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self.on_close()
+
+
+def coalesce_key(question: str, top_k: int):
+    """合并键；关闭 COALESCE_REQUESTS 时每个请求使用唯一的键"""
+    if not COALESCE_REQUESTS:
+        return object()
+    return (_load_qa_bot().normalize_question(question), top_k)
+
+
+_bot_init_lock = asyncio.Lock()
+
+
+async def get_bot():
+    """
+    获取 QABot 单例（首次创建会打开向量库，放到线程池中执行，避免阻塞事件循环）
+
+    冷启动时的并发请求排队等同一次初始化：并发创建 Chroma 客户端会互相破坏
+    """
     qa_bot = _load_qa_bot()
+    if qa_bot._bot_instance is None:
+        async with _bot_init_lock:
+            if qa_bot._bot_instance is None:
+                await run_in_threadpool(qa_bot._get_bot)
+    return qa_bot._get_bot()
+
+
+async def lookup_cached_answer(
+    bot,
+    question: str,
+    top_k: int,
+    timings: Optional[Dict[str, float]] = None,
+    q_vec: Optional[List[float]] = None
+) -> Optional[Dict[str, Any]]:
+    """查语义缓存，命中时返回 {"answer", "sources", "similarity"}（传入 q_vec 时不再生成问题向量）"""
+    if q_vec is None:
+        q_vec = await bot.aembed_question(question, timings)
+    t0 = time.perf_counter()
+    hit = answer_cache.lookup(q_vec, version=await bot.aindex_version(), top_k=top_k)
+    if timings is not None:
+        timings["cache_lookup_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    if hit is None:
+        return None
+    value, similarity = hit
+    return {**value, "similarity": similarity}
+
+
+async def store_cached_answer(
+    bot,
+    question: str,
+    top_k: int,
+    answer: str,
+    sources: List[Dict[str, Any]],
+    q_vec: Optional[List[float]] = None
+) -> None:
+    """把完整答案写入语义缓存（传入 q_vec 时不再生成问题向量）"""
+    if not answer:
+        return
+    if q_vec is None:
+        q_vec = await bot.aembed_question(question)
+    answer_cache.put(
+        q_vec,
+        {"answer": answer, "sources": sources},
+        version=await bot.aindex_version(),
+        top_k=top_k,
+    )
+
+
+# ====== 1) 问答（异步：embedding / 生成走 Ollama 异步客户端，Chroma 查询走专用线程池） ======
+async def _compute_qa(question: str, top_k: int) -> Dict[str, Any]:
+    bot = await get_bot()
+    timings: Dict[str, float] = {}
+
+    cached = await lookup_cached_answer(bot, question, top_k, timings)
+    if cached is not None:
+        observe_timings("qa", timings)
+        return {"answer": cached["answer"], "sources": cached["sources"], "cached": True, "timings": timings}
 
-    # ✅ 优先使用结构化接口
-    if hasattr(qa_bot, "answer_question_with_sources"):
-        return qa_bot.answer_question_with_sources(question, top_k=top_k)
+    result = await bot.aanswer_with_sources(question, top_k=top_k, timings=timings)
+    await store_cached_answer(bot, question, top_k, result.get("answer", ""), result.get("sources", []))
+    observe_timings("qa", timings)
+    return {**result, "timings": timings}
 
-    # fallback：退回旧接口（不建议长期用）
-    if hasattr(qa_bot, "answer_question"):
-        ans = qa_bot.answer_question(question, top_k=top_k)
-        return {"answer": ans, "sources": []}
 
-    raise RuntimeError("qa_bot.py 里没找到可用的问答函数。")
+async def run_qa(question: str, top_k: int = 6) -> Dict[str, Any]:
+    result, joined = await qa_flights.do(
+        coalesce_key(question, top_k), lambda: _compute_qa(question, top_k)
+    )
+    return {**result, "coalesced": joined}
+
+
+async def produce_stream(bot, question: str, top_k: int, broadcast: StreamBroadcast) -> None:
+    """
+    流式问答的计算部分：把 sources / chunk / done / error 事件发布到广播，
+    同一问题的所有流式请求共享
+
+    所有订阅者都断开时任务被取消：CancelledError 关闭 Ollama 流，模型停止生成
+    """
+    timings: Dict[str, float] = {}
+    parts: List[str] = []
+    try:
+        # 0) 语义缓存命中：直接回放缓存的 sources + answer
+        cached = await lookup_cached_answer(bot, question, top_k, timings)
+        if cached is not None:
+            broadcast.publish("sources", {"sources": cached["sources"]})
+            answer = cached["answer"]
+            for i in range(0, len(answer), ANSWER_CACHE_REPLAY_CHARS):
+                broadcast.publish("chunk", {"content": answer[i:i + ANSWER_CACHE_REPLAY_CHARS]})
+            observe_timings("qa_stream", timings)
+            broadcast.publish("done", {"cached": True, "timings": timings})
+            return
+
+        # 1) 先检索，拿 sources + context（不让模型编引用）
+        context, sources = await bot.aretrieve(question, top_k=top_k, timings=timings)
+        broadcast.publish("sources", {"sources": sources})
+
+        # 2) 再开始流式生成（异步）
+        async for content in bot.astream_chat(bot.build_messages(question, context), timings=timings):
+            parts.append(content)
+            broadcast.publish("chunk", {"content": content})
+
+        # 完整生成结束后才写入缓存
+        await store_cached_answer(bot, question, top_k, "".join(parts), sources)
+        observe_timings("qa_stream", timings)
+        broadcast.publish("done", {"timings": timings})
+
+    except asyncio.CancelledError:
+        # Ollama 每个流式 chunk 约为一个 token
+        STREAM_CANCELLED.inc()
+        WASTED_TOKENS.inc(len(parts))
+        print(f"[Stream] all clients disconnected, generation cancelled after {len(parts)} tokens")
+        raise
+    except Exception as e:
+        broadcast.publish("error", {"message": str(e)})
+
+
+async def watch_disconnect(request: Request, broadcast: StreamBroadcast, stop: asyncio.Event) -> None:
+    """
+    等待客户端断开，设置 stop 并唤醒订阅循环
+
+    首个事件写出之前（检索、等待首 token）写入失败无从发生，只能靠 http.disconnect 消息发现断开。
+
+    Args:
+        request: 当前请求（请求体已读完，之后的 receive 只会收到 http.disconnect）
+        broadcast: 订阅中的广播
+        stop: 断开时设置
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            stop.set()
+            broadcast.wake()
+            return
 
 
 # ====== 2) Schema ======
 class QARequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=2000)
     top_k: int = Field(6, ge=1, le=20)
+    include_timings: bool = False  # 返回各阶段耗时（毫秒）
+
+
+class QABatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=QA_BATCH_MAX_QUESTIONS)
+    top_k: int = Field(6, ge=1, le=20)
+    concurrency: int = Field(QA_BATCH_CONCURRENCY, ge=1, le=32)
+    include_timings: bool = False
 
 
 class SourceItem(BaseModel):
@@ -80,6 +398,7 @@ class SourceItem(BaseModel):
     page: Optional[int] = None
     chunk: Optional[int] = None
     distance: Optional[float] = None
+    score: Optional[float] = None
     excerpt: Optional[str] = None
 
 
@@ -88,31 +407,89 @@ class QAResponse(BaseModel):
     answer: str
     sources: List[SourceItem] = []
     latency_ms: int
+    cached: bool = False
+    coalesced: bool = False
+    timings: Optional[Dict[str, float]] = None
 
 
 # ====== 3) App ======
-app = FastAPI(title="Gyn KB RAG API", version="0.2.0")
+# --- Whisper 转写工作池（模型延迟加载，不拖慢服务启动） ---
+# 即使要在 LLM 纠错，给 Whisper 一个好的提示词也能减少 LLM 的工作量
+WHISPER_PROMPT = "妇科问诊。关键词：HPV疫苗、9价、4价、二价、哪几种、预防、感染、子宫肌瘤、卵巢囊肿。"
+
+# tiny 模型不是很好用，默认使用 small；在 Mac 上跑 fp16=False
+transcriber: Optional[WhisperPool] = None
+if SPEECH_ENABLED:
+    transcriber = WhisperPool(
+        model_name=WHISPER_MODEL_SIZE,
+        workers=WHISPER_WORKERS,
+        queue_size=WHISPER_QUEUE_SIZE,
+        language="zh",
+        initial_prompt=WHISPER_PROMPT,
+        retry_seconds=WHISPER_RETRY_SECONDS,
+    )
 
 
-# --- 初始化 Whisper ---
-# 使用 tiny 模型，加载到CPU中
-# tiny 模型不是很好用，切换成base试试
-print("正在加载 Whisper small 模型...")
-try:
-    audio_model = whisper.load_model("small")
-    print("Whisper small 模型加载成功")
-except Exception as e:
-    print(f"Whisper small 模型加载失败: {e}")
-    audio_model = None
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动完成后在后台预热 Whisper，/health 和 /v1/qa 无需等待
+    if transcriber is not None and WHISPER_PRELOAD:
+        transcriber.start_loading()
+    yield
+    if transcriber is not None:
+        transcriber.shutdown()
+
+
+app = FastAPI(title="Gyn KB RAG API", version="0.2.0", lifespan=lifespan)
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "answer_cache": answer_cache.stats(),
+        "coalescing": {"qa": qa_flights.stats(), "stream": stream_flights.stats()},
+        "admission": {l.name: l.stats() for l in limiters},
+        "ollama": pool_stats(),
+        "transcriber": transcriber.stats() if transcriber is not None else None,
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus 抓取接口（文本格式 0.0.4）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+def ready():
+    """就绪检查：报告各模型的加载状态（问答随时可用，QABot 在第一个请求时初始化）"""
+    qa_bot = sys.modules.get("scripts.qa_bot")
+    bot = getattr(qa_bot, "_bot_instance", None)
+    return {
+        "ready": True,
+        "models": {
+            "qa_bot": {
+                "status": "ready" if bot is not None else "not_loaded",
+                "embed_model": getattr(bot, "embed_model", None),
+                "llm_model": getattr(bot, "llm_model", None),
+            },
+            "whisper": {
+                "status": "disabled",
+                "model": None,
+            } if transcriber is None else {
+                "status": transcriber.status,
+                "model": transcriber.model_name,
+                "loaded_models": transcriber.loaded_models,
+                "load_seconds": transcriber.load_seconds,
+                "error": transcriber.error,
+            },
+        },
+    }
 
 
 @app.post("/v1/qa", response_model=QAResponse)
-def qa(req: QARequest):
+async def qa(req: QARequest):
     t0 = time.time()
     q = (req.question or "").strip()
     if not q:
@@ -121,35 +498,59 @@ def qa(req: QARequest):
     request_id = str(int(t0 * 1000))
 
     try:
-        result = run_qa(q, top_k=req.top_k)
+        async with qa_limiter.slot() as queue_wait:
+            STAGE_SECONDS.observe(queue_wait, endpoint="qa", stage="queue")
+            result = await run_qa(q, top_k=req.top_k)
         answer = result.get("answer", "")
         sources = result.get("sources", [])
+    except Overloaded as e:
+        raise reject_overloaded("qa", e, t0)
     except Exception as e:
+        observe_request("qa", 500, t0)
         raise HTTPException(status_code=500, detail=str(e))
 
     latency_ms = int((time.time() - t0) * 1000)
+    observe_request("qa", 200, t0)
     return QAResponse(
         request_id=request_id,
         answer=answer,
         sources=sources,
         latency_ms=latency_ms,
+        cached=bool(result.get("cached")),
+        coalesced=bool(result.get("coalesced")),
+        timings={**(result.get("timings") or {}), "queue_ms": round(queue_wait * 1000, 2)}
+        if req.include_timings else None,
     )
 
 
 @app.post("/v1/qa/stream")
-def qa_stream(req: QARequest):
+async def qa_stream(req: QARequest, request: Request):
     """
     SSE 流式接口（JSON events）
     - 第一条：sources
     - 后续：chunk
     - 最后：done
+
+    客户端断开后停止订阅；同一问题的所有客户端都断开时取消生成
     """
+    t_admit = time.time()
     q = (req.question or "").strip()
     if not q:
         raise HTTPException(status_code=400, detail="question is empty")
 
-    qa_bot = _load_qa_bot()
-    bot = qa_bot._get_bot()  # 复用你 qa_bot.py 的单例（避免重复初始化）
+    # 名额在流结束（或客户端断开）时归还，排队只发生在开始返回响应之前
+    try:
+        queue_wait = await stream_limiter.acquire()
+    except Overloaded as e:
+        raise reject_overloaded("qa_stream", e, t_admit)
+    STAGE_SECONDS.observe(queue_wait, endpoint="qa_stream", stage="queue")
+    t_slot = time.perf_counter()
+
+    try:
+        bot = await get_bot()  # 复用 qa_bot.py 的单例（避免重复初始化）
+    except BaseException:
+        stream_limiter.release()
+        raise
 
     request_id = str(int(time.time() * 1000))
 
@@ -159,56 +560,54 @@ def qa_stream(req: QARequest):
             return f"event: {event}\ndata: {payload}\n\n"
         return f"data: {payload}\n\n"
 
-    def generate() -> Generator[str, None, None]:
-        t0 = time.time()
+    t0 = time.time()
+    status = 499  # 没有收到 done / error 就结束：客户端已断开
+    released = False
+
+    def release_slot() -> None:
+        """归还名额并记录请求（生成器的 finally 与响应结束时都会调用，只生效一次）"""
+        nonlocal released
+        if released:
+            return
+        released = True
+        stream_limiter.release(time.perf_counter() - t_slot)
+        observe_request("qa_stream", status, t0)
+
+    async def generate() -> AsyncGenerator[str, None]:
+        nonlocal status
+        # 在响应体开始迭代时才加入合并：响应没能开始时不会启动（或订阅）生成任务
+        # 相同问题正在生成时直接订阅：先收到已生成的前缀，再接收实时 token
+        broadcast, joined = stream_flights.join(
+            coalesce_key(q, req.top_k), lambda b: produce_stream(bot, q, req.top_k, b)
+        )
+        stop = asyncio.Event()
+        watcher = asyncio.ensure_future(watch_disconnect(request, broadcast, stop))
         try:
-            # 1) 先检索，拿 sources + context（不让模型编引用）
-            context, sources = bot.retrieve(q, top_k=req.top_k)
-
-            # 先把 sources 发给前端
-            yield sse(
-                {"type": "sources", "request_id": request_id, "sources": sources},
-                event="sources",
-            )
-
-            # 2) 再开始流式生成
-            user_prompt = (
-                f"问题：{q}\n\n"
-                f"资料：\n{context}\n\n"
-                "请用中文回答，并尽量引用资料中的表述（但不要大段照抄）。"
-            )
-
-            stream_resp = chat(
-                model=bot.llm_model,
-                messages=[
-                    {"role": "system", "content": bot.system_prompt_no_refs},
-                    {"role": "user", "content": user_prompt},
-                ],
-                stream=True,
-            )
-
-            for chunk in stream_resp:
-                content = chunk.get("message", {}).get("content")
-                if content:
-                    yield sse(
-                        {"type": "chunk", "content": content},
-                        event="chunk",
-                    )
-
-            latency_ms = int((time.time() - t0) * 1000)
-            yield sse(
-                {"type": "done", "request_id": request_id, "latency_ms": latency_ms},
-                event="done",
-            )
-
-        except Exception as e:
-            yield sse(
-                {"type": "error", "request_id": request_id, "message": str(e)},
-                event="error",
-            )
-
-    return StreamingResponse(
+            async for event, data in broadcast.subscribe(stop):
+                if event == "chunk":
+                    payload = {"type": "chunk", **data}
+                elif event == "done":
+                    status = 200
+                    latency_ms = int((time.time() - t0) * 1000)
+                    payload = {"type": "done", "request_id": request_id, "latency_ms": latency_ms, **data}
+                    if req.include_timings:
+                        payload["timings"] = {**(data.get("timings") or {}), "queue_ms": round(queue_wait * 1000, 2)}
+                    else:
+                        payload.pop("timings", None)
+                    if joined:
+                        payload["coalesced"] = True
+                else:
+                    if event == "error":
+                        status = 500
+                    payload = {"type": event, "request_id": request_id, **data}
+                yield sse(payload, event=event)
+        finally:
+            watcher.cancel()
+            release_slot()
+
+    return GuardedStreamingResponse(
         generate(),
+        on_close=release_slot,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -218,68 +617,182 @@ def qa_stream(req: QARequest):
     )
 
 
+@app.post("/v1/qa/batch")
+async def qa_batch(req: QABatchRequest):
+    """
+    批量问答（NDJSON 流，每行一个 JSON，按完成顺序返回）
+    - 所有问题一次 embedding 调用、一次多向量检索，LLM 生成按 concurrency 并发
+    - 每个问题一行：{"type": "result", "index", "question", "answer", "sources", "cached", "latency_ms"}
+      （出错时为 {"type": "error", "index", "question", "message"}）
+    - 最后一行：{"type": "done", "request_id", "count", "errors", "latency_ms"}
+    """
+    questions = [(q or "").strip() for q in req.questions]
+    empty = [i for i, q in enumerate(questions) if not q]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"questions {empty} are empty")
+    if any(len(q) > 2000 for q in questions):
+        raise HTTPException(status_code=400, detail="question is too long")
+
+    bot = await get_bot()
+    request_id = str(int(time.time() * 1000))
+
+    def line(data: Dict[str, Any]) -> str:
+        return json.dumps(data, ensure_ascii=False) + "\n"
+
+    async def generate() -> AsyncGenerator[str, None]:
+        t0 = time.time()
+        errors = 0
+        try:
+            # 一次调用生成全部问题向量，之后的缓存查询 / 检索 / 缓存写入都复用这批向量
+            embed_timings: Dict[str, float] = {}
+            q_vecs = await bot.aembed_questions(questions, embed_timings)
+            observe_timings("qa_batch", embed_timings)
+
+            # 语义缓存命中的问题直接返回
+            todo: List[int] = []
+            for i, q in enumerate(questions):
+                cached = await lookup_cached_answer(bot, q, req.top_k, q_vec=q_vecs[i])
+                if cached is None:
+                    todo.append(i)
+                    continue
+                yield line({
+                    "type": "result", "index": i, "question": q,
+                    "answer": cached["answer"], "sources": cached["sources"],
+                    "cached": True, "latency_ms": int((time.time() - t0) * 1000),
+                })
+
+            # 共享的 embed / search 阶段每批只记录一次，LLM 阶段每个问题记录一次
+            shared_observed = False
+
+            if todo:
+                async for r in bot.aanswer_batch(
+                    [questions[i] for i in todo], top_k=req.top_k, concurrency=req.concurrency,
+                    q_vecs=[q_vecs[i] for i in todo],
+                ):
+                    i = todo[r["index"]]
+                    if "error" in r:
+                        errors += 1
+                        yield line({"type": "error", "index": i, "question": r["question"], "message": r["error"]})
+                        continue
+                    await store_cached_answer(
+                        bot, r["question"], req.top_k, r["answer"], r["sources"], q_vec=q_vecs[i]
+                    )
+                    timings = {**embed_timings, **(r.get("timings") or {})}
+                    observe_timings("qa_batch", {
+                        k: v for k, v in timings.items()
+                        if k != "embed_ms" and (not shared_observed or k in ("ttft_ms", "llm_ms", "tokens_per_s"))
+                    })
+                    shared_observed = True
+                    result = {
+                        "type": "result", "index": i, "question": r["question"],
+                        "answer": r["answer"], "sources": r["sources"],
+                        "cached": False, "latency_ms": int((time.time() - t0) * 1000),
+                    }
+                    if req.include_timings:
+                        result["timings"] = timings
+                    yield line(result)
+        except Exception as e:
+            errors += 1
+            yield line({"type": "error", "request_id": request_id, "message": str(e)})
+
+        yield line({
+            "type": "done", "request_id": request_id, "count": len(questions),
+            "errors": errors, "latency_ms": int((time.time() - t0) * 1000),
+        })
+        observe_request("qa_batch", 500 if errors else 200, t0)
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ====== 4) 新增：语音转文字接口 ======
 @app.post("/v1/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
-    if audio_model is None:
-        raise HTTPException(status_code=500, detail="Whisper model not initialized")
+async def transcribe_audio(file: UploadFile = File(...), include_timings: bool = False):
+    t0 = time.time()
+    if transcriber is None:
+        raise HTTPException(status_code=503, detail="Speech input is disabled")
 
     if not file.filename.endswith(('.wav', '.mp3', '.m4a', '.webm')):
         raise HTTPException(status_code=400, detail="Invalid file format")
 
-    tmp_path = ""
+    # 1. 读入内存（不落盘），由工作池中的 ffmpeg 管道解码
+    content = await file.read(WHISPER_MAX_AUDIO_BYTES + 1)
+    if len(content) > WHISPER_MAX_AUDIO_BYTES:
+        raise HTTPException(status_code=413, detail="Audio file too large")
+
+    # 转写 + LLM 纠错整体受并发限制（Whisper 工作池自身的队列只约束转写部分）
     try:
-        # 1. 保存临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-            content = await file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
-
-        # 2. Whisper 转录 (第一层保障)
-        # 即使要在 LLM 纠错，给 Whisper 一个好的提示词也能减少 LLM 的工作量
-        whisper_prompt = "妇科问诊。关键词：HPV疫苗、9价、4价、二价、哪几种、预防、感染、子宫肌瘤、卵巢囊肿。"
-        
-        # 在 Mac 上跑，建议用 base 或 small，fp16=False
-        result = audio_model.transcribe(
-            tmp_path, 
-            language="zh", 
-            initial_prompt=whisper_prompt,
-            fp16=False 
-        )
-        
-        raw_text = result["text"].strip()
-        print(f"1. Whisper 原始结果: {raw_text}")
-
-        # 3. LLM 语义纠错 (第二层保障)
-        # 如果 0.6b 效果不好，这里是瓶颈，换 3090 后可以直接上 7B/14B
-        corrected_text = raw_text # 默认回退
-        
-        try:
-            response = chat(
-                model="qwen3:0.6b", # ❗确保这里是你 ollama list 里有的模型
-                messages=[
-                    {"role": "system", "content": CORRECTION_SYSTEM_PROMPT},
-                    {"role": "user", "content": raw_text},
-                ],
-                options={"temperature": 0.1} # 低温度，让它更严谨，不要发散
-            )
-            
-            if response.get('message', {}).get('content'):
-                corrected_text = response['message']['content'].strip()
-                print(f"2. LLM 修正后结果: {corrected_text}")
-            else:
-                print("LLM 返回为空，使用原始文本")
-                
-        except Exception as llm_e:
-            print(f"LLM 纠错调用失败: {llm_e}")
-
-        # 4. 清理
-        os.unlink(tmp_path)
-
-        return {"text": corrected_text}
+        async with transcribe_limiter.slot() as queue_wait:
+            return await run_transcription(content, include_timings, t0, queue_wait)
+    except Overloaded as e:
+        raise reject_overloaded("transcribe", e, t0)
+
+
+async def run_transcription(content: bytes, include_timings: bool, t0: float, queue_wait: float) -> Dict[str, Any]:
+    """
+    转写一段音频并用 LLM 纠错
 
+    Args:
+        content: 音频文件内容
+        include_timings: 返回各阶段耗时
+        t0: 请求开始时间（time.time()）
+        queue_wait: 准入排队的秒数
+    """
+    # 2. Whisper 转录 (第一层保障)，在工作池中执行，不阻塞事件循环
+    timings: Dict[str, float] = {"queue_ms": round(queue_wait * 1000, 2)}
+    try:
+        raw_text = await transcriber.transcribe(content, timings)
+    except TranscriberBusy as e:
+        observe_request("transcribe", 429, t0)
+        raise HTTPException(
+            status_code=429,
+            detail="Transcription queue is full, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except AudioDecodeError as e:
+        observe_request("transcribe", 400, t0)
+        raise HTTPException(status_code=400, detail=str(e))
+    except TranscriberUnavailable as e:
+        observe_request("transcribe", 503, t0)
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
     except Exception as e:
         print(f"Transcribe error: {e}")
-        if tmp_path and os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        observe_request("transcribe", 500, t0)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    print(f"1. Whisper 原始结果: {raw_text}")
+
+    # 3. LLM 语义纠错 (第二层保障)
+    # 如果 0.6b 效果不好，这里是瓶颈，换 3090 后可以直接上 7B/14B
+    corrected_text = raw_text # 默认回退
+
+    t_llm = time.perf_counter()
+    try:
+        response = await async_ollama.chat(
+            model="qwen3:0.6b", # ❗确保这里是你 ollama list 里有的模型
+            messages=[
+                {"role": "system", "content": CORRECTION_SYSTEM_PROMPT},
+                {"role": "user", "content": raw_text},
+            ],
+            options={"temperature": 0.1} # 低温度，让它更严谨，不要发散
+        )
+
+        if response.get('message', {}).get('content'):
+            corrected_text = response['message']['content'].strip()
+            print(f"2. LLM 修正后结果: {corrected_text}")
+        else:
+            print("LLM 返回为空，使用原始文本")
+
+    except Exception as llm_e:
+        print(f"LLM 纠错调用失败: {llm_e}")
+    timings["correction_ms"] = round((time.perf_counter() - t_llm) * 1000, 2)
+
+    observe_timings("transcribe", timings)
+    observe_request("transcribe", 200, t0)
+    if include_timings:
+        return {"text": corrected_text, "timings": timings}
+    return {"text": corrected_text}
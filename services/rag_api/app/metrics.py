@@ -0,0 +1,148 @@
+# services/rag_api/app/metrics.py
+"""Prometheus 指标 - 手写的 Counter / Histogram 与文本格式输出（不依赖 prometheus_client）"""
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 秒级延迟的默认分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _format_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(v)}")
+        return lines
+
+
+class Histogram:
+    """累积分桶直方图（每组标签一组分桶 + sum + count）"""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += c
+                    le = ("le", _format_value(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total[0])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """取值时回调的仪表（如队列长度、缓存大小）"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        """
+        Args:
+            fn: 返回 [(标签, 值), ...]
+        """
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, v in self.fn():
+            lines.append(f"{self.name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(v)}")
+        return lines
+
+
+class CounterFunc(Gauge):
+    """取值时回调的计数器：值由其他对象单调累加（如缓存命中次数），可直接用 rate()"""
+
+    type = "counter"
+
+
+class MetricsRegistry:
+    """指标注册表，render() 输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        m = Counter(name, help)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        m = Histogram(name, help, buckets)
+        self._metrics.append(m)
+        return m
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> Gauge:
+        m = Gauge(name, help, fn)
+        self._metrics.append(m)
+        return m
+
+    def counter_func(
+        self, name: str, help: str, fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+    ) -> CounterFunc:
+        m = CounterFunc(name, help, fn)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            try:
+                lines.extend(m.render())
+            except Exception as e:
+                lines.append(f"# {m.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,304 @@
+# services/rag_api/app/speech.py
+"""语音转写 - 内存解码音频 + 有界队列的 Whisper 工作池（不阻塞事件循环）"""
+from __future__ import annotations
+
+import asyncio
+import math
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Whisper 要求 16kHz 单声道
+SAMPLE_RATE = 16000
+
+
+class AudioDecodeError(ValueError):
+    """音频无法解码（格式错误或文件损坏）"""
+
+
+class TranscriberBusy(Exception):
+    """工作池和等待队列都已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("transcription queue is full")
+        self.retry_after = retry_after
+
+
+class TranscriberUnavailable(Exception):
+    """Whisper 模型不可用（加载中 / 加载失败 / 缺少 ffmpeg）"""
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_mp4_container(data: bytes) -> bool:
+    """m4a / mp4 / mov：第 4-8 字节为 ftyp box"""
+    return data[4:8] == b"ftyp"
+
+
+def decode_audio(data: bytes, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    通过 ffmpeg 管道在内存中解码音频（wav / mp3 / webm 不落盘）
+
+    m4a / mp4 的 moov box 可能位于文件末尾（非 faststart），ffmpeg 从 stdin 读取时无法回跳，
+    这类容器写入临时文件再解码
+
+    Args:
+        data: 上传的音频文件内容
+        sr: 目标采样率
+
+    Returns:
+        float32 单声道波形，取值范围 [-1, 1]
+    """
+    if is_mp4_container(data):
+        with tempfile.NamedTemporaryFile(suffix=".m4a") as f:
+            f.write(data)
+            f.flush()
+            return _run_ffmpeg(f.name, None, sr)
+    return _run_ffmpeg("pipe:0", data, sr)
+
+
+def _run_ffmpeg(source: str, data: Optional[bytes], sr: int) -> np.ndarray:
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", source,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sr),
+        "pipe:1",
+    ]
+    try:
+        if data is None:
+            proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, check=True)
+        else:
+            proc = subprocess.run(cmd, input=data, capture_output=True, check=True)
+    except FileNotFoundError:
+        raise TranscriberUnavailable("ffmpeg not found")
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(f"Failed to decode audio: {e.stderr.decode(errors='ignore').strip()[-200:]}")
+    return np.frombuffer(proc.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+class WhisperPool:
+    """
+    Whisper 转写工作池
+
+    - workers 个工作线程，每个线程独占一个模型实例
+      （Whisper 解码时会在模型上挂 kv-cache hook，同一实例不能并发使用）
+    - 进行中 + 排队的任务数超过 workers + queue_size 时立即拒绝（TranscriberBusy）
+    - 推理在线程中执行（PyTorch 计算时释放 GIL），事件循环不受影响
+    - 模型延迟加载：可调用 start_loading() 在后台预热，否则第一个请求触发加载
+    - 加载失败后 retry_seconds 内的请求直接返回不可用，之后的请求重新尝试加载
+    """
+
+    def __init__(
+        self,
+        model_name: str = "small",
+        workers: int = 1,
+        queue_size: int = 4,
+        language: str = "zh",
+        initial_prompt: Optional[str] = None,
+        retry_seconds: float = 30.0,
+    ):
+        """
+        Args:
+            model_name: Whisper 模型名（tiny / base / small / ...）
+            workers: 并发转写数（每个占一份模型内存）
+            queue_size: 等待队列长度
+            language: 识别语言
+            initial_prompt: 提示词（领域关键词）
+            retry_seconds: 模型加载失败后，间隔多久允许重新加载
+        """
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.language = language
+        self.initial_prompt = initial_prompt
+        self.retry_seconds = retry_seconds
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="whisper")
+        self._free_models: List[Any] = []
+        self._n_models = 0
+        self._model_lock = threading.Lock()
+        self.status = "not_loaded"  # not_loaded / loading / ready / failed
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._failed_at = 0.0
+        self._warming = False
+
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._avg_seconds = 5.0  # 单次转写耗时的滑动平均（估算 Retry-After）
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    # ---------- 模型管理 ----------
+    def load(self) -> None:
+        """同步加载第一个模型实例"""
+        model = self._new_model()
+        # 放入空闲列表与计数在同一把锁内，请求不会看到“已加载但没有空闲实例”而重复加载
+        with self._model_lock:
+            self._free_models.append(model)
+            self._n_models += 1
+
+    def start_loading(self) -> threading.Thread:
+        """在后台线程中预热模型，不阻塞服务启动"""
+        self._warming = True
+
+        def run():
+            try:
+                self.load()
+            except Exception:
+                pass  # 状态与错误已记录在 status / error 中
+            finally:
+                self._warming = False
+
+        thread = threading.Thread(target=run, name="whisper-load", daemon=True)
+        thread.start()
+        return thread
+
+    def _new_model(self):
+        """加载一个模型实例（由调用方计入 _n_models）"""
+        first = self.status != "ready"
+        if first:
+            self.status = "loading"
+        print(f"正在加载 Whisper {self.model_name} 模型...")
+        t0 = time.time()
+        try:
+            import whisper  # 延迟导入：不使用语音时不加载 torch
+
+            model = whisper.load_model(self.model_name)
+        except Exception as e:
+            print(f"Whisper {self.model_name} 模型加载失败: {e}")
+            if first:
+                self.status, self.error = "failed", str(e)
+                self._failed_at = time.time()
+            raise
+        if first:
+            self.load_seconds = round(time.time() - t0, 2)
+            self.status, self.error = "ready", None
+        print(f"Whisper {self.model_name} 模型加载成功")
+        return model
+
+    def _check_failed(self) -> None:
+        """加载失败后的退避期内直接拒绝，退避期过后允许重新加载"""
+        if self.status != "failed":
+            return
+        wait = self._failed_at + self.retry_seconds - time.time()
+        if wait > 0:
+            raise TranscriberUnavailable(
+                f"Whisper model failed to load: {self.error}", retry_after=math.ceil(wait)
+            )
+
+    def _acquire_model(self):
+        with self._model_lock:
+            if self._free_models:
+                return self._free_models.pop()
+        # 工作线程数 = workers，所以最多加载 workers 个实例
+        self._check_failed()
+        try:
+            model = self._new_model()
+        except Exception as e:
+            raise TranscriberUnavailable(
+                f"Whisper model failed to load: {e}", retry_after=math.ceil(self.retry_seconds)
+            ) from e
+        with self._model_lock:
+            self._n_models += 1
+        return model
+
+    def _release_model(self, model) -> None:
+        with self._model_lock:
+            self._free_models.append(model)
+
+    @property
+    def loaded_models(self) -> int:
+        return self._n_models
+
+    # ---------- 转写 ----------
+    def _run(self, data: bytes, timings: Optional[Dict[str, float]] = None) -> str:
+        """在工作线程中执行：解码 + 推理"""
+        t0 = time.time()
+        audio = decode_audio(data)
+        t1 = time.time()
+        model = self._acquire_model()
+        try:
+            result = model.transcribe(
+                audio,
+                language=self.language,
+                initial_prompt=self.initial_prompt,
+                fp16=False,
+            )
+        finally:
+            self._release_model(model)
+        t2 = time.time()
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (t2 - t0)
+        if timings is not None:
+            timings["whisper_decode_ms"] = round((t1 - t0) * 1000, 2)
+            timings["whisper_transcribe_ms"] = round((t2 - t1) * 1000, 2)
+            timings["audio_seconds"] = round(len(audio) / SAMPLE_RATE, 2)
+        return result["text"].strip()
+
+    def retry_after(self) -> int:
+        """估算排队清空所需的秒数"""
+        return max(1, math.ceil(self._avg_seconds * (self._pending / self.workers)))
+
+    async def transcribe(self, data: bytes, timings: Optional[Dict[str, float]] = None) -> str:
+        """
+        提交转写任务并等待结果
+
+        Args:
+            data: 音频文件内容
+            timings: 可选，记录 whisper_decode_ms（ffmpeg 解码）/ whisper_transcribe_ms（推理）
+
+        Raises:
+            TranscriberBusy: 工作池和等待队列都已满
+            TranscriberUnavailable: 模型正在后台加载，或加载失败（退避期内 / 本次重新加载仍失败）
+            AudioDecodeError: 音频无法解码
+        """
+        if self._warming and not self._n_models:
+            raise TranscriberUnavailable("Whisper model is loading", retry_after=5)
+        self._check_failed()
+
+        with self._pending_lock:
+            if self._pending >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise TranscriberBusy(self.retry_after())
+            self._pending += 1
+
+        # 名额在任务真正结束时释放（客户端断开时线程中的任务仍会跑完）
+        future = self._executor.submit(self._run, data, timings)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future) -> None:
+        with self._pending_lock:
+            self._pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """工作池状态"""
+        return {
+            "model": self.model_name,
+            "status": self.status,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "loaded_models": self._n_models,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "avg_seconds": round(self._avg_seconds, 2),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)